@@ -0,0 +1,317 @@
+# anomaly_commitments.py
+# Merkle-batched anomaly commitments: each batch of anomalies is appended to a local JSON-lines file and
+# only the Merkle root of their canonical encodings is committed on-chain (AnomalyCommitments contract).
+# The tree layout must match smart_contracts/contracts/anomaly_commitments.sol.
+import bisect
+import fcntl
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from anomaly_encoding import (encode_sensor_id, anomaly_type_code, scale_to_int32, VALUE_SCALE, SCORE_SCALE)
+
+# --- CONFIGURATION ---
+COMMITMENT_LOG_PATH = 'anomaly_commitments.jsonl'
+COMMIT_WINDOW_SECONDS = 60.0  # Anomalies are collected this long before their batch is committed
+COMMIT_MAX_BATCH = 10000  # A batch is committed early once it holds this many anomalies
+PROOF_CACHE_BATCHES = 8  # Trees of recently proven batches kept in memory
+# ABI types of a record's canonical encoding (the bytes hashed into a leaf)
+CANONICAL_RECORD_TYPES = ['uint64', 'uint40', 'bytes32', 'uint8', 'int32', 'int32', 'string']
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+logger = logging.getLogger(__name__)
+
+
+def _keccak(data):
+    from eth_utils import keccak  # Comes with web3; imported on first use like the rest of the chain code
+    return keccak(data)
+
+
+# --- Merkle tree ---
+def canonical_encoding(record):
+    """ABI encoding of a committed record: (sequence, timestamp, sensorId, anomalyType, dataValue, score,
+    explanation), with CompactAnomalyLogger's bytes32 sensor ID, type code and scaled integers."""
+    from eth_abi import encode
+    return encode(CANONICAL_RECORD_TYPES, [
+        record["sequence"], record["timestamp"], encode_sensor_id(record["sensor_id"]),
+        anomaly_type_code(record["anomaly_type"]), scale_to_int32(record["data_value"], VALUE_SCALE),
+        scale_to_int32(record.get("anomaly_score") or 0.0, SCORE_SCALE), record["explanation"]
+    ])
+
+
+def leaf_hash(encoding):
+    return _keccak(LEAF_PREFIX + encoding)
+
+
+def node_hash(a, b):
+    """Parent of two nodes. Children are sorted, so proofs carry no left/right flags."""
+    return _keccak(NODE_PREFIX + min(a, b) + max(a, b))
+
+
+def merkle_levels(leaves):
+    """Every level of the tree over `leaves`, leaves first and the root last. An odd node out is promoted as is."""
+    if not leaves:
+        raise ValueError("A Merkle tree needs at least one leaf")
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def merkle_root(leaves):
+    return merkle_levels(leaves)[-1][0]
+
+
+def merkle_proof(levels, index):
+    """Sibling hashes from leaf `index` up to the root; a level where the node has no sibling adds nothing."""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling])
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf, proof, root):
+    """Local equivalent of AnomalyCommitments.processProof(leaf, proof) == root."""
+    node = leaf
+    for sibling in proof:
+        node = node_hash(node, sibling)
+    return node == root
+
+
+def _hex(value):
+    return '0x' + value.hex()
+
+
+class CommitmentLog:
+    """Append-only JSON-lines file holding every committed record, grouped into batches.
+
+    A batch is written as one `{"sequence": ..., ...}` line per record followed by one
+    `{"batch_root": ..., "first_sequence": ..., "count": ..., "tx_hash": ...}` line, in a single write under
+    an exclusive lock on the file, so several processes (e.g. gunicorn workers) can append to the same log.
+    The lines are only written once the commitBatch transaction has been sent (see append_batch), and a
+    batch whose transaction reverts is revoked by a later `{"revoked_root": ...}` line, so the log never
+    proves a batch whose root was not anchored. Sequence numbers are unique and increasing across the
+    whole file; they number the anomalies the way anomalyIndex does for the per-anomaly contracts.
+
+    The file is the only full copy of the records, so it is replayed on startup and re-read whenever a
+    lookup misses, which also picks up batches appended by other processes. A torn final line (a crash
+    mid-write) is cut off before the next append; records not followed by their batch line were never
+    committed and are skipped.
+    """
+
+    def __init__(self, path=COMMITMENT_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._offset = 0  # Bytes of the file already read
+        self._next_sequence = 0
+        self._pending_offset = None  # Offset of the first record line not yet followed by its batch line
+        self._first_sequences = []  # First sequence of every batch, in file order
+        self._batches = []  # (root, first_sequence, count, offset of its first record line), in file order
+        self._batch_by_root = {}
+        self._root_by_tx = {}  # tx hash -> root of the batch it committed
+        self._trees = OrderedDict()  # root -> merkle_levels(), for the PROOF_CACHE_BATCHES latest proven batches
+        with self._lock:
+            self._refresh()
+        if self._batches:
+            logger.info("✅ Loaded %d committed batches (%d anomalies) from %s", len(self._batches),
+                        self._next_sequence, self.path)
+
+    def _refresh(self):
+        """Reads lines appended since the last call. Call with self._lock held."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Torn final line; left unread
+                line_offset = self._offset
+                self._offset += len(line)
+                entry = json.loads(line)
+                if 'sequence' in entry:
+                    if self._pending_offset is None:
+                        self._pending_offset = line_offset
+                    self._next_sequence = max(self._next_sequence, entry['sequence'] + 1)
+                elif 'batch_root' in entry:
+                    batch = (bytes.fromhex(entry['batch_root'][2:]), entry['first_sequence'], entry['count'],
+                             self._pending_offset)
+                    self._add_batch(batch, entry.get('tx_hash'))
+                    self._pending_offset = None
+                elif 'revoked_root' in entry:
+                    self._drop_batch(bytes.fromhex(entry['revoked_root'][2:]))
+
+    def _add_batch(self, batch, tx_hash):
+        self._batches.append(batch)
+        self._first_sequences.append(batch[1])
+        self._batch_by_root[batch[0]] = batch
+        if tx_hash is not None:
+            self._root_by_tx[tx_hash] = batch[0]
+
+    def _drop_batch(self, root):
+        batch = self._batch_by_root.pop(root, None)
+        if batch is not None:
+            position = bisect.bisect_left(self._first_sequences, batch[1])
+            del self._batches[position], self._first_sequences[position]
+            self._trees.pop(root, None)
+
+    def _open_for_append(self, f):
+        """Takes the file lock and catches up with the file. Call with self._lock held."""
+        fcntl.flock(f, fcntl.LOCK_EX)  # Released when the file is closed
+        self._refresh()
+        if f.tell() > self._offset:
+            logger.warning("❗ Cutting a torn line off the end of %s", self.path)
+            f.truncate(self._offset)
+
+    def _write(self, f, lines):
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        self._offset += len(data)
+
+    def append_batch(self, records, send):
+        """Numbers `records` and calls `send(root, committed records)`, which must send the transaction
+        committing `root` and return its hash. Only then are the records and their batch line appended.
+        Returns (root, committed records, what send returned).
+
+        If send raises, nothing is written and the exception propagates. The file stays locked while
+        sending, so processes sharing the log commit one batch at a time.
+        """
+        with self._lock, open(self.path, 'ab') as f:
+            self._open_for_append(f)
+            if self._pending_offset is not None:
+                logger.warning("❗ Records without a batch line in %s were never committed; skipping them", self.path)
+                self._pending_offset = None
+
+            first_sequence = self._next_sequence
+            committed = [dict(record, sequence=first_sequence + i) for i, record in enumerate(records)]
+            levels = merkle_levels([leaf_hash(canonical_encoding(record)) for record in committed])
+            root = levels[-1][0]
+            sent = send(root, committed)
+            tx_hash = _hex(bytes(sent))
+            batch = (root, first_sequence, len(committed), self._offset)
+            lines = [json.dumps(record) for record in committed]
+            lines.append(json.dumps({"batch_root": _hex(root), "first_sequence": first_sequence,
+                                     "count": len(committed), "tx_hash": tx_hash}))
+            self._write(f, lines)
+            self._next_sequence = first_sequence + len(committed)
+            self._add_batch(batch, tx_hash)
+            self._cache_tree(root, levels)
+        return root, committed, sent
+
+    def revoke(self, tx_hash):
+        """Marks the batch committed by `tx_hash` (bytes) as never anchored, after its transaction reverted.
+        Its records stay in the file but are no longer proven or indexed. Returns False if no batch has it."""
+        tx_hash = _hex(bytes(tx_hash))
+        with self._lock, open(self.path, 'ab') as f:
+            self._open_for_append(f)
+            root = self._root_by_tx.pop(tx_hash, None)
+            if root is None or root not in self._batch_by_root:
+                return False
+            self._write(f, [json.dumps({"revoked_root": _hex(root), "tx_hash": tx_hash})])
+            self._drop_batch(root)
+        logger.warning("❗ Commit transaction %s reverted; batch %s is revoked", tx_hash, _hex(root))
+        return True
+
+    def _cache_tree(self, root, levels):
+        self._trees[root] = levels
+        self._trees.move_to_end(root)
+        while len(self._trees) > PROOF_CACHE_BATCHES:
+            self._trees.popitem(last=False)
+
+    def _read_batch(self, batch):
+        _, _, count, offset = batch
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return [json.loads(f.readline()) for _ in range(count)]
+
+    def _find_batch(self, sequence):
+        position = bisect.bisect_right(self._first_sequences, sequence) - 1
+        if position >= 0:
+            batch = self._batches[position]
+            if sequence < batch[1] + batch[2]:
+                return batch
+        return None
+
+    def batch_records(self, root):
+        """The committed records of the batch with Merkle root `root` (bytes), or None if it is not in the log."""
+        with self._lock:
+            batch = self._batch_by_root.get(root)
+            if batch is None:
+                self._refresh()
+                batch = self._batch_by_root.get(root)
+            return self._read_batch(batch) if batch is not None else None
+
+    def proof(self, sequence):
+        """Inclusion proof of anomaly `sequence`, or None if no committed batch holds it."""
+        with self._lock:
+            batch = self._find_batch(sequence)
+            if batch is None:
+                self._refresh()
+                batch = self._find_batch(sequence)
+            if batch is None:
+                return None
+            root, first_sequence, count, _ = batch
+            records = self._read_batch(batch)
+            levels = self._trees.get(root)
+            if levels is None:
+                levels = merkle_levels([leaf_hash(canonical_encoding(record)) for record in records])
+            self._cache_tree(root, levels)
+        index = sequence - first_sequence
+        record = records[index]
+        encoding = canonical_encoding(record)
+        return {
+            "record": record,
+            "encoding": _hex(encoding),
+            "leaf": _hex(levels[0][index]),
+            "proof": [_hex(node) for node in merkle_proof(levels, index)],
+            "root": _hex(root),
+            "batch": {"first_sequence": first_sequence, "count": count},
+        }
+
+    def stats(self):
+        with self._lock:
+            return {"batches": len(self._batches), "anomalies": sum(batch[2] for batch in self._batches),
+                    "path": self.path}
+
+
+def commitment_event_rows(commitment_log):
+    """Indexer callback for BatchCommitted events: one row per record of the batch, read from `commitment_log`.
+
+    Rows use the indexer's (anomaly_index, timestamp, sensor_id, data_value, anomaly_type, explanation)
+    columns with the sequence number as anomaly_index. A root missing from the local log (committed by
+    another backend, or the file was lost) yields no rows.
+    """
+    def rows(args):
+        records = commitment_log.batch_records(bytes(args['root']))
+        if records is None:
+            logger.warning("❗ Batch %s is committed on-chain but not in %s", _hex(bytes(args['root'])),
+                           commitment_log.path)
+            return []
+        return [(record["sequence"], record["timestamp"], record["sensor_id"], record["data_value"],
+                 record["anomaly_type"], record["explanation"]) for record in records]
+    return rows
+
+
+def parse_proof(encoding, proof, root):
+    """Bytes of the 0x-hex encoding, proof and root of a proof() document. Raises ValueError if malformed."""
+    def to_bytes(value, size=None):
+        if not isinstance(value, str) or not value.startswith('0x'):
+            raise ValueError(f"Expected a 0x-prefixed hex string, got {value!r}")
+        data = bytes.fromhex(value[2:])
+        if size is not None and len(data) != size:
+            raise ValueError(f"Expected {size} bytes, got {len(data)}")
+        return data
+    if not isinstance(proof, list):
+        raise ValueError("proof must be a list of hashes")
+    return to_bytes(encoding), [to_bytes(node, 32) for node in proof], to_bytes(root, 32)
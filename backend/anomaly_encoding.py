@@ -0,0 +1,78 @@
+# anomaly_encoding.py
+# Contract arguments and event decoding for the two on-chain record layouts: AnomalyLogger (every field a
+# string or int256) and CompactAnomalyLogger (bytes32 sensor ID, uint8 type code, scaled int32 value and score,
+# explanation in the event only). The third contract, AnomalyCommitments, keeps no records on-chain; see
+# anomaly_commitments.py.
+
+# --- CONFIGURATION ---
+CONTRACT_LAYOUTS = ('legacy', 'compact', 'commitments')
+VALUE_SCALE = 100  # Compact dataValue: the reading (temperature) in hundredths
+SCORE_SCALE = 1000000  # Compact score: the Isolation Forest decision score in millionths
+SENSOR_ID_BYTES = 32
+# uint8 codes of CompactAnomalyLogger.AnomalyType, in enum order. Unknown names are sent as 0 (Unspecified).
+ANOMALY_TYPE_CODES = {
+    "Unspecified": 0,
+    "Environmental Anomaly (Time Series)": 1,
+}
+ANOMALY_TYPE_NAMES = {code: name for name, code in ANOMALY_TYPE_CODES.items()}
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def encode_sensor_id(sensor_id):
+    """bytes32 form of a sensor ID: its UTF-8 bytes right-padded with zeros, or their keccak256 if longer than 32."""
+    raw = str(sensor_id).encode('utf-8')
+    if len(raw) > SENSOR_ID_BYTES:
+        from eth_utils import keccak  # Comes with web3; only needed for unusually long IDs
+        return keccak(raw)
+    return raw.ljust(SENSOR_ID_BYTES, b'\0')
+
+
+def decode_sensor_id(value):
+    """Inverse of encode_sensor_id(). Hashed (over-long) IDs cannot be reversed and come back as 0x-prefixed hex."""
+    value = bytes(value)
+    text = value.rstrip(b'\0')
+    if b'\0' not in text:
+        try:
+            return text.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return '0x' + value.hex()
+
+
+def scale_to_int32(value, scale):
+    """round(value * scale), clamped to the int32 range."""
+    return max(INT32_MIN, min(INT32_MAX, int(round(float(value) * scale))))
+
+
+def anomaly_type_code(anomaly_type):
+    return ANOMALY_TYPE_CODES.get(anomaly_type, 0)
+
+
+def anomaly_type_name(code):
+    return ANOMALY_TYPE_NAMES.get(code, f"Unknown ({code})")
+
+
+# --- Arguments for logAnomaly / logAnomalies ---
+def legacy_record_args(record):
+    """AnomalyLogger.logAnomaly arguments for a log queue record; dataValue is the reading rounded to an integer."""
+    return (record["timestamp"], record["sensor_id"], int(round(record["data_value"])), record["anomaly_type"],
+            record["explanation"])
+
+
+def compact_record_args(record):
+    """CompactAnomalyLogger AnomalyInput tuple for a log queue record."""
+    return (record["timestamp"], encode_sensor_id(record["sensor_id"]), anomaly_type_code(record["anomaly_type"]),
+            scale_to_int32(record["data_value"], VALUE_SCALE),
+            scale_to_int32(record.get("anomaly_score") or 0.0, SCORE_SCALE), record["explanation"])
+
+
+# --- Decoding ---
+# Both return (anomaly_index, timestamp, sensor_id, data_value, anomaly_type, explanation), the indexer's columns
+def legacy_event_fields(args):
+    return (args['anomalyIndex'], args['timestamp'], args['sensorId'], args['dataValue'], args['anomalyType'],
+            args['explanation'])
+
+
+def compact_event_fields(args):
+    return (args['anomalyIndex'], args['timestamp'], decode_sensor_id(args['sensorId']),
+            args['dataValue'] / VALUE_SCALE, anomaly_type_name(args['anomalyType']), args['explanation'])
@@ -0,0 +1,273 @@
+# anomaly_indexer.py
+# Tails AnomalyDetected (or BatchCommitted) events into a local SQLite read model so anomaly queries never touch
+# the node.
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from anomaly_encoding import legacy_event_fields
+
+# --- CONFIGURATION ---
+INDEX_DB_PATH = 'anomaly_index.sqlite3'
+INDEXER_START_BLOCK = 0  # Set to the contract's deployment block to skip empty history on first sync
+INDEXER_CHUNK_BLOCKS = 2000  # Block range per eth_getLogs call; keeps each response within node limits
+INDEXER_POLL_INTERVAL_SECONDS = 2.0
+INDEXER_CONFIRMATIONS = 0  # Blocks to stay behind the head; reorgs inside this window are handled anyway
+REORG_TRACKED_BLOCKS = 256  # How many recent block hashes are kept to find the fork point after a reorg
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS anomalies (
+    anomaly_index INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    sensor_id TEXT NOT NULL,
+    data_value INTEGER NOT NULL,
+    anomaly_type TEXT NOT NULL,
+    explanation TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    block_hash TEXT NOT NULL,
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_anomalies_timestamp ON anomalies (timestamp);
+CREATE INDEX IF NOT EXISTS idx_anomalies_sensor_timestamp ON anomalies (sensor_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_anomalies_block ON anomalies (block_number);
+CREATE TABLE IF NOT EXISTS processed_blocks (
+    block_number INTEGER PRIMARY KEY,
+    block_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_block INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS index_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    changed_at_block INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS index_rewinds (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    rewinds INTEGER NOT NULL
+);
+"""
+
+ANOMALY_COLUMNS = ['anomaly_index', 'timestamp', 'sensor_id', 'data_value', 'anomaly_type', 'explanation',
+                   'block_number', 'tx_hash']
+SORT_ORDERS = {'asc': 'ASC', 'desc': 'DESC'}
+
+
+class AnomalyIndexer:
+    """Keeps an SQLite copy of every AnomalyDetected event and answers anomaly queries from it.
+
+    Progress is checkpointed in the database, so a restart resumes from the last processed block.
+    The hashes of recently processed blocks are stored too. If the chain no longer agrees with them,
+    the indexer rewinds to the last block it still agrees with, deletes everything indexed after
+    that block and indexes it again.
+
+    Several processes (e.g. gunicorn workers) may start an indexer on the same database: only the one
+    holding an exclusive lock on `<db_path>.lock` syncs, and another takes over if that process exits.
+
+    `event_fields` maps an event's args to the indexed columns; see anomaly_encoding.py for both contract layouts.
+    An event that stands for several anomalies (AnomalyCommitments.BatchCommitted) is indexed with
+    `event_name` and `event_rows`, which maps its args to a list of such column tuples.
+    """
+
+    def __init__(self, w3, contract, db_path=INDEX_DB_PATH, start_block=INDEXER_START_BLOCK,
+                 chunk_blocks=INDEXER_CHUNK_BLOCKS, poll_interval=INDEXER_POLL_INTERVAL_SECONDS,
+                 confirmations=INDEXER_CONFIRMATIONS, event_fields=legacy_event_fields, event_name='AnomalyDetected',
+                 event_rows=None):
+        self.w3 = w3
+        self.contract = contract
+        self.event_fields = event_fields
+        self.event_name = event_name
+        self.event_rows = event_rows if event_rows is not None else lambda args: [event_fields(args)]
+        self.db_path = db_path
+        self.start_block = start_block
+        self.chunk_blocks = chunk_blocks
+        self.poll_interval = poll_interval
+        self.confirmations = confirmations
+        self._stop_event = threading.Event()
+        self._thread = None
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Yields a connection that commits on success, rolls back on error and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')  # Readers are never blocked by the indexing thread
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Indexing ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="anomaly-indexer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        with open(f"{self.db_path}.lock", 'a') as lock_file:
+            while not self._stop_event.is_set():
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)  # Held until this indexer stops
+                except BlockingIOError:
+                    self._stop_event.wait(self.poll_interval)  # Another process is indexing
+                    continue
+                try:
+                    self.sync()
+                except Exception as e:
+                    logger.error("❌ Anomaly indexer error: %s", e)
+                self._stop_event.wait(self.poll_interval)
+
+    def last_block(self):
+        with self._connect() as conn:
+            row = conn.execute('SELECT last_block FROM checkpoint WHERE id = 1').fetchone()
+        return row[0] if row else self.start_block - 1
+
+    def sync(self):
+        """Indexes every new block up to the confirmed head. Returns the number of events written."""
+        with self._connect() as conn:
+            self._handle_reorg(conn)
+        target = self.w3.eth.block_number - self.confirmations
+        written = 0
+        from_block = self.last_block() + 1
+        while from_block <= target and not self._stop_event.is_set():
+            to_block = min(from_block + self.chunk_blocks - 1, target)
+            logs = self.contract.events[self.event_name].get_logs(from_block=from_block, to_block=to_block)
+            to_block_hash = self.w3.eth.get_block(to_block)['hash'].hex()
+            with self._connect() as conn:  # One transaction per chunk: events, block hashes and checkpoint
+                conn.executemany(
+                    'INSERT OR REPLACE INTO anomalies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [row for log in logs for row in self._log_to_rows(log)])
+                block_hashes = {log['blockNumber']: log['blockHash'].hex() for log in logs}
+                block_hashes[to_block] = to_block_hash
+                conn.executemany('INSERT OR REPLACE INTO processed_blocks VALUES (?, ?)', block_hashes.items())
+                conn.execute('DELETE FROM processed_blocks WHERE block_number <= ?',
+                             (to_block - REORG_TRACKED_BLOCKS,))
+                conn.execute('INSERT OR REPLACE INTO checkpoint VALUES (1, ?)', (to_block,))
+                if logs:
+                    self._bump_version(conn, to_block)
+            written += len(logs)
+            from_block = to_block + 1
+        if written:
+            logger.info("Indexed %d anomaly events up to block %d", written, target)
+        return written
+
+    def _log_to_rows(self, log):
+        return [(*fields, log['blockNumber'], log['blockHash'].hex(), log['transactionHash'].hex(), log['logIndex'])
+                for fields in self.event_rows(log['args'])]
+
+    def _handle_reorg(self, conn):
+        """Rewinds to the newest stored block that is still canonical and drops everything indexed after it."""
+        stored = conn.execute(
+            'SELECT block_number, block_hash FROM processed_blocks ORDER BY block_number DESC').fetchall()
+        if not stored:
+            return
+        head = self.w3.eth.block_number
+        fork_block = None
+        for block_number, block_hash in stored:
+            if block_number > head:
+                continue  # The chain got shorter than what we indexed
+            # RPC errors propagate and abort this sync; they must never be mistaken for a reorg
+            if self.w3.eth.get_block(block_number)['hash'].hex() == block_hash:
+                fork_block = block_number
+                break
+        if fork_block == stored[0][0]:
+            return  # Head of what we indexed is still canonical
+        if fork_block is None:
+            # Reorg deeper than the tracked window: re-index the whole tracked window
+            fork_block = stored[-1][0] - 1
+        logger.warning("❗ Chain reorg detected: rewinding anomaly index to block %d", fork_block)
+        conn.execute('DELETE FROM anomalies WHERE block_number > ?', (fork_block,))
+        conn.execute('DELETE FROM processed_blocks WHERE block_number > ?', (fork_block,))
+        conn.execute('INSERT OR REPLACE INTO checkpoint VALUES (1, ?)', (fork_block,))
+        conn.execute('INSERT INTO index_rewinds VALUES (1, 1) ON CONFLICT (id) DO UPDATE SET rewinds = rewinds + 1')
+        self._bump_version(conn, fork_block)
+
+    @staticmethod
+    def _bump_version(conn, block_number):
+        conn.execute(
+            'INSERT INTO index_version VALUES (1, 1, ?) '
+            'ON CONFLICT (id) DO UPDATE SET version = version + 1, changed_at_block = excluded.changed_at_block',
+            (block_number,))
+
+    def version(self):
+        """Opaque tag that changes whenever indexed anomalies are added or rewound; usable as an ETag."""
+        with self._connect() as conn:
+            row = conn.execute('SELECT version, changed_at_block FROM index_version WHERE id = 1').fetchone()
+        version, changed_at_block = row if row else (0, -1)
+        return f"v{version}.b{changed_at_block}"
+
+    def rewinds(self):
+        """How many times a reorg rewound the index. Rows a client fetched before it changed may be stale, even at
+        positions that were indexed again."""
+        with self._connect() as conn:
+            row = conn.execute('SELECT rewinds FROM index_rewinds WHERE id = 1').fetchone()
+        return row[0] if row else 0
+
+    def last_anomaly_index(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT MAX(anomaly_index) FROM anomalies').fetchone()[0]
+
+    # --- Queries ---
+    def query_anomalies(self, sensor_id=None, since=None, until=None, offset=0, limit=100, order='asc',
+                        since_index=None):
+        """Returns (total, rows) for the filtered anomalies; rows are dicts ordered by timestamp.
+
+        With `since_index`, only anomalies whose on-chain position is greater than it are returned, ordered
+        by position, so the largest anomaly_index a client has seen works as a cursor for incremental reads.
+        """
+        where, params = [], []
+        if since_index is not None:
+            where.append('anomaly_index > ?')
+            params.append(since_index)
+        if sensor_id is not None:
+            where.append('sensor_id = ?')
+            params.append(sensor_id)
+        if since is not None:
+            where.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('timestamp < ?')
+            params.append(until)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+        direction = SORT_ORDERS[order]
+        if since_index is not None:
+            order_sql = f'ORDER BY anomaly_index {direction}'
+        else:
+            order_sql = f'ORDER BY timestamp {direction}, anomaly_index {direction}'
+        with self._connect() as conn:
+            total = conn.execute(f'SELECT COUNT(*) FROM anomalies {where_sql}', params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT {', '.join(ANOMALY_COLUMNS)} FROM anomalies {where_sql} {order_sql} LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+        return total, [dict(zip(ANOMALY_COLUMNS, row)) for row in rows]
+
+    def summarize_by_sensor(self, since=None):
+        """Anomaly count and first/last timestamp per sensor, most anomalous sensors first."""
+        where_sql, params = ('WHERE timestamp >= ?', [since]) if since is not None else ('', [])
+        with self._connect() as conn:
+            rows = conn.execute(
+                f'SELECT sensor_id, COUNT(*), MIN(timestamp), MAX(timestamp) FROM anomalies {where_sql} '
+                f'GROUP BY sensor_id ORDER BY COUNT(*) DESC, sensor_id', params).fetchall()
+        return [{"sensor_id": sensor_id, "anomaly_count": count, "first_timestamp": first, "last_timestamp": last}
+                for sensor_id, count, first, last in rows]
+
+    def status(self):
+        with self._connect() as conn:
+            indexed = conn.execute('SELECT COUNT(*) FROM anomalies').fetchone()[0]
+        return {"last_block": self.last_block(), "indexed_anomalies": indexed,
+                "db_path": os.path.abspath(self.db_path)}
@@ -0,0 +1,300 @@
+# anomaly_log_queue.py
+# Background, non-blocking submission of anomaly logs to the blockchain.
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+LOG_QUEUE_MAX_SIZE = 1000  # Anomalies waiting to be sent before backpressure kicks in
+BACKPRESSURE_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+DEFAULT_BACKPRESSURE_POLICY = 'drop_oldest'
+BLOCK_TIMEOUT_SECONDS = 0.5  # Longest a request waits for queue space under the 'block' policy
+RECEIPT_TIMEOUT_SECONDS = 120  # Same budget the old synchronous wait_for_transaction_receipt used
+RECEIPT_POLL_INTERVAL_SECONDS = 0.5
+MAX_TRACKED_STATUSES = 10000  # Only the most recent log IDs can be looked up
+LOG_BATCH_SIZE = 20  # Flush a batch once it holds this many anomalies...
+LOG_BATCH_INTERVAL_MS = 500  # ...or once its first anomaly has waited this long, whichever comes first
+LOG_DRAIN_TIMEOUT_SECONDS = 10  # Longest stop() spends sending what is still queued
+
+logger = logging.getLogger(__name__)
+
+# Log ID lifecycle: queued -> submitted -> mined | failed, or queued -> dropped
+STATUS_QUEUED = 'queued'
+STATUS_SUBMITTED = 'submitted'
+STATUS_MINED = 'mined'
+STATUS_FAILED = 'failed'
+STATUS_DROPPED = 'dropped'
+
+
+class SharedLogIds:
+    """Log ID iterator backed by a multiprocessing.Value('q', 0) created before forking, so worker
+    processes never hand out the same ID."""
+
+    def __init__(self, shared_value):
+        self._value = shared_value
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._value.get_lock():
+            self._value.value += 1
+            return self._value.value
+
+
+class AnomalyLogQueue:
+    """Bounded queue plus a dedicated worker thread that sends anomaly transactions and tracks receipts.
+
+    The worker groups queued anomalies into batches of up to `batch_size` records, flushing early once
+    `batch_interval_ms` has passed since the first record of the batch was taken off the queue.
+    `send_transaction(records)` must send one transaction for the list of records without waiting for
+    it to be mined and return its hash. `get_receipt(tx_hash)` must return the receipt, or None while the transaction is pending.
+    `on_transaction_lost()`, if given, is called when a send raises or a receipt never arrives, which is
+    when a locally tracked nonce has to be resynced. `on_receipt(seconds)`, if given, is called with the
+    time from send to receipt of every transaction that gets one, and `on_transaction_reverted(tx_hash)`
+    with the hash of every transaction mined with a failed status. `log_ids` is the iterator log IDs are
+    drawn from (default: 1, 2, 3, ... for this process; see SharedLogIds).
+    """
+
+    def __init__(self, send_transaction, get_receipt, maxsize=LOG_QUEUE_MAX_SIZE,
+                 backpressure=DEFAULT_BACKPRESSURE_POLICY, receipt_timeout=RECEIPT_TIMEOUT_SECONDS,
+                 poll_interval=RECEIPT_POLL_INTERVAL_SECONDS, on_transaction_lost=None,
+                 batch_size=LOG_BATCH_SIZE, batch_interval_ms=LOG_BATCH_INTERVAL_MS, on_receipt=None,
+                 log_ids=None, on_transaction_reverted=None):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{backpressure}'. Expected one of {BACKPRESSURE_POLICIES}")
+        self.send_transaction = send_transaction
+        self.get_receipt = get_receipt
+        self.backpressure = backpressure
+        self.receipt_timeout = receipt_timeout
+        self.poll_interval = poll_interval
+        self.on_transaction_lost = on_transaction_lost
+        self.on_receipt = on_receipt
+        self.on_transaction_reverted = on_transaction_reverted
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval_ms / 1000.0
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._ids = log_ids if log_ids is not None else itertools.count(1)
+        self._lock = threading.RLock()
+        self._statuses = OrderedDict()  # log_id -> status, capped at MAX_TRACKED_STATUSES
+        self._in_flight = {}  # tx_hash -> (log_ids, sent_at)
+        self._in_flight_records = 0
+        self._counts = {STATUS_SUBMITTED: 0, STATUS_MINED: 0, STATUS_FAILED: 0, STATUS_DROPPED: 0}
+        self._transactions_sent = 0
+        self._stop_event = threading.Event()
+        self._drain_deadline = 0.0
+        self._worker = None
+
+    # --- Request-path API ---
+    def submit(self, timestamp, sensor_id, data_value, anomaly_type, explanation, anomaly_score=None):
+        """Queues an anomaly for logging and returns its log ID, or None if it was dropped."""
+        log_id = next(self._ids)
+        record = {
+            "log_id": log_id,
+            "timestamp": timestamp,
+            "sensor_id": sensor_id,
+            "data_value": data_value,
+            "anomaly_type": anomaly_type,
+            "explanation": explanation,
+            "anomaly_score": anomaly_score
+        }
+        self._set_status(log_id, STATUS_QUEUED)
+
+        if self.backpressure == 'block':
+            try:
+                self._queue.put(record, timeout=BLOCK_TIMEOUT_SECONDS)
+                return log_id
+            except queue.Full:
+                self._record_drop(log_id)
+                return None
+
+        with self._lock:
+            try:
+                self._queue.put_nowait(record)
+                return log_id
+            except queue.Full:
+                if self.backpressure == 'drop_newest':
+                    self._record_drop(log_id)
+                    return None
+            # drop_oldest: make room by discarding the record that has waited longest
+            try:
+                oldest = self._queue.get_nowait()
+                self._record_drop(oldest["log_id"])
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(record)
+            return log_id
+
+    def status(self, log_id):
+        with self._lock:
+            return self._statuses.get(log_id)
+
+    def stats(self):
+        """Per-anomaly counts for monitoring. `pending` covers both queued and submitted-but-unmined anomalies."""
+        with self._lock:
+            in_flight = self._in_flight_records
+            in_flight_transactions = len(self._in_flight)
+            transactions_sent = self._transactions_sent
+            counts = dict(self._counts)
+        queued = self._queue.qsize()
+        return {
+            "queued": queued,
+            "in_flight": in_flight,
+            "in_flight_transactions": in_flight_transactions,
+            "transactions_sent": transactions_sent,
+            "pending": queued + in_flight,
+            "submitted": counts[STATUS_SUBMITTED],
+            "mined": counts[STATUS_MINED],
+            "failed": counts[STATUS_FAILED],
+            "dropped": counts[STATUS_DROPPED],
+            "backpressure_policy": self.backpressure,
+            "max_queue_size": self._queue.maxsize,
+            "batch_size": self.batch_size,
+            "batch_interval_ms": int(self.batch_interval * 1000)
+        }
+
+    # --- Worker lifecycle ---
+    def start(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._stop_event.clear()
+            self._worker = threading.Thread(target=self._run, name="anomaly-log-worker", daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout=5):
+        """Stops the worker once it has sent what is still queued, in full batches without waiting for their
+        interval. Waits at most `timeout` seconds; records not sent by then are counted as dropped."""
+        self._drain_deadline = time.monotonic() + timeout
+        self._stop_event.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        dropped = 0
+        while True:
+            try:
+                self._record_drop(self._queue.get_nowait()["log_id"])
+                dropped += 1
+            except queue.Empty:
+                break
+        if dropped:
+            logger.warning("❌ Anomaly log worker stopped with %d anomalies unsent; they were dropped", dropped)
+
+    def _run(self):
+        last_poll = 0.0
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._send(batch)
+            # Receipts are polled on a timer so a burst of sends is not slowed down by receipt RPCs
+            if time.monotonic() - last_poll >= self.poll_interval:
+                self._poll_receipts()
+                last_poll = time.monotonic()
+        # Stopping: send the rest of the queue; the node mines it whether or not this process waits for receipts
+        while time.monotonic() < self._drain_deadline:
+            batch = self._take_queued()
+            if not batch:
+                break
+            self._send(batch)
+
+    def _collect_batch(self):
+        """Blocks for the first record, then keeps taking records until the batch is full or its deadline passes.
+        Returns what it has as soon as stop() is called."""
+        try:
+            batch = [self._queue.get(timeout=self.poll_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size and not self._stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, self.poll_interval)))
+            except queue.Empty:
+                if remaining <= self.poll_interval:
+                    break
+        return batch
+
+    def _take_queued(self):
+        """Up to batch_size records that are already queued, without waiting."""
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, batch):
+        log_ids = [record["log_id"] for record in batch]
+        try:
+            tx_hash = self.send_transaction(batch)
+        except Exception as e:
+            logger.error("❌ Failed to send %d anomaly log(s) %d..%d: %s", len(batch), log_ids[0], log_ids[-1], e)
+            self._finish(log_ids, STATUS_FAILED)
+            self._transaction_lost()
+            return
+        with self._lock:
+            self._in_flight[tx_hash] = (log_ids, time.monotonic())
+            self._in_flight_records += len(log_ids)
+            self._transactions_sent += 1
+            self._counts[STATUS_SUBMITTED] += len(log_ids)
+            for log_id in log_ids:
+                self._set_status_locked(log_id, STATUS_SUBMITTED)
+
+    def _poll_receipts(self):
+        with self._lock:
+            in_flight = list(self._in_flight.items())
+        now = time.monotonic()
+        for tx_hash, (log_ids, sent_at) in in_flight:
+            try:
+                receipt = self.get_receipt(tx_hash)
+            except Exception as e:
+                logger.error("❌ Error fetching receipt for tx %s: %s", tx_hash.hex(), e)
+                receipt = None
+            if receipt is not None:
+                if self.on_receipt is not None:
+                    self.on_receipt(time.monotonic() - sent_at)
+                self._finish(log_ids, STATUS_MINED if receipt.status == 1 else STATUS_FAILED, tx_hash)
+                if receipt.status != 1 and self.on_transaction_reverted is not None:
+                    try:
+                        self.on_transaction_reverted(tx_hash)
+                    except Exception as e:
+                        logger.error("❌ Error handling reverted tx %s: %s", tx_hash.hex(), e)
+            elif now - sent_at > self.receipt_timeout:
+                logger.error("❌ Tx %s (%d anomaly logs) not mined within %ss", tx_hash.hex(), len(log_ids),
+                             self.receipt_timeout)
+                self._finish(log_ids, STATUS_FAILED, tx_hash)
+                self._transaction_lost()
+
+    def _transaction_lost(self):
+        if self.on_transaction_lost is not None:
+            self.on_transaction_lost()
+
+    # --- Status bookkeeping ---
+    def _finish(self, log_ids, status, tx_hash=None):
+        with self._lock:
+            if tx_hash is not None and self._in_flight.pop(tx_hash, None) is not None:
+                self._in_flight_records -= len(log_ids)
+            self._counts[status] += len(log_ids)
+            for log_id in log_ids:
+                self._set_status_locked(log_id, status)
+
+    def _record_drop(self, log_id):
+        with self._lock:
+            self._counts[STATUS_DROPPED] += 1
+            self._set_status_locked(log_id, STATUS_DROPPED)
+
+    def _set_status(self, log_id, status):
+        with self._lock:
+            self._set_status_locked(log_id, status)
+
+    def _set_status_locked(self, log_id, status):
+        self._statuses[log_id] = status
+        self._statuses.move_to_end(log_id)
+        while len(self._statuses) > MAX_TRACKED_STATUSES:
+            self._statuses.popitem(last=False)
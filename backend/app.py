@@ -1,18 +1,58 @@
 # app.py (UPDATED)
+import atexit
 import json
+import math
 import os
+import threading
 import time
 import datetime
+import logging
+import multiprocessing
 import numpy as np
 from flask import Flask, request, jsonify
-from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
-from sklearn.ensemble import IsolationForest
-import joblib
-from collections import deque  # Import deque for history buffer
+from anomaly_log_queue import (AnomalyLogQueue, SharedLogIds, LOG_QUEUE_MAX_SIZE, DEFAULT_BACKPRESSURE_POLICY, LOG_BATCH_SIZE,
+                               LOG_BATCH_INTERVAL_MS, LOG_DRAIN_TIMEOUT_SECONDS)
+from nonce_manager import NonceManager, GasPriceCache, prefetch_transaction_params
+from sensor_history import (SensorHistoryStore, SharedSensorHistoryStore, MAX_TRACKED_SENSORS, SENSOR_IDLE_TTL_SECONDS,
+                            IDLE_SWEEP_INTERVAL_SECONDS, SNAPSHOT_PATH, SNAPSHOT_INTERVAL_SECONDS, MAX_SENSOR_ID_BYTES)
+from anomaly_indexer import AnomalyIndexer, INDEX_DB_PATH, INDEXER_START_BLOCK
+from anomaly_encoding import (CONTRACT_LAYOUTS, legacy_record_args, compact_record_args, legacy_event_fields,
+                              compact_event_fields)
+from anomaly_commitments import (CommitmentLog, commitment_event_rows, leaf_hash, verify_proof, parse_proof,
+                                 COMMITMENT_LOG_PATH, COMMIT_WINDOW_SECONDS, COMMIT_MAX_BATCH)
+from sharded_detector import ShardedDetector, WorkerUnavailable
+from streaming_detector import StreamingDetector, Z_THRESHOLD, CUSUM_THRESHOLD
+from model_lifecycle import (ReservoirSampler, ModelStore, ModelWatcher, ModelRefresher, MODEL_VERSIONS_DIR,
+                             RESERVOIR_SIZE, MODEL_REFRESH_INTERVAL_SECONDS, MODEL_REFRESH_MIN_ROWS,
+                             DRIFT_ANOMALY_RATE, DRIFT_WINDOW_READINGS)
+from model_registry import ModelRegistry, MODEL_REGISTRY_DIR, MODEL_CACHE_SIZE, DEFAULT_MODEL_KEY
+from forest_scorer import FlatIsolationForest, MODEL_FORMAT_VERSION
+from features import (FEATURES_PER_READING, LAG_FEATURES_COUNT, TOTAL_FEATURES_FOR_MODEL, build_feature_row,
+                      build_feature_batch, check_feature_schema)
+from model_training import (TRAINING_DATA_FILE, LEGACY_TRAINING_DATA_FILE, open_training_data,
+                            train_isolation_forest, model_feature_schema)
+from logging_config import configure_logging
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+# Level and format come from LOG_LEVEL / LOG_FORMAT; per-reading messages are DEBUG, so the default INFO
+# level does no console I/O for normal readings
+configure_logging()
+logger = logging.getLogger('backend')
 
 # --- CONFIGURATION ---
-CONTRACT_ADDRESS = '0x7CdD0D08223D39840c8EB9A22077c64688f8ce09'  # Your deployed contract address
+CONTRACT_ADDRESS = os.environ.get('CONTRACT_ADDRESS', '0x7CdD0D08223D39840c8EB9A22077c64688f8ce09')  # Your deployed contract address
+# 'legacy' talks to AnomalyLogger; 'compact' to CompactAnomalyLogger (bytes32 sensor IDs, scaled integers,
+# explanations only in events); 'commitments' to AnomalyCommitments (one Merkle root per batch of anomalies,
+# records kept in COMMITMENT_LOG_PATH). Deploy the matching contract with
+# `CONTRACT_LAYOUT=<layout> npx hardhat run scripts/deploy.js --network ganache`
+CONTRACT_LAYOUT = os.environ.get('CONTRACT_LAYOUT', 'legacy')
+if CONTRACT_LAYOUT not in CONTRACT_LAYOUTS:
+    raise ValueError(f"Unknown CONTRACT_LAYOUT '{CONTRACT_LAYOUT}'. Expected one of {CONTRACT_LAYOUTS}")
+CONTRACT_ARTIFACTS = {
+    'legacy': ('anomaly_logger.sol', 'AnomalyLogger.json'),
+    'compact': ('compact_anomaly_logger.sol', 'CompactAnomalyLogger.json'),
+    'commitments': ('anomaly_commitments.sol', 'AnomalyCommitments.json'),
+}
 ABI_FILE_PATH = os.path.abspath(
     os.path.join(
         os.path.dirname(__file__),
@@ -20,285 +60,1121 @@ ABI_FILE_PATH = os.path.abspath(
         'smart_contracts',
         'artifacts',
         'contracts',
-        'anomaly_logger.sol',
-        'AnomalyLogger.json'
+        *CONTRACT_ARTIFACTS[CONTRACT_LAYOUT]
     )
 )
 GANACHE_URL = 'http://127.0.0.1:8545'
 
+# --- SERVING MODE ---
+# Set by gunicorn.conf.py before it imports this module in the gunicorn master. Sensor history, log IDs and
+# the sender nonce are then kept in memory shared by every worker process, and background threads are
+# started by the gunicorn hooks (start_history_maintenance in the master, start_log_worker in each worker)
+# instead of at import.
+SHARED_WORKER_STATE = os.environ.get('SHARED_WORKER_STATE') == '1'
+# Pipeline mode: with DETECTION_WORKERS > 0, sensor histories and scoring move to that many worker processes,
+# each owning the sensors that hash to it (see sharded_detector.py), and this process only parses and routes.
+# 0 keeps detection in the request threads.
+DETECTION_WORKERS = int(os.environ.get('DETECTION_WORKERS', 0))
+# With STREAMING_DETECTOR=1 every reading first goes through a per-sensor EWMA/CUSUM screen (see
+# streaming_detector.py) and only readings it flags are scored by the Isolation Forest; the rest are
+# reported as normal without a forest score.
+STREAMING_DETECTOR = os.environ.get('STREAMING_DETECTOR') == '1'
+STREAMING_DETECTOR_OPTIONS = {
+    "z_threshold": float(os.environ.get('STREAMING_Z_THRESHOLD', Z_THRESHOLD)),
+    "cusum_threshold": float(os.environ.get('STREAMING_CUSUM_THRESHOLD', CUSUM_THRESHOLD)),
+}
+# With MODEL_REFRESH=1 the model is refreshed online (see model_lifecycle.py): the feature rows of readings
+# predicted normal are sampled per sensor class, and a new version is trained from them in a separate process
+# every MODEL_REFRESH_INTERVAL_SECONDS, when a class's anomaly rate suggests drift, or on POST /model/refresh.
+# Every scoring process swaps it in without a restart. Responses report the model_version that scored them;
+# version 0 is the model from MODEL_PATH.
+MODEL_REFRESH = os.environ.get('MODEL_REFRESH') == '1'
+# With MODEL_REGISTRY=1 each sensor is scored by the model of its profile in MODEL_REGISTRY_DIR when there is
+# one (see model_registry.py; train them with `python model_registry.py`), and by the global model otherwise.
+# Responses report the "model" that scored them ('default' for the global one). With MODEL_REFRESH, every
+# sampled sensor class with enough rows also gets a model of its own at each refresh.
+MODEL_REGISTRY = os.environ.get('MODEL_REGISTRY') == '1'
+
+# --- METRICS ---
+# Served by GET /metrics in the Prometheus text format. Gauges are read at scrape time. Under gunicorn, counters
+# and histograms are kept in shared memory, so whichever worker answers a scrape reports the totals of all of them.
+metrics_registry = Registry(shared=SHARED_WORKER_STATE)
+READINGS_RECEIVED = metrics_registry.counter('readings_received_total', "Sensor readings received", ['endpoint'])
+READINGS_REJECTED = metrics_registry.counter('readings_rejected_total', "Readings rejected as malformed",
+                                             ['endpoint'])
+HISTORY_BUILDING_SKIPS = metrics_registry.counter(
+    'history_building_skips_total', "Readings not scored because their sensor's lag window was not full yet")
+ANOMALIES_DETECTED = metrics_registry.counter('anomalies_detected_total', "Readings scored as anomalies")
+STREAMING_SCREENED = metrics_registry.counter(
+    'streaming_screened_total', "Readings with a full lag window that the streaming detector cleared, so the "
+                                "forest did not score them")
+STAGE_LATENCY = metrics_registry.histogram(
+    'stage_latency_seconds', "Seconds per pipeline stage: parse, features, score, chain_submit (one transaction), "
+                             "receipt_wait (send to receipt of one transaction)", ['stage'])
+READINGS_RECEIVED_SINGLE = READINGS_RECEIVED.labels('sensor_data')
+READINGS_RECEIVED_BATCH = READINGS_RECEIVED.labels('sensor_data_batch')
+READINGS_REJECTED_SINGLE = READINGS_REJECTED.labels('sensor_data')
+READINGS_REJECTED_BATCH = READINGS_REJECTED.labels('sensor_data_batch')
+PARSE_LATENCY = STAGE_LATENCY.labels('parse')
+FEATURES_LATENCY = STAGE_LATENCY.labels('features')
+SCORE_LATENCY = STAGE_LATENCY.labels('score')
+CHAIN_SUBMIT_LATENCY = STAGE_LATENCY.labels('chain_submit')
+RECEIPT_WAIT_LATENCY = STAGE_LATENCY.labels('receipt_wait')
+metrics_registry.gauge('tracked_sensors', "Sensors whose lag history is held in memory",
+                       lambda: sharded_detector.tracked_sensors() if sharded_detector else len(sensor_data_history))
+metrics_registry.gauge('log_queue_depth', "Anomalies waiting to be sent on-chain",
+                       lambda: anomaly_log_queue.stats()['queued'])
+metrics_registry.gauge('log_queue_in_flight', "Anomalies sent on-chain and waiting for a receipt",
+                       lambda: anomaly_log_queue.stats()['in_flight'])
+RPC_LATENCY = metrics_registry.histogram(
+    'rpc_request_seconds', "Seconds per JSON-RPC request attempt, by method ('batch' for batched requests)", ['method'])
+RPC_REQUESTS = metrics_registry.counter(
+    'rpc_requests_total', "JSON-RPC request attempts by method and outcome: ok, error, or rejected while the "
+                          "circuit breaker was open", ['method', 'outcome'])
+MODEL_SWAPS = metrics_registry.counter('model_swaps_total', "New model versions swapped in, summed over processes")
+metrics_registry.gauge('model_version', "Version of the model this process scores with (0: MODEL_PATH)",
+                       lambda: anomaly_scorer.version)
+MODEL_CACHE_LOADS = metrics_registry.counter('model_cache_loads_total',
+                                             "Profile models loaded from disk (cache misses), summed over processes")
+metrics_registry.gauge('model_cache_models', "Profile models loaded in this process's cache",
+                       lambda: len(model_registry.stats()["cached"]) if model_registry else 0)
+metrics_registry.gauge('rpc_circuit_open', "1 while RPC calls are rejected (or a trial call is pending) after "
+                                           "repeated node failures",
+                       lambda: int(_rpc_breaker is not None and _rpc_breaker.state != 'closed'))
+
 # --- NEW: Time Series Configuration ---
-FEATURES_PER_READING = 3  # temperature, humidity, pressure
-LAG_FEATURES_COUNT = 3  # Current reading + 2 previous readings. So, 3 readings total.
-TOTAL_FEATURES_FOR_MODEL = FEATURES_PER_READING * LAG_FEATURES_COUNT
-MAX_HISTORY_LENGTH = LAG_FEATURES_COUNT  # Only need enough to form the feature vector
-
-# This dictionary will store a deque (double-ended queue) for each sensor_id
-sensor_data_history = {}  # Key: sensor_id, Value: deque of (temp, hum, pres) tuples
-
-# --- WEB3 SETUP (Remains the same) ---
-try:
-    w3 = Web3(Web3.HTTPProvider(GANACHE_URL))
-    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer = 0)
-    if w3.is_connected():
-        print(f"✅ Successfully connected to Ganache at {GANACHE_URL}")
-    else:
-        print("❌ Failed to connect to Ganache. Please ensure Ganache is running.")
-        exit()
-except Exception as e:
-    print(f"❌ Error during Web3 setup: {e}")
-    exit()
-
-try:
-    with open(ABI_FILE_PATH, 'r') as f:
-        abi_json = json.load(f)
-        CONTRACT_ABI = abi_json['abi']
-    print(f"✅ ABI loaded from: {ABI_FILE_PATH}")
-except FileNotFoundError:
-    print(f"❌ ABI file not found at: {ABI_FILE_PATH}")
-    print("Please ensure you have compiled your smart contract (`npx hardhat compile`)")
-    print("and the ABI_FILE_PATH in this script is correct.")
-    exit()
-except json.JSONDecodeError:
-    print(f"❌ Error decoding JSON from ABI file: {ABI_FILE_PATH}")
-    exit()
-
-try:
-    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
-    print(f"✅ Contract instance created for address: {CONTRACT_ADDRESS}")
-except Exception as e:
-    print(f"❌ Error creating contract instance: {e}")
-    print("Please check CONTRACT_ADDRESS and CONTRACT_ABI.")
-    exit()
-
-SENDER_ACCOUNT = w3.eth.accounts[0]
-print(f"Using sender account: {SENDER_ACCOUNT}")
+# FEATURES_PER_READING, LAG_FEATURES_COUNT and the column order of feature rows come from features.py
+
+# Ring buffer holding the last LAG_FEATURES_COUNT (temp, hum, pres) readings of every sensor.
+# Bounded: the least recently seen sensor is evicted past MAX_TRACKED_SENSORS, and sensors idle for
+# longer than SENSOR_IDLE_TTL_SECONDS are dropped by a periodic sweep.
+if SHARED_WORKER_STATE:
+    # Preallocated for MAX_TRACKED_SENSORS sensors; shared history cannot be unbounded
+    sensor_data_history = SharedSensorHistoryStore(
+        LAG_FEATURES_COUNT,
+        FEATURES_PER_READING,
+        max_sensors=int(os.environ.get('MAX_TRACKED_SENSORS', MAX_TRACKED_SENSORS)) or MAX_TRACKED_SENSORS
+    )
+else:
+    sensor_data_history = SensorHistoryStore(
+        LAG_FEATURES_COUNT,
+        FEATURES_PER_READING,
+        max_sensors=int(os.environ.get('MAX_TRACKED_SENSORS', MAX_TRACKED_SENSORS)) or None  # 0 = unbounded
+    )
+
+# Streaming detector state, one row per history row. Its baselines are not snapshotted: after a restart
+# every sensor warms up again, with all its readings scored by the forest meanwhile.
+streaming_detector = None
+if STREAMING_DETECTOR and not DETECTION_WORKERS:
+    streaming_detector = StreamingDetector(FEATURES_PER_READING, capacity=sensor_data_history.capacity,
+                                           shared=SHARED_WORKER_STATE, **STREAMING_DETECTOR_OPTIONS)
+
+# Warm restart: reload the lag windows from the latest snapshot before any request is served, then keep
+# writing snapshots periodically and once more on a clean shutdown. In pipeline mode each detection worker
+# does this for its own shard instead.
+HISTORY_SNAPSHOT_PATH = os.environ.get('HISTORY_SNAPSHOT_PATH', SNAPSHOT_PATH)
+_snapshot_load_start = time.perf_counter()
+_restored_sensors = sensor_data_history.load_snapshot(HISTORY_SNAPSHOT_PATH) if not DETECTION_WORKERS else 0
+if _restored_sensors:
+    logger.info("✅ Restored history of %d sensors from %s in %.1f ms", _restored_sensors, HISTORY_SNAPSHOT_PATH,
+                (time.perf_counter() - _snapshot_load_start) * 1000)
+_history_owner_pid = None
+
+
+def save_history_snapshot_on_exit():
+    # Forked workers inherit atexit handlers; only the process that runs the snapshotter writes the file
+    if os.getpid() == _history_owner_pid:
+        sensor_data_history.save_snapshot(HISTORY_SNAPSHOT_PATH)
+
+
+def start_history_maintenance():
+    """Starts the idle sweeper and the periodic snapshotter, and saves a final snapshot at exit."""
+    global _history_owner_pid
+    sensor_data_history.start_idle_sweeper(
+        ttl_seconds=float(os.environ.get('SENSOR_IDLE_TTL_SECONDS', SENSOR_IDLE_TTL_SECONDS)),
+        interval_seconds=float(os.environ.get('IDLE_SWEEP_INTERVAL_SECONDS', IDLE_SWEEP_INTERVAL_SECONDS))
+    )
+    sensor_data_history.start_snapshotter(
+        HISTORY_SNAPSHOT_PATH,
+        interval_seconds=float(os.environ.get('HISTORY_SNAPSHOT_INTERVAL_SECONDS', SNAPSHOT_INTERVAL_SECONDS))
+    )
+    _history_owner_pid = os.getpid()
+    atexit.register(save_history_snapshot_on_exit)
+
+# --- WEB3 SETUP ---
+# web3 is imported and Ganache contacted by connect_blockchain(), not at import time, so a worker process
+# starts (and can score readings) without waiting for the node. The first request starts it in the background.
+BLOCKCHAIN_RETRY_SECONDS = 5.0  # After a failed connection, wait this long before trying again
+# Connections to the node kept open per process: one per request thread, plus the log worker and the indexer
+RPC_POOL_SIZE = int(os.environ.get('RPC_POOL_SIZE', int(os.environ.get('WEB_THREADS', 4)) + 2))
+
+w3 = None
+contract = None
+SENDER_ACCOUNT = None
+nonce_manager = None  # Nonces are allocated locally so concurrent anomalies never share one
+gas_price_cache = None  # Gas price is cached briefly
+# Every worker sends from SENDER_ACCOUNT, so under gunicorn they draw nonces from one shared counter
+_shared_nonce = multiprocessing.Value('q', -1) if SHARED_WORKER_STATE else None
+# ...and the last anomaly timestamp sent, guarded by the nonce lock (see NonceManager.next_ordered_nonce)
+_shared_timestamp = multiprocessing.Value('q', 0, lock=False) if SHARED_WORKER_STATE else None
+_blockchain_lock = threading.Lock()
+_blockchain_failed_at = None
+_rpc_breaker = None  # Shared by every connection attempt of this process; see rpc_client.py
+
+
+def observe_rpc_request(method, seconds, outcome):
+    RPC_REQUESTS.labels(method, outcome).inc()
+    if outcome != 'rejected':
+        RPC_LATENCY.labels(method).observe(seconds)
+
+
+def connect_blockchain():
+    """Connects to Ganache, loads the contract and starts the event indexer. Returns the contract.
+
+    Thread-safe and idempotent. Raises ConnectionError if the node, ABI or contract is unavailable;
+    further attempts within BLOCKCHAIN_RETRY_SECONDS raise immediately instead of hitting the node again.
+    """
+    global w3, contract, SENDER_ACCOUNT, nonce_manager, gas_price_cache, _blockchain_failed_at, _rpc_breaker
+    if contract is not None:
+        return contract
+    with _blockchain_lock:
+        if contract is not None:
+            return contract
+        if _blockchain_failed_at is not None and time.monotonic() - _blockchain_failed_at < BLOCKCHAIN_RETRY_SECONDS:
+            raise ConnectionError("Blockchain unavailable; retrying shortly")
+        try:
+            from web3 import Web3
+            from web3.middleware import ExtraDataToPOAMiddleware
+            from rpc_client import (CircuitBreaker, make_rpc_session, BREAKER_FAILURE_THRESHOLD,
+                                    BREAKER_RESET_SECONDS, RPC_MAX_RETRIES, RPC_CONNECT_TIMEOUT_SECONDS,
+                                    RPC_READ_TIMEOUT_SECONDS)
+
+            if _rpc_breaker is None:
+                _rpc_breaker = CircuitBreaker(
+                    failure_threshold=int(os.environ.get('RPC_BREAKER_FAILURES', BREAKER_FAILURE_THRESHOLD)),
+                    reset_seconds=float(os.environ.get('RPC_BREAKER_RESET_SECONDS', BREAKER_RESET_SECONDS))
+                )
+            session = make_rpc_session(
+                _rpc_breaker, RPC_POOL_SIZE, on_request=observe_rpc_request,
+                max_retries=int(os.environ.get('RPC_MAX_RETRIES', RPC_MAX_RETRIES)),
+                timeout=(float(os.environ.get('RPC_CONNECT_TIMEOUT_SECONDS', RPC_CONNECT_TIMEOUT_SECONDS)),
+                         float(os.environ.get('RPC_READ_TIMEOUT_SECONDS', RPC_READ_TIMEOUT_SECONDS)))
+            )
+            # Retries, timeouts and the circuit breaker live in the session; web3 must not retry on top of them
+            new_w3 = Web3(Web3.HTTPProvider(GANACHE_URL, session=session, exception_retry_configuration=None))
+            new_w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+            # Transactions carry their own gas price and are signed by the node, so these only add round trips:
+            # 'validation' fetches the chain ID before every send, estimate and call, and 'gas_price_strategy'
+            # fetches the latest block before every send
+            new_w3.middleware_onion.remove('validation')
+            new_w3.middleware_onion.remove('gas_price_strategy')
+            try:
+                with new_w3.batch_requests() as batch:  # One round trip; also checks that the node answers
+                    batch.add(new_w3.eth.accounts)
+                    batch.add(new_w3.eth.chain_id)
+                    accounts, chain_id = batch.execute()
+            except Exception:
+                accounts, chain_id = new_w3.eth.accounts, new_w3.eth.chain_id  # Node without batch support
+            logger.info("✅ Successfully connected to Ganache at %s (chain ID %d)", GANACHE_URL, chain_id)
+
+            try:
+                with open(ABI_FILE_PATH, 'r') as f:
+                    contract_abi = json.load(f)['abi']
+            except FileNotFoundError:
+                raise ConnectionError(f"ABI file not found at: {ABI_FILE_PATH}. Please ensure you have compiled "
+                                      f"your smart contract (`npx hardhat compile`) and ABI_FILE_PATH is correct.")
+            except json.JSONDecodeError:
+                raise ConnectionError(f"Error decoding JSON from ABI file: {ABI_FILE_PATH}")
+            logger.info("✅ ABI loaded from: %s", ABI_FILE_PATH)
+
+            new_contract = new_w3.eth.contract(address=CONTRACT_ADDRESS, abi=contract_abi)
+            logger.info("✅ Contract instance created for address: %s", CONTRACT_ADDRESS)
+            sender_account = accounts[0]
+            logger.info("Using sender account: %s", sender_account)
+        except Exception as e:
+            _blockchain_failed_at = time.monotonic()
+            logger.error("❌ Error during Web3 setup: %s", e)
+            raise ConnectionError(str(e)) from e
+
+        w3, SENDER_ACCOUNT = new_w3, sender_account
+        nonce_manager = NonceManager(w3, SENDER_ACCOUNT, shared_nonce=_shared_nonce,
+                                     shared_timestamp=_shared_timestamp)
+        gas_price_cache = GasPriceCache(w3)
+        prefetch_transaction_params(w3, nonce_manager, gas_price_cache)
+        anomaly_indexer.w3, anomaly_indexer.contract = w3, new_contract
+        anomaly_indexer.start()
+        contract = new_contract  # Set last: other threads treat a non-None contract as "fully connected"
+        return contract
+
 
 # --- ANOMALY DETECTION MODEL SETUP ---
 MODEL_PATH = 'anomaly_detection_model.joblib'
-NORMAL_DATA_FILE = 'normal_training_data_with_lags.json'  # Path to your generated normal data
+# Flat, memory-mapped copy of MODEL_PATH that requests are scored from. Forked workers that load it
+# share its pages, and loading it needs neither sklearn nor unpickling.
+MODEL_ARRAYS_DIR = os.environ.get('MODEL_ARRAYS_DIR', 'anomaly_detection_model_arrays')
+NORMAL_DATA_FILE = TRAINING_DATA_FILE  # Binary training data; see model_training.py
+LEGACY_NORMAL_DATA_FILE = LEGACY_TRAINING_DATA_FILE  # Used when only the old JSON file exists
 
 
-def train_or_load_model():
-    """Trains an Isolation Forest model or loads it if it exists."""
-    global anomaly_model
+def model_arrays_are_current():
+    """True if MODEL_ARRAYS_DIR is in the current format and at least as new as the joblib model it came from."""
+    meta = FlatIsolationForest.read_meta(MODEL_ARRAYS_DIR)
+    if meta is None or meta.get('format_version') != MODEL_FORMAT_VERSION:
+        return False
+    meta_path = os.path.join(MODEL_ARRAYS_DIR, 'meta.json')
+    return not os.path.exists(MODEL_PATH) or os.path.getmtime(meta_path) >= os.path.getmtime(MODEL_PATH)
+
+
+def load_or_train_sklearn_model():
+    """Loads the joblib Isolation Forest, or trains and saves one if it does not exist."""
+    import joblib  # Only needed to (re)build MODEL_ARRAYS_DIR, so worker startup doesn't pay for it
     if os.path.exists(MODEL_PATH):
-        anomaly_model = joblib.load(MODEL_PATH)
-        print(f"✅ Anomaly detection model loaded from {MODEL_PATH}")
-    else:
-        print("💡 Training new Isolation Forest model...")
+        model = joblib.load(MODEL_PATH)
+        logger.info("✅ Anomaly detection model loaded from %s", MODEL_PATH)
+        return model
 
-        # Load the generated normal data
-        try:
-            with open(NORMAL_DATA_FILE, 'r') as f:
-                loaded_normal_data = json.load(f)
-            # Ensure it's a numpy array with correct shape
-            NORMAL_DATA_FOR_TRAINING = np.array(loaded_normal_data)
-
-            if NORMAL_DATA_FOR_TRAINING.shape[1] != TOTAL_FEATURES_FOR_MODEL:
-                print(
-                    f"❌ Error: Loaded normal data has {NORMAL_DATA_FOR_TRAINING.shape[1]} features, but expected {TOTAL_FEATURES_FOR_MODEL}.")
-                print("Please re-run generate_normal_data.py with correct settings.")
-                exit()
-            print(f"Loaded {NORMAL_DATA_FOR_TRAINING.shape[0]} normal data points for training.")
-        except FileNotFoundError:
-            print(f"❌ Normal data file not found at: {NORMAL_DATA_FILE}")
-            print("Please run `generate_normal_data.py` first to create the training data.")
-            exit()
-        except Exception as e:
-            print(f"❌ Error loading normal training data: {e}")
+    logger.info("💡 Training new Isolation Forest model...")
+    data_file = NORMAL_DATA_FILE if os.path.exists(NORMAL_DATA_FILE) else LEGACY_NORMAL_DATA_FILE
+    try:
+        NORMAL_DATA_FOR_TRAINING = open_training_data(data_file)
+        if NORMAL_DATA_FOR_TRAINING.shape[1] != TOTAL_FEATURES_FOR_MODEL:
+            logger.error("❌ Error: Loaded normal data has %d features, but expected %d. "
+                         "Please re-run generate_normal_data.py with correct settings.",
+                         NORMAL_DATA_FOR_TRAINING.shape[1], TOTAL_FEATURES_FOR_MODEL)
             exit()
+        logger.info("Loaded %d normal data points for training from %s.", NORMAL_DATA_FOR_TRAINING.shape[0], data_file)
+    except FileNotFoundError:
+        logger.error("❌ Normal data file not found at: %s. "
+                     "Please run `generate_normal_data.py` first to create the training data.", data_file)
+        exit()
+    except Exception as e:
+        logger.error("❌ Error loading normal training data: %s", e)
+        exit()
+
+    # For very large files, train with `python model_training.py --shards N` instead
+    model = train_isolation_forest(NORMAL_DATA_FOR_TRAINING)
+    joblib.dump(model, MODEL_PATH)
+    logger.info("✅ Anomaly detection model trained and saved to %s", MODEL_PATH)
+    return model
 
-        anomaly_model = IsolationForest(contamination=0.01, random_state=42)  # Start with a lower contamination
-        anomaly_model.fit(NORMAL_DATA_FOR_TRAINING)  # Train with the generated normal data
-        joblib.dump(anomaly_model, MODEL_PATH)
-        print(f"✅ Anomaly detection model trained and saved to {MODEL_PATH}")
 
+def train_or_load_model():
+    """Loads the memory-mapped scoring model, exporting it from the joblib model (trained first if missing) when stale.
 
-# Call this once at startup
+    With MODEL_REFRESH, the latest published version in MODEL_VERSIONS_DIR is loaded instead, if there is one.
+    """
+    global anomaly_scorer
+    if not model_arrays_are_current():
+        model = load_or_train_sklearn_model()
+        FlatIsolationForest.from_model(model, model_feature_schema(model)).save(MODEL_ARRAYS_DIR)
+        logger.info("✅ Model exported to %s", MODEL_ARRAYS_DIR)
+    published_version = model_store.current_version() if model_store is not None else None
+    model_dir = MODEL_ARRAYS_DIR if published_version is None else model_store.version_path(published_version)
+    anomaly_scorer = FlatIsolationForest.load(model_dir, mmap_mode='r')
+    try:
+        check_feature_schema(anomaly_scorer.feature_schema)
+    except ValueError as e:
+        logger.error("❌ Model does not match the feature layout: %s. "
+                     "Please retrain the model (delete it or run `python model_training.py`).", e)
+        exit()
+    logger.info("✅ Anomaly detection model version %d mapped from %s (%d trees)", anomaly_scorer.version,
+                model_dir, anomaly_scorer.n_trees)
+
+
+def swap_model(version, path):
+    """Replaces the scoring model with a published version. Requests read anomaly_scorer once, so those in
+    flight finish with the model they started with, and nothing waits for the swap."""
+    global anomaly_scorer
+    scorer = FlatIsolationForest.load(path, mmap_mode='r')
+    check_feature_schema(scorer.feature_schema)
+    anomaly_scorer = scorer  # A single reference assignment, atomic under the GIL
+    MODEL_SWAPS.inc()
+
+
+# Online refresh (MODEL_REFRESH=1). The sample is shared by all workers, because any of them may score a
+# given sensor; it is created here so that forked workers inherit it.
+model_store = None
+model_sampler = None
+model_watcher = None
+model_refresher = None
+if MODEL_REFRESH:
+    model_store = ModelStore(os.environ.get('MODEL_VERSIONS_DIR', MODEL_VERSIONS_DIR))
+    model_sampler = ReservoirSampler(TOTAL_FEATURES_FOR_MODEL,
+                                     size=int(os.environ.get('MODEL_RESERVOIR_SIZE', RESERVOIR_SIZE)),
+                                     shared=SHARED_WORKER_STATE or DETECTION_WORKERS > 0)
+
+# Profile models (MODEL_REGISTRY=1). Created before workers fork; each process fills its own cache.
+model_registry = None
+if MODEL_REGISTRY:
+    model_registry = ModelRegistry(os.environ.get('MODEL_REGISTRY_DIR', MODEL_REGISTRY_DIR),
+                                   cache_size=int(os.environ.get('MODEL_CACHE_SIZE', MODEL_CACHE_SIZE)),
+                                   on_load=MODEL_CACHE_LOADS.inc)
+    logger.info("✅ Model registry at %s: %d profile models", model_registry.root, len(model_registry.keys()))
+
+
+# Call this once at startup. Requests are scored from flat copies of the trees; sklearn is only used to
+# train the model and to export it
 train_or_load_model()
 
 
-# --- BLOCKCHAIN INTERACTION FUNCTIONS (Remains the same) ---
-def log_anomaly_on_blockchain(timestamp, sensor_id, data_value, anomaly_type, explanation):
-    print(f"\n--- Attempting to Log Anomaly on Blockchain ---")
-    print(f"Logging: Timestamp={timestamp}, SensorID='{sensor_id}', Value={data_value}, Type='{anomaly_type}'")
+def start_model_watcher():
+    """Starts swapping in newly published model versions. Under gunicorn, each worker runs its own: a new
+    watcher, since the lock of one inherited through fork may have been held by a thread that did not survive
+    it. Versions published while the process was not watching are swapped in right away."""
+    global model_watcher
+    if model_store is None:
+        return
+    model_watcher = ModelWatcher(model_store, swap_model, loaded_version=anomaly_scorer.version)
+    model_watcher.poll(force=True)
+    model_watcher.start()
 
-    try:
-        nonce = w3.eth.get_transaction_count(SENDER_ACCOUNT)
-        gas_price = w3.eth.gas_price
-
-        tx_hash = contract.functions.logAnomaly(
-            timestamp,
-            sensor_id,
-            data_value,
-            anomaly_type,
-            explanation
-        ).transact({
+
+def start_model_refresh(watch=True):
+    """Starts the refresher, which trains and publishes new versions (one per deployment: this process, or
+    the gunicorn master), and unless `watch` is False this process's watcher. The gunicorn master does not
+    score requests, so it only refreshes."""
+    global model_refresher
+    if model_store is None:
+        return
+    if watch:
+        start_model_watcher()
+    model_refresher = ModelRefresher(
+        model_sampler,
+        model_store,
+        interval_seconds=float(os.environ.get('MODEL_REFRESH_INTERVAL_SECONDS', MODEL_REFRESH_INTERVAL_SECONDS)),
+        min_rows=int(os.environ.get('MODEL_REFRESH_MIN_ROWS', MODEL_REFRESH_MIN_ROWS)),
+        drift_rate=float(os.environ.get('DRIFT_ANOMALY_RATE', DRIFT_ANOMALY_RATE)),
+        drift_window=int(os.environ.get('DRIFT_WINDOW_READINGS', DRIFT_WINDOW_READINGS)),
+        on_publish=(lambda version: model_watcher.poll(force=True)) if watch else None,
+        registry=model_registry
+    )
+    model_refresher.start()
+
+
+# --- BLOCKCHAIN INTERACTION FUNCTIONS ---
+BATCH_GAS_HEADROOM = 1.2  # Multiplier applied to estimate_gas for logAnomalies batches
+
+def send_anomaly_transaction(records):
+    """Sends one transaction for a batch of anomaly records without waiting for it to be mined.
+
+    A single record uses logAnomaly; larger batches use logAnomalies so the per-transaction overhead
+    is paid once per batch. With the commitments layout the whole batch is one commitBatch call.
+    Returns the tx hash.
+    """
+    connect_blockchain()
+    submit_start = time.perf_counter()
+    prefetch_transaction_params(w3, nonce_manager, gas_price_cache)  # After a resync: nonce and gas price together
+    if CONTRACT_LAYOUT == 'commitments':
+        nonce = nonce_manager.next_nonce()
+    else:
+        # The contracts' firstAnomalySince() searches assume stored timestamps never decrease, so concurrent
+        # requests and workers are clamped into nonce (= mining) order; a clamped timestamp is at most seconds late
+        nonce, timestamps = nonce_manager.next_ordered_nonce([record['timestamp'] for record in records])
+        for record, timestamp in zip(records, timestamps):
+            record['timestamp'] = timestamp
+    gas_price = gas_price_cache.get()
+
+    def transact(contract_call, gas):
+        return contract_call.transact({
             'from': SENDER_ACCOUNT,
             'nonce': nonce,
-            'gas': 3000000,
+            'gas': gas,
             'gasPrice': gas_price
         })
 
-        print(f"Transaction sent. Tx Hash: {tx_hash.hex()}")
-        print("Waiting for transaction receipt...")
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+    if CONTRACT_LAYOUT == 'commitments':
+        # The records go to the local log, but only once commitBatch has been sent: a batch whose root
+        # never left this process must not be proven later. Only the Merkle root and count go on-chain.
+        def send_commitment(root, committed):
+            contract_call = contract.functions.commitBatch(root, len(committed), committed[0]['timestamp'],
+                                                           committed[-1]['timestamp'])
+            return transact(contract_call,
+                            int(contract_call.estimate_gas({'from': SENDER_ACCOUNT}) * BATCH_GAS_HEADROOM))
 
-        print(f"Transaction mined. Status: {'SUCCESS' if receipt.status == 1 else 'FAILED'}")
-        if receipt.status == 1:
-            print("✅ Anomaly logged successfully on blockchain!")
+        _, _, tx_hash = commitment_log.append_batch(records, send_commitment)
+    elif CONTRACT_LAYOUT == 'compact':
+        # CompactAnomalyLogger takes one AnomalyInput tuple per anomaly
+        anomalies = [compact_record_args(record) for record in records]
+        contract_call = (contract.functions.logAnomaly(anomalies[0]) if len(anomalies) == 1
+                         else contract.functions.logAnomalies(anomalies))
+    elif len(records) == 1:
+        contract_call = contract.functions.logAnomaly(*legacy_record_args(records[0]))
+    else:
+        # AnomalyLogger takes one array per field
+        contract_call = contract.functions.logAnomalies(*map(list, zip(*map(legacy_record_args, records))))
+
+    if CONTRACT_LAYOUT != 'commitments':
+        if len(records) == 1:
+            gas = 3000000
         else:
-            print("❌ Transaction failed to be mined successfully!")
+            # Batch cost grows with the number and length of the strings, so estimate it per batch
+            gas = int(contract_call.estimate_gas({'from': SENDER_ACCOUNT}) * BATCH_GAS_HEADROOM)
+        tx_hash = transact(contract_call, gas)
+    CHAIN_SUBMIT_LATENCY.observe(time.perf_counter() - submit_start)
+    logger.info("Anomaly logs %d..%d (%d) sent. Tx Hash: %s", records[0]['log_id'], records[-1]['log_id'],
+                len(records), tx_hash.hex())
+    return tx_hash
+
+
+def get_anomaly_receipt(tx_hash):
+    """Returns the transaction receipt, or None if the transaction has not been mined yet."""
+    from web3.exceptions import TransactionNotFound
+    try:
+        return w3.eth.get_transaction_receipt(tx_hash)
+    except TransactionNotFound:
+        return None
+
+
+def resync_nonce():
+    if nonce_manager is not None:
+        nonce_manager.resync()
+
+
+# With the commitments layout the log queue's batches are the committed batches: anomalies are collected
+# for COMMIT_WINDOW_SECONDS (or until COMMIT_MAX_BATCH of them) and anchored with one transaction
+commitment_log = None
+if CONTRACT_LAYOUT == 'commitments':
+    commitment_log = CommitmentLog(os.environ.get('COMMITMENT_LOG_PATH', COMMITMENT_LOG_PATH))
+    log_batch_size = int(os.environ.get('COMMIT_MAX_BATCH', COMMIT_MAX_BATCH))
+    log_batch_interval_ms = int(float(os.environ.get('COMMIT_WINDOW_SECONDS', COMMIT_WINDOW_SECONDS)) * 1000)
+else:
+    log_batch_size = int(os.environ.get('LOG_BATCH_SIZE', LOG_BATCH_SIZE))
+    log_batch_interval_ms = int(os.environ.get('LOG_BATCH_INTERVAL_MS', LOG_BATCH_INTERVAL_MS))
+
+# Transactions are sent and tracked by a background worker so requests never wait for mining
+anomaly_log_queue = AnomalyLogQueue(
+    send_anomaly_transaction,
+    get_anomaly_receipt,
+    maxsize=int(os.environ.get('LOG_QUEUE_MAX_SIZE', LOG_QUEUE_MAX_SIZE)),
+    backpressure=os.environ.get('LOG_QUEUE_BACKPRESSURE', DEFAULT_BACKPRESSURE_POLICY),
+    on_transaction_lost=resync_nonce,
+    batch_size=log_batch_size,
+    batch_interval_ms=log_batch_interval_ms,
+    on_receipt=RECEIPT_WAIT_LATENCY.observe,
+    on_transaction_reverted=commitment_log.revoke if commitment_log else None,
+    log_ids=SharedLogIds(multiprocessing.Value('q', 0)) if SHARED_WORKER_STATE else None
+)
+
+
+def start_log_worker():
+    """Starts the thread that sends queued anomalies on-chain. Under gunicorn, each worker runs its own."""
+    anomaly_log_queue.start()
+
+
+def stop_log_worker(timeout=float(os.environ.get('LOG_DRAIN_TIMEOUT_SECONDS', LOG_DRAIN_TIMEOUT_SECONDS))):
+    """Sends the anomalies still queued, for at most `timeout` seconds, and stops the worker thread. Called on
+    exit: the thread is a daemon, so anything left in the queue would otherwise be lost silently."""
+    anomaly_log_queue.stop(timeout)
+
+
+# Detection workers are forked here, before this process starts any other thread
+sharded_detector = None
+if DETECTION_WORKERS and not SHARED_WORKER_STATE:
+    sharded_detector = ShardedDetector(
+        DETECTION_WORKERS,
+        anomaly_scorer,
+        LAG_FEATURES_COUNT,
+        FEATURES_PER_READING,
+        HISTORY_SNAPSHOT_PATH,
+        max_sensors=int(os.environ.get('MAX_TRACKED_SENSORS', MAX_TRACKED_SENSORS)) or None,
+        streaming_options=STREAMING_DETECTOR_OPTIONS if STREAMING_DETECTOR else None,
+        model_store=model_store,
+        model_sampler=model_sampler,
+        model_registry=model_registry,
+        on_batch=lambda features_seconds, score_seconds: (FEATURES_LATENCY.observe(features_seconds),
+                                                          SCORE_LATENCY.observe(score_seconds))
+    )
+    sharded_detector.start()
+    atexit.register(sharded_detector.stop)
+
+if not SHARED_WORKER_STATE:
+    if sharded_detector is None:
+        start_history_maintenance()
+    start_log_worker()
+    atexit.register(stop_log_worker)
+    start_model_refresh()
+
+
+def log_anomaly_on_blockchain(timestamp, sensor_id, data_value, anomaly_type, explanation, anomaly_score=None):
+    """Queues an anomaly for on-chain logging and returns its pending log ID (None if dropped).
+
+    `data_value` is the temperature reading; the legacy contract layout stores it rounded to an integer.
+    """
+    log_id = anomaly_log_queue.submit(timestamp, sensor_id, data_value, anomaly_type, explanation, anomaly_score)
+    if log_id is None:
+        logger.warning("❌ Anomaly log queue full (%s): dropped anomaly for %s", anomaly_log_queue.backpressure,
+                       sensor_id)
+    return log_id
+
+
+DEFAULT_ANOMALY_PAGE_SIZE = 100  # Page size for /anomalies when no limit is given
+MAX_ANOMALY_PAGE_SIZE = 1000  # Keeps a single /anomalies response and index query small
+
+
+# Anomaly history is read from a local SQLite copy of the AnomalyDetected events, not from the contract.
+# The index can be queried right away; connect_blockchain() attaches the node and starts the indexing thread.
+anomaly_indexer = AnomalyIndexer(
+    None,
+    None,
+    db_path=os.environ.get('ANOMALY_INDEX_DB_PATH', INDEX_DB_PATH),
+    start_block=int(os.environ.get('ANOMALY_INDEXER_START_BLOCK', INDEXER_START_BLOCK)),
+    event_fields=compact_event_fields if CONTRACT_LAYOUT == 'compact' else legacy_event_fields,
+    # A BatchCommitted event is indexed as the batch's records, read back from the commitment log
+    event_name='BatchCommitted' if commitment_log else 'AnomalyDetected',
+    event_rows=commitment_event_rows(commitment_log) if commitment_log else None
+)
 
-    except Exception as e:
-        print(f"❌ An error occurred during transaction: {e}")
-        print("Common issues: Ganache not running, incorrect contract address, insufficient gas.")
 
+# --- FEATURE & SCORING HELPERS ---
+MAX_BATCH_SIZE = 10000  # Upper bound on readings accepted by /sensor_data/batch
+REQUIRED_READING_KEYS = ['sensor_id', 'temperature', 'humidity', 'pressure']
+ANOMALY_STATUS_QUEUED = "Anomaly Detected: Logging Pending"
+ANOMALY_STATUS_DROPPED = "Anomaly Detected: Log Dropped (queue full)"
+INVALID_READING_VALUES = "temperature, humidity and pressure must be finite numbers"
+INVALID_SENSOR_ID = f"sensor_id must be a non-empty string of at most {MAX_SENSOR_ID_BYTES} bytes (UTF-8)"
 
-def get_all_anomalies_from_blockchain():
-    print("\n--- Fetching all anomalies from Blockchain ---")
+
+def valid_sensor_id(sensor_id):
+    """Sensor IDs key the history, routing and snapshots, so only non-empty strings short enough to be
+    snapshotted whole are accepted."""
+    if not isinstance(sensor_id, str):
+        return False
+    try:
+        return 0 < len(sensor_id.encode('utf-8')) <= MAX_SENSOR_ID_BYTES
+    except UnicodeEncodeError:  # Lone surrogates, which JSON allows
+        return False
+
+
+def parse_reading_values(reading):
+    """(temperature, humidity, pressure) of a reading as floats, or None unless all three are finite numbers.
+    JSON booleans are not numbers here, although float() would take them as 0 and 1."""
+    raw = (reading['temperature'], reading['humidity'], reading['pressure'])
+    if any(isinstance(value, bool) for value in raw):
+        return None
     try:
-        anomalies = contract.functions.getAllAnomalies().call()
-        if anomalies:
-            print(f"Found {len(anomalies)} anomalies:")
-            for i, anomaly in enumerate(anomalies):
-                print(f"Anomaly {i + 1}:")
-                print(f"  Timestamp: {anomaly[0]} ({datetime.datetime.fromtimestamp(anomaly[0])})")
-                print(f"  Sensor ID: {anomaly[1]}")
-                print(f"  Value: {anomaly[2]}")
-                print(f"  Type: {anomaly[3]}")
-                print(f"  Explanation: {anomaly[4]}")
+        values = tuple(float(value) for value in raw)
+    except (TypeError, ValueError):
+        return None
+    return values if all(math.isfinite(value) for value in values) else None
+
+
+def score_features(features, sensor_ids):
+    """Scores a (N, TOTAL_FEATURES_FOR_MODEL) matrix of readings of `sensor_ids` with one forest traversal per model.
+
+    Returns (anomaly_scores, predictions, model_keys, model_versions). Scores equal the scoring model's
+    decision_function; predictions follow IsolationForest.predict: -1 for anomaly (negative decision score),
+    1 for normal. With MODEL_REGISTRY a reading is scored by its sensor's profile model if there is one;
+    otherwise, and without the registry, by the global model, whose key is 'default'.
+    """
+    scorer = anomaly_scorer  # Read once: a concurrent swap_model() does not change the model mid-call
+    with SCORE_LATENCY.time():
+        if model_registry is not None:
+            anomaly_scores, model_keys, model_versions = model_registry.score(sensor_ids, features, scorer)
         else:
-            print("No anomalies logged on the blockchain yet.")
-    except Exception as e:
-        print(f"❌ Error fetching anomalies: {e}")
-        print("Ensure the contract is deployed and you have the correct ABI/Address.")
+            anomaly_scores = scorer.decision_function(features)
+            model_keys = [DEFAULT_MODEL_KEY] * len(anomaly_scores)
+            model_versions = np.full(len(anomaly_scores), scorer.version, dtype=np.int64)
+        predictions = np.where(anomaly_scores < 0, -1, 1)
+    return anomaly_scores, predictions, model_keys, model_versions
+
+
+def detect_readings(sensor_ids, values):
+    """Appends (N, FEATURES_PER_READING) readings to their sensors' histories and scores every full lag window.
+
+    Returns (counts, anomaly_scores, predictions, model_keys, model_versions) in input order: the readings
+    each sensor held after the reading was appended, and its score, prediction and the key and version of the
+    model that scored it, which are NaN, 0, None and -1 where the window was not full yet. Readings cleared by
+    the streaming detector have prediction 1, a NaN score, no key and version -1. Raises ValueError if the
+    readings come from more sensors than can be tracked.
+    """
+    if sharded_detector is not None:
+        counts, anomaly_scores, predictions, model_keys, model_versions = sharded_detector.detect(sensor_ids, values)
+        STREAMING_SCREENED.inc(int(np.count_nonzero((predictions == 1) & np.isnan(anomaly_scores))))
+        return counts, anomaly_scores, predictions, model_keys, model_versions
+    flagged = np.ones(len(sensor_ids), dtype=bool)
+
+    def screen(positions, rows, round_values, round_counts):
+        flagged[positions] = streaming_detector.update(rows, round_values, round_counts)
+
+    with FEATURES_LATENCY.time():
+        counts, windows = sensor_data_history.append_readings(
+            sensor_ids, values, on_round=screen if streaming_detector is not None else None)
+    ready = counts >= LAG_FEATURES_COUNT
+    anomaly_scores = np.full(len(counts), np.nan)
+    predictions = np.zeros(len(counts), dtype=np.int64)
+    model_keys = [None] * len(counts)
+    model_versions = np.full(len(counts), -1, dtype=np.int64)
+    predictions[ready] = 1
+    score = ready & flagged
+    STREAMING_SCREENED.inc(int(np.count_nonzero(ready)) - int(np.count_nonzero(score)))
+    if score.any():
+        scored = np.flatnonzero(score)
+        anomaly_scores[score], predictions[score], scored_keys, model_versions[score] = score_features(
+            build_feature_batch(windows[score]), [sensor_ids[i] for i in scored])
+        for i, key in zip(scored, scored_keys):
+            model_keys[i] = key
+    if model_sampler is not None and ready.any():
+        # Readings the streaming detector cleared are predicted normal too, and follow the sensors' baselines
+        model_sampler.observe([sensor_ids[i] for i in np.flatnonzero(ready)], build_feature_batch(windows[ready]),
+                              predictions[ready] == -1)
+    return counts, anomaly_scores, predictions, model_keys, model_versions
+
+
+def build_anomaly_explanation(anomaly_score, temperature, humidity, pressure):
+    return (f"Detected via Isolation Forest (Score: {anomaly_score:.2f}). "
+            f"Current: Temp={temperature}, Humidity={humidity}, Pressure={pressure}. "
+            f"Contextual change based on recent readings.")
 
 
 # --- FLASK APPLICATION ---
 app = Flask(__name__)
 
 
+def check_production_config():
+    """Raises RuntimeError if the app is configured in a way that must not serve production traffic."""
+    if app.debug:
+        raise RuntimeError("Flask debug mode is enabled; it runs the interactive debugger and must not be "
+                           "served by gunicorn. Unset FLASK_DEBUG.")
+    if DETECTION_WORKERS and SHARED_WORKER_STATE:
+        raise RuntimeError("DETECTION_WORKERS needs a single front-end process; under gunicorn, sensor history "
+                           "is already shared by the web workers. Unset DETECTION_WORKERS.")
+
+
+_connect_thread = None
+_connect_thread_lock = threading.Lock()
+
+
+def _connect_in_background():
+    try:
+        connect_blockchain()
+    except ConnectionError:
+        pass  # Logged by connect_blockchain; anomaly logs fail and it is tried again on later requests
+
+
+@app.before_request
+def ensure_blockchain_connected():
+    """Starts connecting to the chain on the first request. Requests never wait for it, so scoring keeps
+    working at full speed while the node is slow or unreachable."""
+    global _connect_thread
+    if contract is None and (_blockchain_failed_at is None
+                             or time.monotonic() - _blockchain_failed_at >= BLOCKCHAIN_RETRY_SECONDS):
+        with _connect_thread_lock:
+            if _connect_thread is None or not _connect_thread.is_alive():
+                _connect_thread = threading.Thread(target=_connect_in_background, name="blockchain-connect",
+                                                   daemon=True)
+                _connect_thread.start()
+
+
 @app.route('/sensor_data', methods=['POST'])
 def receive_sensor_data():
+    parse_start = time.perf_counter()
     data = request.json
+    READINGS_RECEIVED_SINGLE.inc()
     if not data:
+        READINGS_REJECTED_SINGLE.inc()
         return jsonify({"error": "No JSON data received"}), 400
 
-    required_keys = ['sensor_id', 'temperature', 'humidity', 'pressure']
-    if not all(key in data for key in required_keys):
-        return jsonify({"error": f"Missing required data fields. Expected: {required_keys}"}), 400
+    if not all(key in data for key in REQUIRED_READING_KEYS):
+        READINGS_REJECTED_SINGLE.inc()
+        return jsonify({"error": f"Missing required data fields. Expected: {REQUIRED_READING_KEYS}"}), 400
 
     sensor_id = data.get('sensor_id')
-    temperature = data.get('temperature')
-    humidity = data.get('humidity')
-    pressure = data.get('pressure')
+    if not valid_sensor_id(sensor_id):
+        READINGS_REJECTED_SINGLE.inc()
+        return jsonify({"error": INVALID_SENSOR_ID}), 400
+    current_reading = parse_reading_values(data)
+    if current_reading is None:
+        READINGS_REJECTED_SINGLE.inc()
+        return jsonify({"error": INVALID_READING_VALUES}), 400
+    temperature, humidity, pressure = current_reading
     current_timestamp = int(time.time())
-
-    # --- NEW: Update History and Prepare Lagged Features ---
-    if sensor_id not in sensor_data_history:
-        # Initialize deque if first time for this sensor
-        sensor_data_history[sensor_id] = deque(maxlen=MAX_HISTORY_LENGTH)
-
-    # Add current reading to history (as a tuple)
-    current_reading = (temperature, humidity, pressure)
-    sensor_data_history[sensor_id].append(current_reading)
-
-    # We need at least LAG_FEATURES_COUNT readings to form the feature vector
-    if len(sensor_data_history[sensor_id]) < LAG_FEATURES_COUNT:
-        print(
-            f"INFO: Not enough history for {sensor_id}. Current count: {len(sensor_data_history[sensor_id])}. Need {LAG_FEATURES_COUNT}.")
-        return jsonify({
-            "status": "Data received: Building history",
-            "sensor_id": sensor_id,
-            "data": data,
-            "timestamp": current_timestamp
-        }), 200
-
-    # Create the lagged feature vector
-    # recent_readings will contain the current reading and LAG_FEATURES_COUNT-1 previous readings
-    # Example for LAG_FEATURES_COUNT = 3:
-    # recent_readings = [(T_curr,H_curr,P_curr), (T_lag1,H_lag1,P_lag1), (T_lag2,H_lag2,P_lag2)]
-
-    # Get the items directly from the deque, they are already in order of oldest to newest
-    # We need them in order of newest to oldest for the feature vector
-    ordered_readings = list(sensor_data_history[sensor_id])  # Convert deque to list
-
-    # Flatten the list of tuples into a single numpy array
-    # This loop ensures the order is [current_T, current_H, current_P, lag1_T, lag1_H, lag1_P, ...]
-    # by iterating through the list in reverse order (to get newest first)
-    flat_features = []
-    for reading_tuple in reversed(ordered_readings):  # Iterate in reverse for (current, lag1, lag2...)
-        flat_features.extend(reading_tuple)
-
-    features = np.array([flat_features])  # Reshape to (1, num_features) for model.predict
-
-    # Ensure the feature vector has the correct number of dimensions for the model
-    if features.shape[1] != TOTAL_FEATURES_FOR_MODEL:
-        print(f"ERROR: Feature vector dimension mismatch. Expected {TOTAL_FEATURES_FOR_MODEL}, got {features.shape[1]}")
-        return jsonify({"error": "Internal feature processing error: Dimension mismatch"}), 500
+    PARSE_LATENCY.observe(time.perf_counter() - parse_start)
 
     try:
-        # Predict if it's an anomaly: -1 for anomaly, 1 for normal
-        prediction = anomaly_model.predict(features)
-        anomaly_score = anomaly_model.decision_function(features)[0]  # Get decision score for context
+        # Update History and Prepare Lagged Features
+        if sharded_detector is not None:
+            features = None  # Built and scored by the sensor's detection worker
+            counts, anomaly_scores, predictions, model_keys, model_versions = sharded_detector.detect(
+                [sensor_id], [current_reading])
+            history_count = int(counts[0])
+            screened = predictions[0] == 1 and np.isnan(anomaly_scores[0])
+        else:
+            features = np.empty((1, TOTAL_FEATURES_FOR_MODEL))
+            with FEATURES_LATENCY.time(), sensor_data_history.lock:
+                row, history_count = sensor_data_history.append(sensor_id, current_reading)
+                # Every reading updates the sensor's streaming baseline; only flagged ones reach the forest
+                screened = streaming_detector is not None and not streaming_detector.update_one(
+                    row, current_reading, history_count)
+                if history_count >= LAG_FEATURES_COUNT and (not screened or model_sampler is not None):
+                    build_feature_row(sensor_data_history.readings(row), out=features[0])
+
+        # We need at least LAG_FEATURES_COUNT readings to form the feature vector
+        if history_count < LAG_FEATURES_COUNT:
+            HISTORY_BUILDING_SKIPS.inc()
+            logger.debug("Not enough history for %s. Current count: %d. Need %d.", sensor_id, history_count,
+                         LAG_FEATURES_COUNT)
+            return jsonify({
+                "status": "Data received: Building history",
+                "sensor_id": sensor_id,
+                "data": data,
+                "timestamp": current_timestamp
+            }), 200
+
+        if screened:
+            STREAMING_SCREENED.inc()
+            if model_sampler is not None and features is not None:
+                model_sampler.observe_one(sensor_id, features[0], False)
+            logger.debug("✔️ Normal data received for %s: Current: %s, cleared by the streaming detector",
+                         sensor_id, current_reading)
+            return jsonify({
+                "status": "Data Processed: No Anomaly",
+                "sensor_id": sensor_id,
+                "data": data,
+                "timestamp": current_timestamp,
+                "anomaly_score": None,
+                "screened": True
+            }), 200
+
+        # A single forest traversal gives both the score and the prediction
+        if sharded_detector is None:
+            anomaly_scores, predictions, model_keys, model_versions = score_features(features, [sensor_id])
+            if model_sampler is not None:
+                model_sampler.observe_one(sensor_id, features[0], predictions[0] == -1)
+        anomaly_score = float(anomaly_scores[0])
+        prediction = predictions[0]
+        model_key = model_keys[0]
+        model_version = int(model_versions[0])
 
-        print(
-            f"DEBUG: Data Point (Current): {current_reading}, Lagged Features: {features[0]}, Anomaly Score: {anomaly_score:.4f}, Prediction: {prediction[0]}")
+        logger.debug("Data Point (Current): %s, Lagged Features: %s, Anomaly Score: %.4f, Prediction: %s, "
+                     "Model: %s version %d", current_reading, features[0] if features is not None else None,
+                     anomaly_score, prediction, model_key, model_version)
 
         if prediction == -1:
             # Anomaly detected! Log to blockchain
             anomaly_type = "Environmental Anomaly (Time Series)"
-            explanation = (f"Detected via Isolation Forest (Score: {anomaly_score:.2f}). "
-                           f"Current: Temp={temperature}, Humidity={humidity}, Pressure={pressure}. "
-                           f"Contextual change based on recent readings.")
-            print(f"❗ ANOMALY DETECTED for {sensor_id}!")
-            temperature_for_blockchain = int(round(temperature))
-            log_anomaly_on_blockchain(current_timestamp, sensor_id, temperature_for_blockchain, anomaly_type,
-                                      explanation)
+            explanation = build_anomaly_explanation(anomaly_score, temperature, humidity, pressure)
+            ANOMALIES_DETECTED.inc()
+            logger.info("❗ ANOMALY DETECTED for %s (model %s version %d)!", sensor_id, model_key, model_version,
+                        extra={"sensor_id": sensor_id, "anomaly_score": anomaly_score, "model": model_key,
+                               "model_version": model_version})
+            log_id = log_anomaly_on_blockchain(current_timestamp, sensor_id, temperature, anomaly_type, explanation,
+                                               anomaly_score)
 
             return jsonify({
-                "status": "Anomaly Detected and Logged",
+                "status": ANOMALY_STATUS_QUEUED if log_id is not None else ANOMALY_STATUS_DROPPED,
                 "sensor_id": sensor_id,
                 "data": data,
                 "timestamp": current_timestamp,
-                "anomaly_score": anomaly_score
+                "anomaly_score": anomaly_score,
+                "model": model_key,
+                "model_version": model_version,
+                "log_id": log_id
             }), 200
         else:
-            print(f"✔️ Normal data received for {sensor_id}: Current: {current_reading}, Score: {anomaly_score:.4f}")
+            logger.debug("✔️ Normal data received for %s: Current: %s, Score: %.4f", sensor_id, current_reading,
+                         anomaly_score)
             return jsonify({
                 "status": "Data Processed: No Anomaly",
                 "sensor_id": sensor_id,
                 "data": data,
                 "timestamp": current_timestamp,
-                "anomaly_score": anomaly_score
+                "anomaly_score": anomaly_score,
+                "model": model_key,
+                "model_version": model_version
             }), 200
 
+    except (WorkerUnavailable, TimeoutError) as e:
+        logger.error("❌ Anomaly detection unavailable: %s", e)
+        return jsonify({"error": f"Detection unavailable, retry shortly: {e}"}), 503
+    except Exception as e:
+        logger.error("❌ Error during anomaly detection or logging: %s", e)
+        return jsonify({"error": f"Processing failed: {e}"}), 500
+
+
+@app.route('/sensor_data/batch', methods=['POST'])
+def receive_sensor_data_batch():
+    """Accepts a JSON list of readings (or {"readings": [...]}) from any number of sensors.
+
+    Readings are applied to each sensor's history in input order, every reading with a full lag
+    window is scored in one vectorized call, and results are returned in input order.
+    """
+    parse_start = time.perf_counter()
+    data = request.json
+    readings = data.get('readings') if isinstance(data, dict) else data
+    if not isinstance(readings, list) or not readings:
+        return jsonify({"error": "Expected a non-empty JSON list of readings"}), 400
+    READINGS_RECEIVED_BATCH.inc(len(readings))
+    if len(readings) > MAX_BATCH_SIZE:
+        READINGS_REJECTED_BATCH.inc(len(readings))
+        return jsonify({"error": f"Batch too large: {len(readings)} readings (max {MAX_BATCH_SIZE})"}), 413
+
+    current_timestamp = int(time.time())
+    results = [None] * len(readings)
+    valid_positions, sensor_ids, values = [], [], []
+    for position, reading in enumerate(readings):
+        if not isinstance(reading, dict) or not all(key in reading for key in REQUIRED_READING_KEYS):
+            results[position] = {"error": f"Missing required data fields. Expected: {REQUIRED_READING_KEYS}"}
+            continue
+        if not valid_sensor_id(reading['sensor_id']):
+            results[position] = {"error": INVALID_SENSOR_ID}
+            continue
+        value = parse_reading_values(reading)
+        if value is None:
+            results[position] = {"error": INVALID_READING_VALUES}
+            continue
+        valid_positions.append(position)
+        sensor_ids.append(reading['sensor_id'])
+        values.append(value)
+
+    valid_positions = np.array(valid_positions, dtype=np.int64)
+    values = np.array(values, dtype=np.float64).reshape(-1, FEATURES_PER_READING)
+    PARSE_LATENCY.observe(time.perf_counter() - parse_start)
+
+    try:
+        counts, anomaly_scores, predictions, model_keys, model_versions = detect_readings(sensor_ids, values)
+    except ValueError as e:
+        # More distinct sensors than can be tracked: rows of earlier sensors would be reused before scoring
+        READINGS_REJECTED_BATCH.inc(len(readings))
+        return jsonify({"error": f"Batch has {e}"}), 413
+    except (WorkerUnavailable, TimeoutError) as e:
+        logger.error("❌ Batch anomaly detection unavailable: %s", e)
+        return jsonify({"error": f"Detection unavailable, retry shortly: {e}"}), 503
     except Exception as e:
-        print(f"❌ Error during anomaly detection or logging: {e}")
+        logger.error("❌ Error during batch anomaly detection: %s", e)
         return jsonify({"error": f"Processing failed: {e}"}), 500
+    READINGS_REJECTED_BATCH.inc(len(readings) - len(valid_positions))
+
+    ready = counts >= LAG_FEATURES_COUNT
+    for index in np.flatnonzero(~ready):
+        position = valid_positions[index]
+        results[position] = {"status": "Data received: Building history", "sensor_id": readings[position]['sensor_id']}
+    scored_positions = valid_positions[ready]
+    anomaly_scores, predictions, model_versions = anomaly_scores[ready], predictions[ready], model_versions[ready]
+    model_keys = [model_keys[index] for index in np.flatnonzero(ready)]
+    HISTORY_BUILDING_SKIPS.inc(len(valid_positions) - len(scored_positions))
+
+    anomalies_detected = 0
+    if len(scored_positions):
+        for row, position in enumerate(scored_positions):
+            reading = readings[position]
+            anomaly_score = float(anomaly_scores[row])
+            if np.isnan(anomaly_score):  # Cleared by the streaming detector
+                results[position] = {"sensor_id": reading['sensor_id'], "anomaly_score": None, "screened": True,
+                                     "status": "Data Processed: No Anomaly"}
+                continue
+            result = {"sensor_id": reading['sensor_id'], "anomaly_score": anomaly_score,
+                      "model": model_keys[row], "model_version": int(model_versions[row])}
+            if predictions[row] == -1:
+                anomalies_detected += 1
+                explanation = build_anomaly_explanation(
+                    anomaly_score, reading['temperature'], reading['humidity'], reading['pressure'])
+                log_id = log_anomaly_on_blockchain(current_timestamp, reading['sensor_id'], float(reading['temperature']),
+                                                   "Environmental Anomaly (Time Series)", explanation, anomaly_score)
+                result["status"] = ANOMALY_STATUS_QUEUED if log_id is not None else ANOMALY_STATUS_DROPPED
+                result["log_id"] = log_id
+            else:
+                result["status"] = "Data Processed: No Anomaly"
+            results[position] = result
+
+    ANOMALIES_DETECTED.inc(anomalies_detected)
+    logger.debug("Batch of %d readings processed: %d scored, %d anomalies.", len(readings), len(scored_positions),
+                 anomalies_detected)
+    return jsonify({
+        "timestamp": current_timestamp,
+        "received": len(readings),
+        "scored": len(scored_positions),
+        "anomalies": anomalies_detected,
+        "results": results
+    }), 200
+
+
+def parse_optional_int(name):
+    value = request.args.get(name)
+    return int(value) if value else None
 
 
 @app.route('/anomalies', methods=['GET'])
 def get_anomalies():
+    """One page of logged anomalies, served from the local event index.
+
+    Query parameters: sensor_id (only that sensor's anomalies), since / until (unix timestamp range,
+    until exclusive), since_index (only anomalies after that on-chain position, ordered by position),
+    order (asc or desc by timestamp, default asc), offset and limit (page position and size, limit
+    capped at MAX_ANOMALY_PAGE_SIZE). The body stays a JSON list; the matching total is returned in the
+    X-Total-Count header, the newest indexed position in X-Last-Index and the number of reorg rewinds in
+    X-Index-Rewinds (a client caching rows must refetch them when it changes).
+
+    The ETag changes only when the index changes, so a client that sends If-None-Match gets a 304 with
+    no body (and no database query) until a new anomaly has been indexed.
+    """
+    etag = anomaly_indexer.version()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    sensor_id = request.args.get('sensor_id') or None
+    order = request.args.get('order', 'asc')
     try:
-        anomalies_list = contract.functions.getAllAnomalies().call()
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', DEFAULT_ANOMALY_PAGE_SIZE))
+        since = parse_optional_int('since')
+        until = parse_optional_int('until')
+        since_index = parse_optional_int('since_index')
+    except ValueError:
+        return jsonify({"error": "offset, limit, since, until and since_index must be integers"}), 400
+    if offset < 0 or limit < 1:
+        return jsonify({"error": "offset must be >= 0 and limit must be >= 1"}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({"error": "order must be 'asc' or 'desc'"}), 400
+    limit = min(limit, MAX_ANOMALY_PAGE_SIZE)
+
+    try:
+        total, rows = anomaly_indexer.query_anomalies(sensor_id=sensor_id, since=since, until=until,
+                                                      offset=offset, limit=limit, order=order,
+                                                      since_index=since_index)
         formatted_anomalies = []
-        for anomaly in anomalies_list:
+        for row in rows:
             formatted_anomalies.append({
-                "timestamp": anomaly[0],
-                "datetime": datetime.datetime.fromtimestamp(anomaly[0]).isoformat(),
-                "sensor_id": anomaly[1],
-                "data_value": anomaly[2],
-                "anomaly_type": anomaly[3],
-                "explanation": anomaly[4]
+                "timestamp": row["timestamp"],
+                "datetime": datetime.datetime.fromtimestamp(row["timestamp"]).isoformat(),
+                "sensor_id": row["sensor_id"],
+                "data_value": row["data_value"],
+                "anomaly_type": row["anomaly_type"],
+                "explanation": row["explanation"],
+                "anomaly_index": row["anomaly_index"],
+                "block_number": row["block_number"],
+                "tx_hash": row["tx_hash"]
             })
-        return jsonify(formatted_anomalies), 200
+        response = jsonify(formatted_anomalies)
+        response.headers['X-Total-Count'] = str(total)
+        response.headers['X-Offset'] = str(offset)
+        response.headers['X-Limit'] = str(limit)
+        last_index = anomaly_indexer.last_anomaly_index()
+        if last_index is not None:
+            response.headers['X-Last-Index'] = str(last_index)
+        response.headers['X-Index-Rewinds'] = str(anomaly_indexer.rewinds())
+        response.set_etag(etag)
+        return response, 200
     except Exception as e:
-        print(f"❌ Error fetching anomalies for API: {e}")
+        logger.error("❌ Error fetching anomalies for API: %s", e)
         return jsonify({"error": f"Could not fetch anomalies: {e}"}), 500
 
 
+@app.route('/anomalies/summary', methods=['GET'])
+def get_anomaly_summary():
+    """Per-sensor anomaly counts from the local event index, optionally limited to ?since=<timestamp>."""
+    try:
+        since = parse_optional_int('since')
+    except ValueError:
+        return jsonify({"error": "since must be an integer"}), 400
+    return jsonify({"indexer": anomaly_indexer.status(), "sensors": anomaly_indexer.summarize_by_sensor(since)}), 200
+
+
+@app.route('/history/stats', methods=['GET'])
+def get_history_stats():
+    """Tracked sensor count, evictions and estimated memory of the in-memory sensor history (per shard in pipeline mode)."""
+    return jsonify(sharded_detector.stats() if sharded_detector else sensor_data_history.stats()), 200
+
+
+@app.route('/anomalies/log_status', methods=['GET'])
+def get_anomaly_log_stats():
+    """Queue depth plus pending, mined, failed and dropped transaction counts for monitoring."""
+    return jsonify(anomaly_log_queue.stats()), 200
+
+
+@app.route('/anomalies/log_status/<int:log_id>', methods=['GET'])
+def get_anomaly_log_status(log_id):
+    status = anomaly_log_queue.status(log_id)
+    if status is None:
+        return jsonify({"error": f"Unknown or expired log ID: {log_id}"}), 404
+    return jsonify({"log_id": log_id, "status": status}), 200
+
+
+def check_inclusion(encoding, proof, root):
+    """Verifies a record encoding's inclusion proof locally and against the AnomalyCommitments contract.
+
+    verified_on_chain is the contract's verifyInclusion() result: the root is committed and the proof
+    leads to it. It and committed_block are None when the node cannot be reached.
+    """
+    result = {
+        "verified_locally": verify_proof(leaf_hash(encoding), proof, root),
+        "verified_on_chain": None,
+        "committed_block": None
+    }
+    try:
+        functions = connect_blockchain().functions
+        verified = functions.verifyInclusion(root, encoding, proof).call()
+        count, _, _, block_number = functions.commitments(root).call()
+        result["verified_on_chain"], result["committed_block"] = verified, block_number if count else None
+    except Exception as e:
+        logger.warning("❗ Could not check commitment %s on-chain: %s", '0x' + root.hex(), e)
+    return result
+
+
+@app.route('/anomalies/<int:anomaly_index>/proof', methods=['GET'])
+def get_anomaly_proof(anomaly_index):
+    """Merkle inclusion proof of a committed anomaly (commitments layout), verified against its on-chain root.
+
+    Returns the stored record, its canonical encoding and leaf hash, the sibling hashes up to the batch
+    root and the check_inclusion() results. anomaly_index is the index /anomalies reports.
+    """
+    if commitment_log is None:
+        return jsonify({"error": "Inclusion proofs are only available with CONTRACT_LAYOUT=commitments"}), 404
+    document = commitment_log.proof(anomaly_index)
+    if document is None:
+        return jsonify({"error": f"Anomaly {anomaly_index} is not in a committed batch"}), 404
+    document.update(check_inclusion(*parse_proof(document["encoding"], document["proof"], document["root"])))
+    return jsonify(document), 200
+
+
+@app.route('/anomalies/proof/verify', methods=['POST'])
+def verify_anomaly_proof():
+    """Verifies a proof held by the client: a JSON body with the encoding, proof and root of a /proof response."""
+    if commitment_log is None:
+        return jsonify({"error": "Inclusion proofs are only available with CONTRACT_LAYOUT=commitments"}), 404
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object with encoding, proof and root"}), 400
+    try:
+        encoding, proof, root = parse_proof(data.get('encoding'), data.get('proof'), data.get('root'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(check_inclusion(encoding, proof, root)), 200
+
+
+@app.route('/model', methods=['GET'])
+def get_model_status():
+    """Version of the model this process scores with and, with MODEL_REFRESH, the published versions and sample;
+    with MODEL_REGISTRY, the profile models and this process's cache of them."""
+    status = {"model_version": anomaly_scorer.version, "trees": anomaly_scorer.n_trees, "refresh": MODEL_REFRESH}
+    if model_store is not None:
+        status.update(store=model_store.stats(), sample=model_sampler.stats())
+    if model_registry is not None:
+        status.update(registry={**model_registry.stats(), "keys": model_registry.keys()})
+    return jsonify(status), 200
+
+
+@app.route('/model/refresh', methods=['POST'])
+def request_model_refresh():
+    """Asks the refresher to train a new version from the current sample on its next check."""
+    if model_sampler is None:
+        return jsonify({"error": "Model refresh is only available with MODEL_REFRESH=1"}), 404
+    model_sampler.request_refresh()
+    return jsonify({"status": "Model refresh requested", "model_version": anomaly_scorer.version}), 202
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Reading counters, stage latency histograms, tracked sensors and log queue depth for Prometheus."""
+    return app.response_class(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE), 200
+
+
 if __name__ == "__main__":
-    print("\nStarting IoT Anomaly Detection Backend...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    try:
+        connect_blockchain()
+    except ConnectionError:
+        exit()
+    logger.info("Starting IoT Anomaly Detection Backend...")
+    # The reloader would import this module again in a second process, forking a second set of detection workers
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=not DETECTION_WORKERS)
\ No newline at end of file
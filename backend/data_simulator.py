@@ -2,7 +2,6 @@
 import requests
 import time
 import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
 import random
 
@@ -81,6 +80,7 @@ def inject_anomaly(temp, hum, pres, anomaly_type):
 # --- Simulation Logic ---
 
 def run_simulation():
+    # One reading per sensor every interval, for watching the dashboard; for capacity testing use load_generator.py
     print(f"Starting sensor data simulation. Sending to {FLASK_BACKEND_URL}")
     print(f"Interval: {SIMULATION_INTERVAL_SECONDS}s, Duration: {SIMULATION_DURATION_SECONDS / 60} minutes")
 
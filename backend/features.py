@@ -0,0 +1,61 @@
+# features.py
+# The one definition of the model's lag-feature layout, used for training data, online scoring and replays.
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# --- CONFIGURATION ---
+READING_FIELDS = ('temperature', 'humidity', 'pressure')
+FEATURES_PER_READING = len(READING_FIELDS)
+LAG_FEATURES_COUNT = 3  # Current reading + 2 previous readings. So, 3 readings total.
+TOTAL_FEATURES_FOR_MODEL = FEATURES_PER_READING * LAG_FEATURES_COUNT
+FEATURE_SCHEMA_VERSION = 1
+
+# Column order of every feature row: oldest reading first, each reading as (temperature, humidity, pressure).
+# `lag2` is the reading two steps before the current one, `lag0` is the current reading.
+FEATURE_COLUMNS = tuple(f"{field}_lag{lag}"
+                        for lag in range(LAG_FEATURES_COUNT - 1, -1, -1)
+                        for field in READING_FIELDS)
+
+
+def feature_schema():
+    """The schema stored alongside a trained model."""
+    return {"version": FEATURE_SCHEMA_VERSION, "columns": list(FEATURE_COLUMNS)}
+
+
+def check_feature_schema(schema):
+    """Raises ValueError if a model's stored schema does not match the features built here."""
+    if schema is None:
+        raise ValueError("Model has no feature schema; re-export it from a model trained with model_training.py")
+    if schema.get("version") != FEATURE_SCHEMA_VERSION or list(schema.get("columns", [])) != list(FEATURE_COLUMNS):
+        raise ValueError(f"Model was trained on columns {schema.get('columns')} (schema v{schema.get('version')}), "
+                         f"but features are built as {list(FEATURE_COLUMNS)} (schema v{FEATURE_SCHEMA_VERSION})")
+
+
+def build_feature_row(window_readings, out):
+    """Writes one feature row into the preallocated `out` (TOTAL_FEATURES_FOR_MODEL,).
+
+    `window_readings` is (LAG_FEATURES_COUNT, FEATURES_PER_READING), oldest reading first.
+    """
+    out[:] = np.reshape(window_readings, TOTAL_FEATURES_FOR_MODEL)
+    return out
+
+
+def build_feature_batch(windows, out=None):
+    """(N, TOTAL_FEATURES_FOR_MODEL) rows from N windows shaped (N, LAG_FEATURES_COUNT, FEATURES_PER_READING),
+    each oldest reading first."""
+    rows = np.reshape(windows, (-1, TOTAL_FEATURES_FOR_MODEL))
+    if out is None:
+        return rows
+    out[:] = rows
+    return out
+
+
+def lagged_rows(readings):
+    """Every full window of a (steps, sensors, FEATURES_PER_READING) series in time order.
+
+    Returns ((steps - LAG_FEATURES_COUNT + 1) * sensors, TOTAL_FEATURES_FOR_MODEL) rows, ordered by the
+    time of their newest reading, then by sensor.
+    """
+    # (windows, sensors, features, lags) -> (windows, sensors, lags, features)
+    windows = sliding_window_view(readings, LAG_FEATURES_COUNT, axis=0).transpose(0, 1, 3, 2)
+    return build_feature_batch(windows)
@@ -0,0 +1,207 @@
+# forest_scorer.py
+# Scores samples against a trained IsolationForest using flat NumPy arrays instead of sklearn's per-call machinery.
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+LEAF = -1  # sklearn's marker for "no child" in tree_.children_left / children_right
+
+# --- CONFIGURATION ---
+SCORING_CHUNK_ROWS = 128  # Rows traversed together; keeps the (rows x trees) work buffers in CPU cache
+
+MODEL_FORMAT_VERSION = 2  # 2: meta.json carries the feature schema
+MODEL_META_FILE = 'meta.json'
+ARRAY_NAMES = ('feature', 'threshold', 'children', 'leaf_path_length', 'roots')
+
+
+def average_path_length(n_samples):
+    """Average path length of an unsuccessful BST search in a tree built from `n_samples` points (same as sklearn)."""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+    result[n_samples == 2] = 1.0
+    mask = n_samples > 2
+    n = n_samples[mask]
+    result[mask] = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+    return result
+
+
+def _node_depths(children_left, children_right):
+    """Depth of every node, counting the root as 1 like sklearn's compute_node_depths()."""
+    depths = np.zeros(len(children_left), dtype=np.float64)
+    depths[0] = 1
+    for node in range(len(children_left)):  # Children are always stored after their parent
+        if children_left[node] != LEAF:
+            depths[children_left[node]] = depths[node] + 1
+            depths[children_right[node]] = depths[node] + 1
+    return depths
+
+
+class FlatIsolationForest:
+    """All trees of an IsolationForest packed into one set of node arrays.
+
+    Every node of every tree lives in the same `feature`, `threshold` and `children` arrays.
+    Leaves point to themselves, so all samples can walk all trees for `max_depth` steps with no
+    per-tree loop and no branching. `leaf_path_length` holds each leaf's depth plus the average path
+    length adjustment for the training samples that ended there. Scores match
+    IsolationForest.decision_function, including its float32 cast of the input. `feature_schema`
+    (see features.py) records the column layout the forest was trained on and is saved with it, and so
+    is `version` (0 for the model exported from the joblib file, then 1, 2, ... per refresh).
+    """
+
+    def __init__(self, feature, threshold, children, leaf_path_length, roots, max_depth, n_features,
+                 max_samples, offset, feature_schema=None, version=0):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.leaf_path_length = leaf_path_length
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self.n_trees = len(roots)
+        self.offset = offset
+        self.max_samples = max_samples
+        self.feature_schema = feature_schema
+        self.version = version
+        self.normalizer = self.n_trees * float(average_path_length([max_samples])[0])
+        self._scratch = threading.local()  # Per-thread work buffers, reused across calls
+
+    @classmethod
+    def from_model(cls, model, feature_schema=None, version=0):
+        """Extracts the trees of a fitted sklearn IsolationForest."""
+        n_features = model.n_features_in_
+        subsample_features = model._max_features != n_features  # Same test sklearn uses when scoring
+        features, thresholds, lefts, rights, path_lengths, roots = [], [], [], [], [], []
+        max_depth, base = 0, 0
+        for estimator, estimator_features in zip(model.estimators_, model.estimators_features_):
+            tree = estimator.tree_
+            is_leaf = tree.children_left == LEAF
+            node_ids = np.arange(tree.node_count)
+
+            feature = np.where(is_leaf, 0, tree.feature)
+            if subsample_features:  # Tree feature indices refer to this estimator's feature subset
+                feature = np.asarray(estimator_features)[feature]
+            features.append(feature)
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + base)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + base)
+            path_lengths.append(_node_depths(tree.children_left, tree.children_right)
+                                + average_path_length(tree.n_node_samples) - 1.0)
+            roots.append(base)
+            max_depth = max(max_depth, tree.max_depth)
+            base += tree.node_count
+
+        children = np.stack([np.concatenate(lefts), np.concatenate(rights)], axis=1).reshape(-1)
+        return cls(np.concatenate(features).astype(np.intp), np.concatenate(thresholds).astype(np.float64),
+                   children.astype(np.intp), np.concatenate(path_lengths), np.array(roots, dtype=np.intp), max_depth, n_features,
+                   model._max_samples, float(model.offset_), feature_schema, version)
+
+    def save(self, path):
+        """Writes the forest as one .npy file per array plus meta.json into the directory `path`.
+
+        The directory is built next to `path` and swapped in, so a reader never sees half a model.
+        Processes that already mapped the old files keep reading them until they reload.
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(self, name))
+        meta = {"format_version": MODEL_FORMAT_VERSION, "max_depth": int(self.max_depth),
+                "n_features": int(self.n_features), "max_samples": int(self.max_samples), "offset": self.offset,
+                "feature_schema": self.feature_schema, "model_version": self.version}
+        with open(os.path.join(tmp_path, MODEL_META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def read_meta(path):
+        """meta.json of a saved forest, or None if there is none."""
+        try:
+            with open(os.path.join(path, MODEL_META_FILE), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Loads a forest written by save(). With mmap_mode='r' the arrays are memory-mapped read-only,
+        so every process that loads the same directory shares one copy of the trees in the page cache."""
+        meta = cls.read_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f"No saved forest in {path}")
+        if meta.get("format_version") != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported model format version {meta.get('format_version')} in {path}")
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+        return cls(arrays['feature'], arrays['threshold'], arrays['children'], arrays['leaf_path_length'],
+                   arrays['roots'], meta['max_depth'], meta['n_features'], meta['max_samples'], meta['offset'],
+                   meta.get('feature_schema'), meta.get('model_version', 0))
+
+    def _buffers(self, n_rows):
+        """Work buffers for up to `n_rows` rows; allocated once per thread and reused by every call."""
+        scratch = self._scratch
+        if getattr(scratch, 'capacity', 0) < n_rows:
+            shape = (n_rows, self.n_trees)
+            scratch.capacity = n_rows
+            scratch.x32 = np.empty((n_rows, self.n_features), dtype=np.float32)
+            scratch.row_offsets = (np.arange(n_rows, dtype=np.intp) * self.n_features)[:, None]
+            scratch.nodes = np.empty(shape, dtype=np.intp)
+            scratch.index = np.empty(shape, dtype=np.intp)
+            scratch.values = np.empty(shape, dtype=np.float32)
+            scratch.thresholds = np.empty(shape, dtype=np.float64)
+            scratch.go_left = np.empty(shape, dtype=bool)
+            scratch.path_lengths = np.empty(shape, dtype=np.float64)
+        return scratch
+
+    def path_lengths(self, X, out=None):
+        """Sum over all trees of each sample's path length (sklearn's `depths`)."""
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected a 2D array with {self.n_features} features, got shape {X.shape}")
+        n_samples = X.shape[0]
+        if out is None:
+            out = np.empty(n_samples, dtype=np.float64)
+        scratch = self._buffers(min(n_samples, SCORING_CHUNK_ROWS))
+        for start in range(0, n_samples, SCORING_CHUNK_ROWS):
+            stop = min(start + SCORING_CHUNK_ROWS, n_samples)
+            self._traverse(X[start:stop], scratch, out[start:stop])
+        return out
+
+    def _traverse(self, X, scratch, out):
+        n = X.shape[0]
+        x32, row_offsets, nodes, index = scratch.x32[:n], scratch.row_offsets[:n], scratch.nodes[:n], scratch.index[:n]
+        values, thresholds, go_left = scratch.values[:n], scratch.thresholds[:n], scratch.go_left[:n]
+        x32[...] = X  # sklearn traverses float32 copies of the input
+        flat_x = scratch.x32.reshape(-1)
+
+        # Indices are valid by construction; mode='clip' lets np.take write into `out` without a temporary
+        nodes[...] = self.roots
+        for _ in range(self.max_depth):
+            np.take(self.feature, nodes, out=index, mode='clip')
+            index += row_offsets
+            np.take(flat_x, index, out=values, mode='clip')
+            np.take(self.threshold, nodes, out=thresholds, mode='clip')
+            np.less_equal(values, thresholds, out=go_left)
+            # children[2 * node] is the left child and children[2 * node + 1] the right one
+            np.multiply(nodes, 2, out=index)
+            index += 1
+            np.subtract(index, go_left, out=index, casting='unsafe')
+            np.take(self.children, index, out=nodes, mode='clip')
+        path_lengths = scratch.path_lengths[:n]
+        np.take(self.leaf_path_length, nodes, out=path_lengths, mode='clip')
+        path_lengths.sum(axis=1, out=out)
+
+    def score_samples(self, X):
+        """Same as IsolationForest.score_samples: the opposite of the anomaly score from the original paper."""
+        depths = self.path_lengths(X)
+        if self.normalizer == 0:  # Forest fitted on a single sample; sklearn fixes the score at -0.5
+            return np.full_like(depths, -0.5)
+        return -(2.0 ** (-depths / self.normalizer))
+
+    def decision_function(self, X):
+        """Same as IsolationForest.decision_function: negative scores are anomalies."""
+        return self.score_samples(X) - self.offset
@@ -1,101 +1,158 @@
 # generate_normal_data.py
-import requests
+# Generates lagged "normal" training rows for the Isolation Forest, vectorised and streamed to disk in chunks.
+import argparse
+import datetime
+import json
 import time
+
 import numpy as np
-from collections import deque
-import json  # To save the generated data
-import datetime
-# --- Configuration (Matching your data_simulator.py and app.py) ---
-# Assuming these match the order and number of features your sensor sends
-FEATURES_PER_READING = 3  # temperature, humidity, pressure
-LAG_FEATURES_COUNT = 3  # Current reading + 2 previous readings = 3 total readings in history
-TOTAL_FEATURES_FOR_MODEL = FEATURES_PER_READING * LAG_FEATURES_COUNT
+
+# Reading fields, window length and the column order of each row are shared with app.py via features.py
+from features import FEATURES_PER_READING, LAG_FEATURES_COUNT, TOTAL_FEATURES_FOR_MODEL, lagged_rows
+
+# --- Configuration (Matching your data_simulator.py) ---
 
 # How many "normal" data points to collect for training (aim for 1000-5000+ for better results)
 NUM_NORMAL_READINGS_TO_COLLECT = 2000
 
-# Path to save the generated normal data
-OUTPUT_FILE = 'normal_training_data_with_lags.json'
-
-print(
-    f"Generating {NUM_NORMAL_READINGS_TO_COLLECT} normal data points with {LAG_FEATURES_COUNT - 1} lagged features...")
-print(f"Each training sample will have {TOTAL_FEATURES_FOR_MODEL} features.")
+# Path to save the generated normal data (.npy, loaded memory-mapped by model_training.py; .json also works)
+OUTPUT_FILE = 'normal_training_data_with_lags.npy'
 
-# --- Simulate Normal Data (similar to data_simulator.py, but without anomaly injection) ---
-# You'll need to adapt this to actually GET data from your simulator if it were a separate service,
-# OR you can copy/paste the core generation logic from data_simulator.py here.
-# For simplicity and self-containment, let's copy the core generation logic here.
+READING_INTERVAL_SECONDS = 2  # Simulated time between two readings of the same sensor
+CHUNK_ROWS = 1_000_000  # Rows generated and written per step; bounds memory regardless of the total
+RANDOM_SEED = 42
 
-# SENSOR_PROFILES from data_simulator.py (for generating patterns)
+# Same profiles as SENSOR_PROFILES in data_simulator.py (copied so this script doesn't import requests/pandas)
 SENSOR_PROFILES_FOR_NORMAL = {
     "temp_sensor_01": {
         "base_temp": 25.0, "temp_daily_amplitude": 5.0, "temp_noise_std": 0.5,
         "base_humidity": 60.0, "hum_daily_amplitude": 3.0, "hum_noise_std": 0.8,
         "base_pressure": 1010.0, "pres_daily_amplitude": 2.0, "pres_noise_std": 0.3
     },
-    # Add other sensor profiles from your data_simulator.py here if needed for normal data
-    # "temp_sensor_02": {...}
-}
-
-
-def generate_single_realistic_reading(timestamp_obj, profile):
-    """Generates a single sensor reading with daily cycles and noise."""
-    hour_of_day = timestamp_obj.hour + timestamp_obj.minute / 60.0
-
-    temp_cycle = profile["temp_daily_amplitude"] * np.sin(2 * np.pi * (hour_of_day - 8) / 24)
-    hum_cycle = profile["hum_daily_amplitude"] * np.sin(2 * np.pi * (hour_of_day - 10) / 24)
-    pres_cycle = profile["pres_daily_amplitude"] * np.pi * (hour_of_day - 6) / 24
-
-    temperature = profile["base_temp"] + temp_cycle + np.random.normal(0, profile["temp_noise_std"])
-    humidity = profile["base_humidity"] + hum_cycle + np.random.normal(0, profile["hum_noise_std"])
-    pressure = profile["base_pressure"] + pres_cycle + np.random.normal(0, profile["pres_noise_std"])
-
-    return temperature, humidity, pressure
-
-
-# --- Data Collection Logic ---
-normal_lagged_data = []
-history_buffers = {
-    sensor_id: deque(maxlen=LAG_FEATURES_COUNT)
-    for sensor_id in SENSOR_PROFILES_FOR_NORMAL.keys()
+    "temp_sensor_02": {
+        "base_temp": 22.0, "temp_daily_amplitude": 4.0, "temp_noise_std": 0.6,
+        "base_humidity": 55.0, "hum_daily_amplitude": 2.5, "hum_noise_std": 0.7,
+        "base_pressure": 1005.0, "pres_daily_amplitude": 1.5, "pres_noise_std": 0.4
+    },
+    "humidity_sensor_01": {
+        "base_temp": 28.0, "temp_daily_amplitude": 3.0, "temp_noise_std": 0.7,
+        "base_humidity": 70.0, "hum_daily_amplitude": 6.0, "hum_noise_std": 1.0,
+        "base_pressure": 1012.0, "pres_daily_amplitude": 2.5, "pres_noise_std": 0.5
+    }
 }
 
-# Simulate time progression for normal data collection
-current_sim_time = datetime.datetime.now()
-
-while len(normal_lagged_data) < NUM_NORMAL_READINGS_TO_COLLECT:
-    for sensor_id, profile in SENSOR_PROFILES_FOR_NORMAL.items():
-        # Generate a normal reading for the current simulated time
-        temperature, humidity, pressure = generate_single_realistic_reading(current_sim_time, profile)
-        current_reading = (temperature, humidity, pressure)
-
-        history_buffers[sensor_id].append(current_reading)
-
-        # If we have enough history, create the lagged feature vector
-        if len(history_buffers[sensor_id]) == LAG_FEATURES_COUNT:
-            # Flatten the deque into a single row for the model
-            # Order: [current_T, current_H, current_P, lag1_T, lag1_H, lag1_P, ...]
-            flat_features = []
-            for reading in list(history_buffers[sensor_id]):  # Convert deque to list to iterate for flattening
-                flat_features.extend(reading)
-
-            normal_lagged_data.append(flat_features)
-
-            if len(normal_lagged_data) % 100 == 0:
-                print(f"Collected {len(normal_lagged_data)} normal data points...")
-
-            if len(normal_lagged_data) >= NUM_NORMAL_READINGS_TO_COLLECT:
-                break  # Stop if we've collected enough
-
-    current_sim_time += datetime.timedelta(seconds=2)  # Advance time by a small interval
-
-print(f"\nFinished collecting {len(normal_lagged_data)} normal data points.")
-
-# Convert to NumPy array
-NORMAL_DATA_FOR_MODEL = np.array(normal_lagged_data)
-print("Shape of generated NORMAL_DATA_FOR_MODEL:", NORMAL_DATA_FOR_MODEL.shape)
 
-# Save to JSON for easy loading in app.py
-with open(OUTPUT_FILE, 'w') as f:
-    json.dump(NORMAL_DATA_FOR_MODEL.tolist(), f)  # Convert numpy array to list for JSON
-print(f"Generated normal data saved to {OUTPUT_FILE}")
\ No newline at end of file
+def fleet_profiles(num_sensors, profile_names=None):
+    """Per-reading-feature (num_sensors, 3) arrays of base, amplitude and noise. Sensor k uses profile
+    k % len(profile_names), of all profiles by default."""
+    profiles = [SENSOR_PROFILES_FOR_NORMAL[name] for name in profile_names or SENSOR_PROFILES_FOR_NORMAL]
+    chosen = [profiles[k % len(profiles)] for k in range(num_sensors)]
+    base = np.array([[p["base_temp"], p["base_humidity"], p["base_pressure"]] for p in chosen])
+    amplitude = np.array([[p["temp_daily_amplitude"], p["hum_daily_amplitude"], p["pres_daily_amplitude"]]
+                          for p in chosen])
+    noise_std = np.array([[p["temp_noise_std"], p["hum_noise_std"], p["pres_noise_std"]] for p in chosen])
+    return base, amplitude, noise_std
+
+
+def daily_cycle(hour_of_day):
+    """(steps, 3) cycle for each reading feature; mirrors generate_realistic_reading in data_simulator.py."""
+    temp_cycle = np.sin(2 * np.pi * (hour_of_day - 8) / 24)
+    hum_cycle = np.sin(2 * np.pi * (hour_of_day - 10) / 24)
+    pres_cycle = np.pi * (hour_of_day - 6) / 24  # More linear trend for pressure
+    return np.stack([temp_cycle, hum_cycle, pres_cycle], axis=1)
+
+
+def generate_readings(steps, start_seconds_of_day, base, amplitude, noise_std, rng,
+                      interval_seconds=READING_INTERVAL_SECONDS):
+    """(steps, sensors, 3) readings of every sensor at `steps` timestamps `interval_seconds` apart.
+
+    start_seconds_of_day is the wall-clock time of the first step, as seconds since midnight.
+    """
+    seconds_of_day = (start_seconds_of_day + np.arange(steps) * interval_seconds) % 86400
+    hour_of_day = (seconds_of_day // 60) / 60.0  # Minute resolution, like timestamp.hour + timestamp.minute / 60
+    cycle = daily_cycle(hour_of_day)[:, None, :] * amplitude[None, :, :]
+    return base[None, :, :] + cycle + rng.standard_normal((steps, len(base), FEATURES_PER_READING)) * noise_std
+
+
+def iter_lagged_rows(num_rows, num_sensors, seed=RANDOM_SEED, chunk_rows=CHUNK_ROWS, start_time=None,
+                     profile_names=None, interval_seconds=READING_INTERVAL_SECONDS):
+    """Yields (rows, TOTAL_FEATURES_FOR_MODEL) chunks that together hold exactly `num_rows` rows.
+
+    Rows are ordered by time, then by sensor. Each row is one sensor's window of LAG_FEATURES_COUNT
+    consecutive readings in the features.FEATURE_COLUMNS layout. Only the last
+    LAG_FEATURES_COUNT - 1 readings are carried from one chunk to the next. The random stream is
+    drawn in time order, so the output for a given seed does not depend on chunk_rows. With `profile_names`
+    the sensors cycle through those profiles only; a larger `interval_seconds` spreads the rows over more
+    of the day.
+    """
+    start_time = start_time or datetime.datetime.now()
+    start_seconds = start_time.hour * 3600 + start_time.minute * 60 + start_time.second
+    base, amplitude, noise_std = fleet_profiles(num_sensors, profile_names)
+    rng = np.random.default_rng(seed)
+    steps_per_chunk = max(1, chunk_rows // num_sensors)
+
+    carry = generate_readings(LAG_FEATURES_COUNT - 1, start_seconds, base, amplitude, noise_std, rng,
+                              interval_seconds)
+    step, emitted = LAG_FEATURES_COUNT - 1, 0
+    while emitted < num_rows:
+        steps = min(steps_per_chunk, -(-(num_rows - emitted) // num_sensors))
+        fresh = generate_readings(steps, start_seconds + step * interval_seconds, base, amplitude,
+                                  noise_std, rng, interval_seconds)
+        readings = np.concatenate([carry, fresh])
+        rows = lagged_rows(readings)[:num_rows - emitted]
+        yield rows
+        emitted += len(rows)
+        step += steps
+        carry = readings[-(LAG_FEATURES_COUNT - 1):]
+
+
+def write_npy(path, chunks, num_rows):
+    """Streams the chunks into a .npy file: header first, then each chunk's bytes, one chunk in memory at a time."""
+    header = {'descr': np.lib.format.dtype_to_descr(np.dtype('<f8')), 'fortran_order': False,
+              'shape': (num_rows, TOTAL_FEATURES_FOR_MODEL)}
+    with open(path, 'wb') as f:
+        np.lib.format.write_array_header_2_0(f, header)
+        for chunk in chunks:
+            np.ascontiguousarray(chunk, dtype='<f8').tofile(f)
+
+
+def write_json(path, chunks):
+    """Streams the chunks into the legacy JSON list-of-rows format."""
+    with open(path, 'w') as f:
+        f.write('[')
+        for i, chunk in enumerate(chunks):
+            f.write((', ' if i else '') + json.dumps(chunk.tolist())[1:-1])
+        f.write(']')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate lagged normal sensor data for training.")
+    parser.add_argument('--rows', type=int, default=NUM_NORMAL_READINGS_TO_COLLECT, help="Training rows to generate")
+    parser.add_argument('--sensors', type=int, default=len(SENSOR_PROFILES_FOR_NORMAL),
+                        help="Simulated sensors; sensor k uses profile k %% number of profiles")
+    parser.add_argument('--profile', action='append', choices=list(SENSOR_PROFILES_FOR_NORMAL), dest='profiles',
+                        help="Only simulate this profile (repeatable); default: all of them")
+    parser.add_argument('--interval-seconds', type=float, default=READING_INTERVAL_SECONDS,
+                        help="Simulated time between two readings of a sensor")
+    parser.add_argument('--seed', type=int, default=RANDOM_SEED)
+    parser.add_argument('--output', default=OUTPUT_FILE, help="Output file (.npy, or .json for the legacy format)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    if args.rows < 1 or args.sensors < 1:
+        parser.error("--rows and --sensors must be at least 1")
+
+    print(f"Generating {args.rows} normal data points for {args.sensors} sensors "
+          f"with {LAG_FEATURES_COUNT - 1} lagged readings...")
+    print(f"Each training sample will have {TOTAL_FEATURES_FOR_MODEL} features.")
+    start = time.perf_counter()
+    chunks = iter_lagged_rows(args.rows, args.sensors, seed=args.seed, chunk_rows=args.chunk_rows,
+                              profile_names=args.profiles, interval_seconds=args.interval_seconds)
+    if args.output.endswith('.json'):
+        write_json(args.output, chunks)
+    else:
+        write_npy(args.output, chunks, args.rows)
+    print(f"Generated normal data saved to {args.output} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
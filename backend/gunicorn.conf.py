@@ -0,0 +1,43 @@
+# gunicorn.conf.py
+# Production serving: `cd backend && gunicorn app:app`. The app (model arrays, sensor history, shared counters)
+# is loaded once in the master before forking, so workers share the model pages and one sensor history.
+import multiprocessing
+import os
+import sys
+
+# --- CONFIGURATION ---
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 4))  # Per worker; requests mostly wait on the lock-protected history
+worker_class = 'gthread'
+preload_app = True  # Required: shared state must be created before workers fork
+timeout = int(os.environ.get('WEB_TIMEOUT_SECONDS', 30))
+# On shutdown a worker finishes its requests, then spends up to LOG_DRAIN_TIMEOUT_SECONDS (default 10) sending
+# its queued anomalies (worker_exit); both must fit in this budget
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT_SECONDS', 30))
+
+# Read by app.py at import: shared history, log IDs and nonce; background threads started by the hooks below
+os.environ['SHARED_WORKER_STATE'] = '1'
+
+
+def when_ready(server):
+    import app
+    try:
+        app.check_production_config()
+    except RuntimeError as e:
+        server.log.error("❌ %s", e)
+        sys.exit(1)
+    app.start_history_maintenance()  # One sweeper and snapshotter, in the master
+    app.start_model_refresh(watch=False)  # One refresher, in the master (training runs in its own process)
+    server.log.info("✅ Serving with %d workers x %d threads", workers, threads)
+
+
+def post_fork(server, worker):
+    import app
+    app.start_log_worker()  # Threads do not survive fork; each worker sends its own queued anomalies
+    app.start_model_watcher()  # And swaps in new model versions itself, with a watcher of its own
+
+
+def worker_exit(server, worker):
+    import app
+    app.stop_log_worker()  # The log thread is a daemon: without this, anomalies still queued would be lost
@@ -0,0 +1,224 @@
+# load_generator.py
+# Open-loop, fixed-rate load generator for capacity testing the Flask backend.
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from data_simulator import SENSOR_PROFILES, SIMULATION_INTERVAL_SECONDS, inject_anomaly
+from generate_normal_data import daily_cycle
+
+# --- Configuration ---
+BACKEND_URL = "http://127.0.0.1:5000"
+DEFAULT_SENSORS = 1000
+DEFAULT_RATE = 500  # Readings per second
+DEFAULT_DURATION_SECONDS = 30
+DEFAULT_CONCURRENCY = 64  # Requests allowed in flight at once; each worker thread keeps one keep-alive connection
+REQUEST_TIMEOUT_SECONDS = 10
+ANOMALY_TYPES = ["point", "contextual", "change_point_high", "change_point_low"]
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class SyntheticFleet:
+    """N sensors cloned from SENSOR_PROFILES (sensor i uses profile i % len), producing readings tick by tick.
+
+    Readings follow generate_realistic_reading in data_simulator.py, computed for the whole fleet at once;
+    a fraction `anomaly_rate` of them is passed through inject_anomaly. Simulated time starts at
+    `start_time` (default: now).
+    """
+
+    def __init__(self, num_sensors, anomaly_rate=0.0, seed=None, start_time=None):
+        names = list(SENSOR_PROFILES)
+        self.sensor_ids = [f"{names[i % len(names)]}_{i:06d}" for i in range(num_sensors)]
+        profiles = [SENSOR_PROFILES[names[i % len(names)]] for i in range(num_sensors)]
+        self.base = np.array([[p["base_temp"], p["base_humidity"], p["base_pressure"]] for p in profiles])
+        self.amplitude = np.array([[p["temp_daily_amplitude"], p["hum_daily_amplitude"], p["pres_daily_amplitude"]]
+                                   for p in profiles])
+        self.noise_std = np.array([[p["temp_noise_std"], p["hum_noise_std"], p["pres_noise_std"]] for p in profiles])
+        self.anomaly_rate = anomaly_rate
+        self.rng = np.random.default_rng(seed)
+        self.random = random.Random(seed)
+        self.start_time = start_time or datetime.now()
+
+    def __len__(self):
+        return len(self.sensor_ids)
+
+    def tick(self, tick_number):
+        """(sensors, 3) readings of every sensor at simulated time start + tick_number * interval."""
+        timestamp = self.start_time + timedelta(seconds=tick_number * SIMULATION_INTERVAL_SECONDS)
+        hour_of_day = timestamp.hour + timestamp.minute / 60.0
+        cycle = daily_cycle(np.array([hour_of_day]))[0]
+        readings = self.base + self.amplitude * cycle + self.rng.standard_normal(self.base.shape) * self.noise_std
+        if self.anomaly_rate > 0:
+            for i in np.flatnonzero(self.rng.random(len(readings)) < self.anomaly_rate):
+                readings[i, 0], readings[i, 1], readings[i, 2], _ = inject_anomaly(
+                    *readings[i], self.random.choice(ANOMALY_TYPES))
+        return readings
+
+
+class LoadGenerator:
+    """Sends readings at a fixed rate without waiting for responses (open loop).
+
+    Reading k belongs to sensor k % N at tick k // N, so every sensor advances at the same pace and the
+    backend's per-sensor lag windows fill up as they would in production. Request j carries readings
+    j * batch_size onwards and is due at start + j * batch_size / rate. A scheduler thread hands each
+    request to a thread pool at its due time; the pool's workers each hold a keep-alive Session.
+
+    Latency is measured from the due time, so time spent queued behind a slow backend counts against
+    it instead of silently lowering the offered rate. Service time is measured from the actual send.
+    """
+
+    def __init__(self, base_url=BACKEND_URL, num_sensors=DEFAULT_SENSORS, rate=DEFAULT_RATE,
+                 duration=DEFAULT_DURATION_SECONDS, batch_size=1, concurrency=DEFAULT_CONCURRENCY,
+                 anomaly_rate=0.0, seed=None, timeout=REQUEST_TIMEOUT_SECONDS):
+        if rate <= 0 or duration <= 0 or batch_size < 1 or num_sensors < 1:
+            raise ValueError("rate, duration, batch_size and num_sensors must be positive")
+        self.base_url = base_url.rstrip('/')
+        self.fleet = SyntheticFleet(num_sensors, anomaly_rate, seed)
+        self.rate = rate
+        self.duration = duration
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._results = []  # (latency_s, service_s, readings, ok, error_kind)
+        self._tick_number = -1
+        self._tick_readings = None
+
+    # --- Payloads ---
+    def _reading(self, k):
+        tick_number, sensor_index = divmod(k, len(self.fleet))
+        if tick_number != self._tick_number:  # Only the scheduler thread builds payloads
+            self._tick_number, self._tick_readings = tick_number, self.fleet.tick(tick_number)
+        temperature, humidity, pressure = self._tick_readings[sensor_index]
+        return {"sensor_id": self.fleet.sensor_ids[sensor_index], "temperature": round(float(temperature), 2),
+                "humidity": round(float(humidity), 2), "pressure": round(float(pressure), 2)}
+
+    def _request(self, j):
+        first = j * self.batch_size
+        if self.batch_size == 1:
+            return f"{self.base_url}/sensor_data", self._reading(first), 1
+        readings = [self._reading(k) for k in range(first, first + self.batch_size)]
+        return f"{self.base_url}/sensor_data/batch", readings, len(readings)
+
+    # --- Sending ---
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._local.session = session
+        return session
+
+    def _send(self, url, payload, num_readings, due):
+        sent = time.perf_counter()
+        ok, error_kind = False, None
+        try:
+            response = self._session().post(url, json=payload, timeout=self.timeout)
+            ok = response.status_code == 200
+            if not ok:
+                error_kind = f"http_{response.status_code}"
+        except requests.exceptions.RequestException as e:
+            error_kind = type(e).__name__
+        done = time.perf_counter()
+        with self._lock:
+            self._results.append((done - due, done - sent, num_readings, ok, error_kind))
+
+    def run(self):
+        """Runs the load for `duration` seconds, waits for outstanding requests and returns the report."""
+        total_requests = int(self.rate * self.duration / self.batch_size)
+        interval = self.batch_size / self.rate
+        print(f"Offering {self.rate} readings/s from {len(self.fleet)} sensors for {self.duration}s "
+              f"({total_requests} requests of {self.batch_size}) to {self.base_url}")
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load") as pool:
+            start = time.perf_counter()
+            for j in range(total_requests):
+                due = start + j * interval
+                url, payload, num_readings = self._request(j)
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._send, url, payload, num_readings, due)
+            offered_seconds = time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        return self.report(elapsed, offered_seconds)
+
+    # --- Reporting ---
+    def report(self, elapsed, offered_seconds):
+        with self._lock:
+            results = list(self._results)
+        latencies = np.array([r[0] for r in results]) * 1000
+        service_times = np.array([r[1] for r in results]) * 1000
+        ok = np.array([r[3] for r in results], dtype=bool)
+        readings_ok = sum(r[2] for r in results if r[3])
+        errors = {}
+        for r in results:
+            if r[4] is not None:
+                errors[r[4]] = errors.get(r[4], 0) + 1
+
+        def percentiles(values):
+            if len(values) == 0:
+                return {"p50": None, "p95": None, "p99": None, "max": None}
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            return {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2), "max": round(values.max(), 2)}
+
+        counts, _ = np.histogram(latencies, bins=(0,) + HISTOGRAM_BUCKETS_MS + (np.inf,))
+        return {
+            "requests": len(results),
+            "readings_per_request": self.batch_size,
+            "offered_rate": self.rate,
+            "achieved_send_rate": round(len(results) * self.batch_size / offered_seconds, 1) if offered_seconds else None,
+            "throughput_readings_per_s": round(readings_ok / elapsed, 1),
+            "error_rate": round(1 - ok.mean(), 4) if len(ok) else None,
+            "errors": errors,
+            "latency_ms": percentiles(latencies),
+            "service_time_ms": percentiles(service_times),
+            "latency_histogram_ms": {f"<={bucket}": int(count)
+                                     for bucket, count in zip(HISTOGRAM_BUCKETS_MS + ("inf",), counts)},
+            "elapsed_seconds": round(elapsed, 2),
+        }
+
+
+def print_report(report):
+    print(f"\nRequests: {report['requests']} x {report['readings_per_request']} readings in {report['elapsed_seconds']}s")
+    print(f"Offered: {report['offered_rate']} readings/s, sent: {report['achieved_send_rate']} readings/s, "
+          f"throughput (2xx): {report['throughput_readings_per_s']} readings/s")
+    if report['achieved_send_rate'] is not None and report['achieved_send_rate'] < 0.95 * report['offered_rate']:
+        print("❗ The generator fell behind its schedule (client CPU or --concurrency is the limit); latencies "
+              "still count from each request's due time. Use --batch-size or several generator processes.")
+    print(f"Error rate: {report['error_rate']:.2%} {report['errors'] or ''}")
+    for name in ("latency_ms", "service_time_ms"):
+        p = report[name]
+        print(f"{name:<16} p50={p['p50']} p95={p['p95']} p99={p['p99']} max={p['max']}")
+    print("Latency histogram (ms):")
+    peak = max(report['latency_histogram_ms'].values()) or 1
+    for bucket, count in report['latency_histogram_ms'].items():
+        print(f"  {bucket:>8} {count:>8} {'#' * int(40 * count / peak)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the anomaly detection backend.")
+    parser.add_argument('--url', default=BACKEND_URL, help="Backend base URL")
+    parser.add_argument('--sensors', type=int, default=DEFAULT_SENSORS, help="Synthetic sensors to simulate")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help="Target readings per second")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION_SECONDS, help="Seconds of load")
+    parser.add_argument('--batch-size', type=int, default=1, help="Readings per request; >1 uses /sensor_data/batch")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Max requests in flight")
+    parser.add_argument('--anomaly-rate', type=float, default=0.0, help="Fraction of readings with an injected anomaly")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    generator = LoadGenerator(args.url, args.sensors, args.rate, args.duration, args.batch_size, args.concurrency,
+                              args.anomaly_rate, args.seed)
+    print_report(generator.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# logging_config.py
+# Leveled, optionally JSON-structured logging for the backend. Per-reading messages are DEBUG, so the default
+# INFO level keeps the request hot path free of console I/O.
+import json
+import logging
+import os
+import sys
+
+# --- CONFIGURATION ---
+DEFAULT_LOG_LEVEL = 'INFO'  # Set LOG_LEVEL=DEBUG to see every reading's features and score
+DEFAULT_LOG_FORMAT = 'text'  # 'text' for people, 'json' for one machine-readable object per line
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and is emitted as a field
+_STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None, log_format=None):
+    """Configures the root logger from LOG_LEVEL / LOG_FORMAT (or the arguments). Safe to call repeatedly."""
+    level = (level or os.environ.get('LOG_LEVEL', DEFAULT_LOG_LEVEL)).upper()
+    log_format = (log_format or os.environ.get('LOG_FORMAT', DEFAULT_LOG_FORMAT)).lower()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if getattr(h, '_backend_handler', False)]:
+        root.removeHandler(existing)
+    handler._backend_handler = True
+    root.addHandler(handler)
+    root.setLevel(level)
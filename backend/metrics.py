@@ -0,0 +1,316 @@
+# metrics.py
+# Minimal Prometheus-style metrics: counters, gauges and histograms rendered in the text exposition format.
+import bisect
+import json
+import logging
+import mmap
+import multiprocessing
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# --- CONFIGURATION ---
+METRICS_PREFIX = 'iot_anomaly_'
+# Upper bounds in seconds; from sub-millisecond in-process stages up to chain receipts that take tens of seconds
+DEFAULT_LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Shared registries (gunicorn workers): fixed arena of values in memory shared by every process
+SHARED_METRIC_SERIES = 1024  # Counter or histogram children (one per combination of label values)
+SHARED_METRIC_SLOTS = 16384  # Values: 1 per counter child, len(buckets) + 2 per histogram child
+SHARED_METRIC_KEY_BYTES = 256  # Metric name and label values of a child, JSON-encoded
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = [*zip(labelnames, labelvalues), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class SharedValues:
+    """Float64 values in an anonymous shared mapping, inherited by forked processes, so that every process
+    adds into the same counters and histograms. Created before forking.
+
+    A child takes a block of consecutive slots on first use in any process, recorded under its metric name
+    and label values, so a process rendering the metrics also finds the children other processes created.
+    """
+
+    # Header slots (int64)
+    _SERIES, _SLOTS = range(2)
+
+    def __init__(self, series=SHARED_METRIC_SERIES, slots=SHARED_METRIC_SLOTS):
+        self.lock = multiprocessing.Lock()
+        layout = [
+            ('_header', np.int64, (2,)),
+            ('_keys', f'S{SHARED_METRIC_KEY_BYTES}', (series,)),
+            ('_first_slots', np.int64, (series,)),
+            ('values', np.float64, (slots,)),
+        ]
+        offsets, size = [], 0
+        for _, dtype, shape in layout:
+            size = -(-size // 64) * 64
+            offsets.append(size)
+            size += np.dtype(dtype).itemsize * int(np.prod(shape))
+        self._mapping = mmap.mmap(-1, size)  # Anonymous and MAP_SHARED, zero-filled
+        for (name, dtype, shape), offset in zip(layout, offsets):
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=self._mapping, offset=offset))
+
+    @staticmethod
+    def _key(name, labelvalues):
+        return json.dumps([name, list(labelvalues)]).encode()
+
+    def allocate(self, name, labelvalues, size):
+        """First slot of the child's block, taken on first use; None if the key or the arena is too small."""
+        key = self._key(name, labelvalues)
+        if len(key) > SHARED_METRIC_KEY_BYTES:
+            return None
+        with self.lock:
+            used = int(self._header[self._SERIES])
+            for series in range(used):
+                if self._keys[series] == key:
+                    return int(self._first_slots[series])
+            first = int(self._header[self._SLOTS])
+            if used >= len(self._keys) or first + size > len(self.values):
+                return None
+            self._keys[used] = key
+            self._first_slots[used] = first
+            self._header[self._SERIES] = used + 1
+            self._header[self._SLOTS] = first + size
+            return first
+
+    def labelvalues(self, name):
+        """Label values of every child of metric `name` any process has created."""
+        found = []
+        with self.lock:
+            keys = list(self._keys[:int(self._header[self._SERIES])])
+        for key in keys:
+            key_name, labelvalues = json.loads(key)
+            if key_name == name:
+                found.append(tuple(labelvalues))
+        return found
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), shared=None):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.shared = shared  # SharedValues, or None for values of this process only
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *labelvalues):
+        """The child for one combination of label values (created on first use)."""
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labelvalues}")
+        labelvalues = tuple(str(value) for value in labelvalues)
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.get(labelvalues)
+                if child is None:
+                    child = self._children[labelvalues] = self._create_child(labelvalues)
+        return child
+
+    def _create_child(self, labelvalues):
+        if self.shared is not None:
+            first = self.shared.allocate(self.name, labelvalues, self._shared_slots)
+            if first is not None:
+                return self._new_shared_child(first)
+            logger.warning("❗ No room for %s%s in the shared metrics; counting it in this process only",
+                           self.name, _format_labels(self.labelnames, labelvalues))
+        return self._new_child()
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels {self.labelnames}; use .labels(...)")
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if self.shared is not None:
+            for labelvalues in self.shared.labelvalues(self.name):  # Also those first used by other processes
+                self.labels(*labelvalues)
+        with self._lock:
+            children = sorted(self._children.items())
+        for labelvalues, child in children:
+            lines.extend(self._render_child(labelvalues, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _SharedCounterChild:
+    def __init__(self, shared, slot):
+        self._shared = shared
+        self._slot = slot
+
+    def inc(self, amount=1):
+        with self._shared.lock:
+            self._shared.values[self._slot] += amount
+
+    @property
+    def value(self):
+        return float(self._shared.values[self._slot])
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. readings received."""
+    kind = 'counter'
+    _shared_slots = 1
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _new_shared_child(self, first):
+        return _SharedCounterChild(self.shared, first)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _render_child(self, labelvalues, child):
+        return [f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(child.value)}"]
+
+
+class Gauge(_Metric):
+    """Value read from `function` at scrape time, e.g. the number of tracked sensors."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {_format_value(self.function())}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot: above the largest bound
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _SharedHistogramChild(_HistogramChild):
+    """Bucket counts and sum in len(buckets) + 2 consecutive shared slots."""
+
+    def __init__(self, buckets, shared, first):
+        self.buckets = buckets
+        self._shared = shared
+        self._values = shared.values[first:first + len(buckets) + 2]
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._shared.lock:
+            self._values[index] += 1
+            self._values[-1] += value
+
+    def snapshot(self):
+        with self._shared.lock:
+            return [int(count) for count in self._values[:-1]], float(self._values[-1])
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (seconds for latencies) over fixed cumulative buckets."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS, shared=None):
+        super().__init__(name, documentation, labelnames, shared)
+        self.buckets = tuple(sorted(buckets))
+        self._shared_slots = len(self.buckets) + 2
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _new_shared_child(self, first):
+        return _SharedHistogramChild(self.buckets, self.shared, first)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, labelvalues, child):
+        counts, total = child.snapshot()
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics in registration order and renders them for GET /metrics.
+
+    With `shared=True` (create it before forking), counters and histograms add up the values of every forked
+    process, so any process can answer a scrape with the same totals; gauges are still read in the process
+    that renders them.
+    """
+
+    def __init__(self, shared=False):
+        self._metrics = []
+        self.shared = SharedValues() if shared else None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames, self.shared))
+
+    def gauge(self, name, documentation, function):
+        return self.register(Gauge(name, documentation, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets, self.shared))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
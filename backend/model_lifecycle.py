@@ -0,0 +1,509 @@
+# model_lifecycle.py
+# Online model refresh: readings predicted normal are sampled per sensor class, a new forest is trained from the
+# sample in a separate interpreter, saved as a numbered version and swapped in by every scoring process.
+import argparse
+import functools
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from forest_scorer import FlatIsolationForest
+
+# --- CONFIGURATION ---
+MODEL_VERSIONS_DIR = 'model_versions'  # One forest directory per version, plus the CURRENT pointer file
+MODEL_VERSIONS_KEPT = 3  # Older versions than the newest few are deleted (processes that mapped them are unaffected)
+RESERVOIR_SIZE = 2048  # Feature rows sampled per sensor class
+SAMPLE_HORIZON_READINGS = 20000  # A new row enters with probability at least RESERVOIR_SIZE / this, so old rows age out
+MAX_SAMPLE_CLASSES = 32  # Sensor classes sampled; readings of further classes are not sampled
+SENSOR_CLASS_NAME_BYTES = 48
+MODEL_REFRESH_INTERVAL_SECONDS = 6 * 3600  # Scheduled retraining
+MODEL_REFRESH_MIN_GAP_SECONDS = 600  # Drift never retrains more often than this
+MODEL_REFRESH_MIN_ROWS = 1024  # Sampled rows needed before retraining
+DRIFT_ANOMALY_RATE = 0.05  # A class flagging more than this fraction of a window's readings triggers retraining
+DRIFT_WINDOW_READINGS = 5000  # Readings per class the drift rate is measured over
+REFRESH_CHECK_SECONDS = 10.0  # How often the refresher looks at the schedule, drift and refresh requests
+MODEL_POLL_SECONDS = 5.0  # How often scoring processes look for a newly published version
+TRAINING_NICENESS = 10  # Scheduling priority of the training process, below request handling
+TRAINING_TIMEOUT_SECONDS = 1800
+CURRENT_FILE = 'CURRENT'
+SAMPLE_FILE = 'sample.npy'  # Training rows, kept inside each version's directory
+
+logger = logging.getLogger(__name__)
+
+_VERSION_DIR = re.compile(r'^v(\d+)$')
+
+
+@functools.lru_cache(maxsize=65536)
+def sensor_class(sensor_id):
+    """Class of a sensor: its ID without the trailing instance number ('temp_sensor_01' -> 'temp_sensor')."""
+    sensor_id = str(sensor_id)
+    return re.sub(r'[_-]?\d+$', '', sensor_id) or sensor_id
+
+
+class ReservoirSampler:
+    """Per-class reservoir samples of the feature rows of readings predicted normal, plus drift counters.
+
+    Each class keeps `size` rows filled by reservoir sampling (Algorithm R), except that the stream position
+    saturates at `horizon`: once a class has seen that many rows, every new row still replaces a random one
+    with probability size / horizon, so the sample follows the recent readings rather than all of them.
+    Every observed reading, normal or not, also counts towards the class's anomaly rate for drifting_classes().
+
+    With `shared=True` the arrays live in one anonymous shared mapping with a process-shared lock, so forked
+    gunicorn or detection workers all sample into the same reservoirs; classes get a slot on first sight and
+    keep it.
+    """
+
+    # Header slots (int64)
+    _CLASSES, _REFRESH_REQUESTED = range(2)
+
+    def __init__(self, features, size=RESERVOIR_SIZE, horizon=SAMPLE_HORIZON_READINGS,
+                 max_classes=MAX_SAMPLE_CLASSES, shared=False, seed=None):
+        self.features = features
+        self.size = size
+        self.horizon = max(horizon, size)
+        self.max_classes = max_classes
+        self.shared = shared
+        self.seed = seed  # For reproducible benchmarks; forked children then draw the same sequence
+        self.lock = multiprocessing.Lock() if shared else threading.Lock()
+        layout = [
+            ('_header', np.int64, (4,)),
+            ('_names', f'S{SENSOR_CLASS_NAME_BYTES}', (max_classes,)),
+            ('_rows', np.float64, (max_classes, size, features)),
+            ('_seen', np.int64, (max_classes,)),  # Normal rows offered to the reservoir
+            ('_scored', np.int64, (max_classes,)),  # Readings in the current drift window
+            ('_anomalies', np.int64, (max_classes,)),
+        ]
+        if shared:
+            offsets, total = [], 0
+            for _, dtype, shape in layout:
+                total = -(-total // 64) * 64  # Align every array to a cache line
+                offsets.append(total)
+                total += np.dtype(dtype).itemsize * int(np.prod(shape))
+            self._mapping = mmap.mmap(-1, total)  # Anonymous and MAP_SHARED: inherited by forked children
+            for (name, dtype, shape), offset in zip(layout, offsets):
+                setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=self._mapping, offset=offset))
+        else:
+            for name, dtype, shape in layout:
+                setattr(self, name, np.zeros(shape, dtype=dtype))
+        self._slots = {}  # Class name -> slot, cached per process
+        self._rng, self._rng_pid = None, None
+        self._full_warned = False
+
+    def _slot(self, name):
+        """Slot of a class, assigned on first sight. -1 once all max_classes slots are taken."""
+        slot = self._slots.get(name)
+        if slot is not None:
+            return slot
+        key = name.encode()[:SENSOR_CLASS_NAME_BYTES]
+        with self.lock:
+            used = int(self._header[self._CLASSES])
+            matches = np.flatnonzero(self._names[:used] == key)
+            if len(matches):
+                slot = int(matches[0])
+            elif used < self.max_classes:
+                slot = used
+                self._names[slot] = key
+                self._header[self._CLASSES] = used + 1
+            else:
+                if not self._full_warned:
+                    logger.warning("❗ %d sensor classes are sampled already; not sampling '%s'", self.max_classes,
+                                   name)
+                    self._full_warned = True
+                return -1
+        self._slots[name] = slot
+        return slot
+
+    def _generator(self):
+        if self._rng_pid != os.getpid():  # Forked children must not draw the parent's sequence
+            self._rng, self._rng_pid = np.random.default_rng(self.seed), os.getpid()
+        return self._rng
+
+    def observe(self, sensor_ids, rows, anomalous):
+        """Counts readings per class and offers the feature rows of those not `anomalous` to the reservoirs.
+        `rows` is (N, features); `anomalous` a boolean mask of N."""
+        if not len(sensor_ids):
+            return
+        slots = np.fromiter((self._slot(sensor_class(sensor_id)) for sensor_id in sensor_ids), np.int64,
+                            len(sensor_ids))
+        anomalous = np.asarray(anomalous, dtype=bool)
+        rng = self._generator()
+        with self.lock:
+            for slot in np.unique(slots[slots >= 0]):
+                in_class = slots == slot
+                normal = in_class & ~anomalous
+                self._scored[slot] += int(np.count_nonzero(in_class))
+                self._anomalies[slot] += int(np.count_nonzero(in_class & anomalous))
+                offered = rows[normal]
+                seen = int(self._seen[slot])
+                stream = np.minimum(seen + np.arange(len(offered)), self.horizon)
+                positions = np.where(stream < self.size, stream, rng.integers(0, stream + 1))
+                keep = positions < self.size
+                self._rows[slot, positions[keep]] = offered[keep]
+                self._seen[slot] = seen + len(offered)
+
+    def observe_one(self, sensor_id, row, anomalous):
+        """observe() for a single reading, without the per-call cost of the array version."""
+        slot = self._slot(sensor_class(sensor_id))
+        if slot < 0:
+            return
+        with self.lock:
+            self._scored[slot] += 1
+            if anomalous:
+                self._anomalies[slot] += 1
+                return
+            seen = int(self._seen[slot])
+            position = seen if seen < self.size else random.randint(0, min(seen, self.horizon))
+            if position < self.size:
+                self._rows[slot, position] = row
+            self._seen[slot] = seen + 1
+
+    def samples(self):
+        """Copies of every class's sampled rows: {class name: (rows, features) array}."""
+        with self.lock:
+            used = int(self._header[self._CLASSES])
+            return {self._names[slot].decode(): self._rows[slot, :min(int(self._seen[slot]), self.size)].copy()
+                    for slot in range(used)}
+
+    def sampled_rows(self):
+        with self.lock:
+            return int(np.minimum(self._seen, self.size).sum())
+
+    def drifting_classes(self, rate=DRIFT_ANOMALY_RATE, window=DRIFT_WINDOW_READINGS):
+        """Classes whose completed drift window flagged more than `rate` of its readings. Every completed
+        window is restarted, so each one is judged once."""
+        with self.lock:
+            used = int(self._header[self._CLASSES])
+            complete = np.flatnonzero(self._scored[:used] >= window)
+            drifting = [self._names[slot].decode() for slot in complete
+                        if self._anomalies[slot] > rate * self._scored[slot]]
+            self._scored[complete] = 0
+            self._anomalies[complete] = 0
+            return drifting
+
+    def reset_drift(self):
+        """Restarts every drift window, e.g. after a new model was swapped in."""
+        with self.lock:
+            self._scored[:] = 0
+            self._anomalies[:] = 0
+
+    def request_refresh(self):
+        with self.lock:
+            self._header[self._REFRESH_REQUESTED] = 1
+
+    def take_refresh_request(self):
+        """True once after request_refresh(), from any process."""
+        with self.lock:
+            requested = bool(self._header[self._REFRESH_REQUESTED])
+            self._header[self._REFRESH_REQUESTED] = 0
+            return requested
+
+    def estimated_bytes(self):
+        return self._rows.nbytes + self._names.nbytes + 3 * self._seen.nbytes
+
+    def stats(self):
+        with self.lock:
+            used = int(self._header[self._CLASSES])
+            classes = {self._names[slot].decode(): {
+                "sampled_rows": min(int(self._seen[slot]), self.size),
+                "normal_readings_seen": int(self._seen[slot]),
+                "window_readings": int(self._scored[slot]),
+                "window_anomalies": int(self._anomalies[slot]),
+            } for slot in range(used)}
+        return {"reservoir_size": self.size, "max_classes": self.max_classes, "classes": classes,
+                "estimated_bytes": self.estimated_bytes()}
+
+
+class ModelStore:
+    """Numbered forest versions under `root` (v000001, v000002, ...) and a CURRENT file naming the live one.
+
+    A version directory is complete before CURRENT points to it, and CURRENT is replaced atomically, so any
+    process can read it at any time. Version 0 is the model exported from the joblib file and lives outside
+    the store.
+    """
+
+    def __init__(self, root=MODEL_VERSIONS_DIR, keep=MODEL_VERSIONS_KEPT):
+        self.root = root
+        self.keep = keep
+        os.makedirs(root, exist_ok=True)
+        self._current_cache = (None, None)  # (mtime_ns of CURRENT, version)
+
+    def version_path(self, version):
+        return os.path.join(self.root, f"v{version:06d}")
+
+    def versions(self):
+        """Versions with a directory in the store, oldest first."""
+        found = (_VERSION_DIR.match(name) for name in os.listdir(self.root))
+        return sorted(int(match.group(1)) for match in found if match)
+
+    def current_version(self):
+        """The published version, or None if nothing was published yet. Re-reads CURRENT only when it changed."""
+        path = os.path.join(self.root, CURRENT_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if self._current_cache[0] != mtime:
+            with open(path, 'r') as f:
+                self._current_cache = (mtime, int(f.read().strip()))
+        return self._current_cache[1]
+
+    def next_version(self):
+        return max(self.versions() + [self.current_version() or 0]) + 1
+
+    def publish(self, version):
+        """Points CURRENT at `version` and deletes all but the `keep` newest versions."""
+        tmp_path = os.path.join(self.root, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(tmp_path, 'w') as f:
+            f.write(f"{version}\n")
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_FILE))
+        for old in self.versions()[:-self.keep]:
+            if old != version:
+                shutil.rmtree(self.version_path(old), ignore_errors=True)
+
+    def stats(self):
+        return {"path": self.root, "published_version": self.current_version(), "versions": self.versions()}
+
+
+class ModelWatcher:
+    """Calls `on_change(version, path)` in this process whenever the store publishes a version other than
+    `loaded_version`. A failing on_change (e.g. a schema mismatch) is logged and that version is skipped."""
+
+    def __init__(self, store, on_change, loaded_version=0, interval_seconds=MODEL_POLL_SECONDS):
+        self.store = store
+        self.on_change = on_change
+        self.loaded_version = loaded_version
+        self.interval_seconds = interval_seconds
+        self._checked_at = float('-inf')
+        self._failed_version = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def poll(self, force=False):
+        """Swaps in a newly published version, checking the store at most every interval_seconds."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.interval_seconds:
+            return
+        with self._lock:
+            self._checked_at = now
+            version = self.store.current_version()
+            if version is None or version in (self.loaded_version, self._failed_version):
+                return
+            try:
+                self.on_change(version, self.store.version_path(version))
+            except Exception as e:
+                self._failed_version = version
+                logger.error("❌ Could not swap in model version %d: %s", version, e)
+                return
+            logger.info("✅ Model version %d swapped in (was %d)", version, self.loaded_version)
+            self.loaded_version = version
+
+    def start(self):
+        """Polls on a daemon thread. Threads do not survive fork; call it again in each forked worker."""
+        def watch():
+            while True:
+                time.sleep(self.interval_seconds)
+                self.poll()
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=watch, name="model-watcher", daemon=True)
+            self._thread.start()
+
+
+class ModelRefresher:
+    """Retrains the model from the reservoir sample on a schedule, after drift or on request.
+
+    A daemon thread checks every REFRESH_CHECK_SECONDS whether the schedule is due, drift was seen or a
+    refresh was requested, and if the sample holds at least `min_rows` rows, writes it to disk and runs
+    this module as a separate Python process (at lower scheduling priority) to train and save the next
+    version. The thread only waits for that process, so training never holds this process's GIL.
+    The new version is then published; scoring processes pick it up through their ModelWatcher.
+
+    With a `registry` (see model_registry.py), the same process also trains a model for every sensor class
+    with at least `min_rows` sampled rows, from that class's rows only, and publishes it in the class's
+    store; scoring processes pick those up through the registry.
+    """
+
+    def __init__(self, sampler, store, interval_seconds=MODEL_REFRESH_INTERVAL_SECONDS,
+                 min_gap_seconds=MODEL_REFRESH_MIN_GAP_SECONDS, min_rows=MODEL_REFRESH_MIN_ROWS,
+                 drift_rate=DRIFT_ANOMALY_RATE, drift_window=DRIFT_WINDOW_READINGS,
+                 check_seconds=REFRESH_CHECK_SECONDS, niceness=TRAINING_NICENESS,
+                 timeout_seconds=TRAINING_TIMEOUT_SECONDS, on_publish=None, registry=None):
+        self.sampler = sampler
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self.min_gap_seconds = min_gap_seconds
+        self.min_rows = min_rows
+        self.drift_rate = drift_rate
+        self.drift_window = drift_window
+        self.check_seconds = check_seconds
+        self.niceness = niceness
+        self.timeout_seconds = timeout_seconds
+        self.on_publish = on_publish  # Called with the new version after it is published
+        self.registry = registry
+        self.last_refresh = time.monotonic()  # The model loaded at startup counts as fresh
+        self._thread = None
+
+    def due(self, now=None):
+        """Why a refresh should run now ('requested', 'drift' or 'schedule'), or None."""
+        now = time.monotonic() if now is None else now
+        if self.sampler.take_refresh_request():
+            return 'requested'
+        # Drift windows are only judged (which restarts them) once a retrain is allowed, so drift seen during
+        # the minimum gap is still acted on when the gap ends
+        if now - self.last_refresh >= self.min_gap_seconds:
+            drifting = self.sampler.drifting_classes(self.drift_rate, self.drift_window)
+            if drifting:
+                logger.warning("❗ Anomaly rate above %.1f%% for %s; retraining", 100 * self.drift_rate,
+                               ', '.join(drifting))
+                return 'drift'
+        if now - self.last_refresh >= self.interval_seconds:
+            return 'schedule'
+        return None
+
+    def refresh(self, reason='requested'):
+        """Trains, saves and publishes the next version (and, with a registry, the next version of every class
+        with enough rows). Returns the summary of the global version, or None if it was not trained."""
+        samples = self.sampler.samples()
+        rows = sum(len(sample) for sample in samples.values())
+        if rows < self.min_rows:
+            logger.info("💡 Model refresh (%s) skipped: %d sampled rows, need %d", reason, rows, self.min_rows)
+            return None
+        self.last_refresh = time.monotonic()
+        version = self.store.next_version()
+        jobs = [(None, self.store, version, np.concatenate(list(samples.values())))]
+        if self.registry is not None:
+            for name, sample in samples.items():
+                class_store = self.registry.store(name) if len(sample) >= self.min_rows else None
+                if class_store is not None:
+                    jobs.append((name, class_store, class_store.next_version(), sample))
+        logger.info("💡 Training model version %d (%s) on %d rows from %d sensor classes, and %d class models",
+                    version, reason, rows, len(samples), len(jobs) - 1)
+        training_jobs = []
+        for _, store, job_version, sample in jobs:
+            path = store.version_path(job_version)
+            np.save(f"{path}.{SAMPLE_FILE}", sample)
+            training_jobs.append((f"{path}.{SAMPLE_FILE}", path, job_version))
+        try:
+            summaries = train_in_subprocess(training_jobs, self.niceness, self.timeout_seconds)
+        except Exception as e:
+            logger.error("❌ Training model version %d failed: %s", version, e)
+            return None
+        finally:
+            for sample_path, _, _ in training_jobs:
+                if os.path.exists(sample_path):
+                    os.remove(sample_path)
+
+        for (name, store, job_version, _), summary in zip(jobs[1:], summaries[1:]):
+            if "error" in summary:
+                logger.error("❌ Training version %d of the '%s' model failed: %s", job_version, name,
+                             summary["error"])
+                continue
+            store.publish(job_version)
+            logger.info("✅ Version %d of the '%s' model published (%d rows)", job_version, name,
+                        summary["training_rows"])
+        summary = summaries[0]
+        if "error" in summary:
+            logger.error("❌ Training model version %d failed: %s", version, summary["error"])
+            return None
+        self.store.publish(version)
+        self.sampler.reset_drift()
+        logger.info("✅ Model version %d published (%d trees, %d rows, trained in %.1fs)", version,
+                    summary["trees"], summary["training_rows"], summary["training_seconds"])
+        if self.on_publish is not None:
+            self.on_publish(version)
+        return summary
+
+    def start(self):
+        def refresh_loop():
+            while True:
+                time.sleep(self.check_seconds)
+                try:
+                    reason = self.due()
+                    if reason:
+                        self.refresh(reason)
+                except Exception as e:
+                    logger.error("❌ Error in the model refresher: %s", e)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=refresh_loop, name="model-refresher", daemon=True)
+            self._thread.start()
+
+
+def train_in_subprocess(jobs, niceness=TRAINING_NICENESS, timeout_seconds=TRAINING_TIMEOUT_SECONDS):
+    """Runs `python model_lifecycle.py` once for a list of (sample_path, output_path, version) jobs and returns
+    each job's summary; a job that saved no model gets {"output": ..., "error": ...}. Raises RuntimeError if
+    the process did not finish.
+
+    Results are checked through the saved meta.json rather than the exit status, because under gunicorn the
+    master's SIGCHLD handler may reap the process first.
+    """
+    command = [sys.executable, os.path.abspath(__file__)]
+    for sample_path, output_path, version in jobs:
+        command += ['--job', sample_path, output_path, str(version)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        os.setpriority(os.PRIO_PROCESS, process.pid, niceness)
+    except OSError:
+        pass  # Already exited, or not allowed; it only lowers the priority
+    try:
+        stdout, stderr = process.communicate(timeout=timeout_seconds)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise RuntimeError(f"training did not finish within {timeout_seconds}s")
+    reported = {}
+    for line in stdout.splitlines():
+        if line.startswith('{'):
+            summary = json.loads(line)
+            reported[summary["output"]] = summary
+    summaries = []
+    for _, output_path, version in jobs:
+        meta = FlatIsolationForest.read_meta(output_path)
+        summary = reported.get(output_path)
+        if meta is None or meta.get('model_version') != version or summary is None:
+            summary = {"output": output_path, "error": summary.get("error") if summary else None}
+            summary["error"] = summary["error"] or f"no model was saved: {stderr.strip()[-500:]}"
+        summaries.append(summary)
+    return summaries
+
+
+def train_version(sample_path, output_path, version):
+    """Trains on the sampled rows and saves them with the forest as `version` in `output_path`."""
+    from model_training import train_isolation_forest, model_feature_schema
+    start = time.perf_counter()
+    sample = np.load(sample_path)
+    model = train_isolation_forest(sample, n_jobs=1)
+    forest = FlatIsolationForest.from_model(model, model_feature_schema(model), version=version)
+    forest.save(output_path)
+    np.save(os.path.join(output_path, SAMPLE_FILE), sample)
+    return {"output": output_path, "version": version, "trees": forest.n_trees,
+            "training_rows": int(sample.shape[0]), "training_seconds": round(time.perf_counter() - start, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train model versions from samples (run by ModelRefresher).")
+    parser.add_argument('--job', nargs=3, action='append', required=True, metavar=('SAMPLE', 'OUTPUT', 'VERSION'),
+                        help="(rows, features) .npy file of sampled feature rows, the version directory to write "
+                             "the forest to, and its version number (repeatable)")
+    args = parser.parse_args()
+    for sample_path, output_path, version in args.job:
+        try:
+            summary = train_version(sample_path, output_path, int(version))
+        except Exception as e:  # The other jobs still run
+            summary = {"output": output_path, "error": str(e)}
+        print(json.dumps(summary), flush=True)
+
+
+if __name__ == "__main__":
+    main()
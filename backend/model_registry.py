@@ -0,0 +1,300 @@
+# model_registry.py
+# Per-profile models: every sensor is scored by the forest trained on its own profile when there is one, and
+# by the global model otherwise. Forests are loaded lazily from disk into a bounded per-process LRU cache.
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+
+from features import check_feature_schema
+from forest_scorer import FlatIsolationForest
+from model_lifecycle import ModelStore, MODEL_POLL_SECONDS, MODEL_VERSIONS_KEPT, CURRENT_FILE
+
+# --- CONFIGURATION ---
+MODEL_REGISTRY_DIR = 'profile_models'  # One model store (versions + CURRENT, see ModelStore) per model key
+# Forests kept loaded per process, least recently used dropped first (~0.5 MB each, memory-mapped so processes
+# share the pages). Sized for hundreds of class models: a batch routed to more models than this reloads some.
+MODEL_CACHE_SIZE = 512
+ROUTE_CACHE_SIZE = 65536  # Sensor ID -> model key lookups remembered per process
+ROUTES_FILE = 'routes.json'  # Optional {"sensor_id": "model key"} overrides, inside MODEL_REGISTRY_DIR
+DEFAULT_MODEL_KEY = 'default'  # Reported for readings scored by the global model
+MODEL_KEY_MAX_LENGTH = 64
+# Offline training of one model per SENSOR_PROFILES entry (python model_registry.py)
+PROFILE_TRAINING_ROWS = 20000
+PROFILE_TRAINING_SENSORS = 8
+PROFILE_READING_INTERVAL_SECONDS = 36  # 2500 readings per simulated sensor cover a whole day
+
+logger = logging.getLogger(__name__)
+
+_MODEL_KEY = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+class _CachedModel:
+    __slots__ = ('scorer', 'checked_at')
+
+    def __init__(self, scorer, checked_at):
+        self.scorer = scorer
+        self.checked_at = checked_at
+
+
+class ModelRegistry:
+    """Model keys (sensor profiles or classes) under `root`, each a ModelStore with its own versions.
+
+    A sensor ID is routed to the key named for it in ROUTES_FILE, or else to the longest registered key it
+    starts with, cut at '_' or '-': with keys 'temp_sensor_01' and 'humidity_sensor_01', sensors
+    'temp_sensor_01' and 'temp_sensor_01_000003' use the first, and with key 'temp_sensor' (a sensor class,
+    see model_lifecycle.sensor_class) so would 'temp_sensor_02'. Sensors matching no key are scored by the
+    default model passed to score().
+
+    At most `cache_size` forests are kept loaded between score() calls; during a call, the models of its batch
+    are pinned, so a batch routed to more models than that does not evict the ones it has yet to use. They
+    are memory-mapped, so processes scoring with the same version share its pages, and a dropped forest also
+    frees its per-thread work buffers. A cached
+    forest's CURRENT file and the list of keys are re-read at most every `poll_seconds`, so newly published
+    versions and keys are picked up without a restart.
+    """
+
+    def __init__(self, root=MODEL_REGISTRY_DIR, cache_size=MODEL_CACHE_SIZE, poll_seconds=MODEL_POLL_SECONDS,
+                 route_cache_size=ROUTE_CACHE_SIZE, keep=MODEL_VERSIONS_KEPT, on_load=None):
+        self.root = root
+        self.cache_size = max(1, cache_size)
+        self.poll_seconds = poll_seconds
+        self.route_cache_size = route_cache_size
+        self.keep = keep
+        self.on_load = on_load  # Called after every forest load (cache miss)
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._models = OrderedDict()  # key -> _CachedModel, least recently used first
+        self._pins = Counter()  # key -> score() calls using it; pinned models are not evicted
+        self._stores = {}
+        self._failed = {}  # key -> version that could not be loaded
+        self._keys = frozenset()
+        self._overrides = {}
+        self._overrides_mtime = None
+        self._routes = {}  # sensor ID -> key
+        self._scanned_at = float('-inf')
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.refresh_keys(force=True)
+
+    @staticmethod
+    def valid_key(key):
+        return (key != DEFAULT_MODEL_KEY and len(key) <= MODEL_KEY_MAX_LENGTH
+                and _MODEL_KEY.match(key) is not None)
+
+    def store(self, key):
+        """The ModelStore of `key` (created if needed), or None if `key` cannot name a model."""
+        store = self._stores.get(key)
+        if store is None:
+            if not self.valid_key(key):
+                return None
+            store = self._stores[key] = ModelStore(os.path.join(self.root, key), self.keep)
+        return store
+
+    def keys(self):
+        return sorted(self._keys)
+
+    def refresh_keys(self, force=False):
+        """Re-reads which keys have a published version, and ROUTES_FILE, at most every poll_seconds."""
+        now = time.monotonic()
+        if not force and now - self._scanned_at < self.poll_seconds:
+            return
+        self._scanned_at = now
+        keys = frozenset(name for name in os.listdir(self.root)
+                         if self.valid_key(name) and os.path.exists(os.path.join(self.root, name, CURRENT_FILE)))
+        overrides = self._overrides
+        routes_path = os.path.join(self.root, ROUTES_FILE)
+        try:
+            mtime = os.stat(routes_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime, overrides = None, {}
+        if mtime is not None and mtime != self._overrides_mtime:
+            try:
+                with open(routes_path, 'r') as f:
+                    overrides = {str(sensor_id): str(key) for sensor_id, key in json.load(f).items()}
+            except (OSError, ValueError, AttributeError) as e:
+                logger.error("❌ Could not read %s; keeping the previous routes: %s", routes_path, e)
+                mtime = self._overrides_mtime
+        if keys != self._keys or overrides != self._overrides:
+            if len(keys) > self.cache_size >= len(self._keys):
+                logger.warning("❗ %d models registered but the model cache holds %d; batches routed to more models "
+                               "than that reload some of them every time (raise MODEL_CACHE_SIZE)",
+                               len(keys), self.cache_size)
+            self._keys, self._overrides = keys, overrides
+            self._routes = {}
+        self._overrides_mtime = mtime
+
+    def _resolve(self, sensor_id):
+        sensor_id = str(sensor_id)
+        key = self._overrides.get(sensor_id)
+        if key in self._keys:
+            return key
+        candidate = sensor_id
+        while candidate not in self._keys:
+            cut = max(candidate.rfind('_'), candidate.rfind('-'))
+            if cut <= 0:
+                return DEFAULT_MODEL_KEY
+            candidate = candidate[:cut]
+        return candidate
+
+    def model_key(self, sensor_id):
+        """Key of the model a sensor is routed to (DEFAULT_MODEL_KEY if none)."""
+        key = self._routes.get(sensor_id)
+        if key is None:
+            if len(self._routes) >= self.route_cache_size:
+                self._routes = {}
+            key = self._routes[sensor_id] = self._resolve(sensor_id)
+        return key
+
+    def model(self, key):
+        """The published forest of `key`, loaded on first use, or None if it has none or it failed to load."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                if now - entry.checked_at < self.poll_seconds:
+                    self.hits += 1
+                    return entry.scorer
+        store = self.store(key)
+        version = store.current_version() if store is not None else None
+        if entry is not None and entry.scorer.version == version:
+            entry.checked_at = now
+            self.hits += 1
+            return entry.scorer
+        if version is None or self._failed.get(key) == version:
+            return None
+        try:
+            scorer = FlatIsolationForest.load(store.version_path(version), mmap_mode='r')
+            check_feature_schema(scorer.feature_schema)
+        except Exception as e:
+            self._failed[key] = version
+            logger.error("❌ Could not load version %d of the '%s' model: %s", version, key, e)
+            return None
+        with self._lock:
+            self._models[key] = _CachedModel(scorer, now)
+            self._models.move_to_end(key)
+            self.loads += 1
+            self._evict()
+        if self.on_load is not None:
+            self.on_load()
+        return scorer
+
+    def _evict(self):
+        """Drops least recently used models that are not pinned until at most cache_size are left. Call with
+        self._lock held."""
+        if len(self._models) <= self.cache_size:
+            return
+        for key in [key for key in self._models if key not in self._pins]:
+            del self._models[key]
+            self.evictions += 1
+            if len(self._models) <= self.cache_size:
+                return
+
+    def score(self, sensor_ids, features, default_scorer):
+        """Scores features[i] with the model of sensor_ids[i], one decision_function call per model.
+
+        Returns (anomaly_scores, model_keys, model_versions). Readings of sensors without a model of their own
+        are scored by `default_scorer` and get DEFAULT_MODEL_KEY.
+        """
+        self.refresh_keys()
+        groups = defaultdict(list)
+        for position, sensor_id in enumerate(sensor_ids):
+            groups[self.model_key(sensor_id)].append(position)
+        anomaly_scores = np.empty(len(sensor_ids))
+        model_versions = np.empty(len(sensor_ids), dtype=np.int64)
+        model_keys = [DEFAULT_MODEL_KEY] * len(sensor_ids)
+        pinned = [key for key in groups if key != DEFAULT_MODEL_KEY]
+        with self._lock:
+            self._pins.update(pinned)
+        try:
+            self._score_groups(groups, features, default_scorer, anomaly_scores, model_keys, model_versions)
+        finally:
+            with self._lock:
+                self._pins.subtract(pinned)
+                self._pins += Counter()  # Drops keys no call pins any more
+                self._evict()
+        return anomaly_scores, model_keys, model_versions
+
+    def _score_groups(self, groups, features, default_scorer, anomaly_scores, model_keys, model_versions):
+        for key, positions in groups.items():
+            scorer = self.model(key) if key != DEFAULT_MODEL_KEY else None
+            if scorer is None:
+                scorer, key = default_scorer, DEFAULT_MODEL_KEY
+            if len(groups) == 1:  # The common case of a single sensor or profile: no gather or scatter
+                anomaly_scores[:] = scorer.decision_function(features)
+                model_versions[:] = scorer.version
+            else:
+                anomaly_scores[positions] = scorer.decision_function(features[positions])
+                model_versions[positions] = scorer.version
+            if key != DEFAULT_MODEL_KEY:
+                for position in positions:
+                    model_keys[position] = key
+
+    def mapped_bytes(self):
+        """Size of the node arrays of the cached forests (memory-mapped; resident only where touched)."""
+        with self._lock:
+            scorers = [entry.scorer for entry in self._models.values()]
+        return sum(scorer.feature.nbytes + scorer.threshold.nbytes + scorer.children.nbytes
+                   + scorer.leaf_path_length.nbytes + scorer.roots.nbytes for scorer in scorers)
+
+    def stats(self):
+        with self._lock:
+            cached = {key: entry.scorer.version for key, entry in self._models.items()}
+        return {"path": self.root, "models": len(self._keys), "cache_size": self.cache_size, "cached": cached,
+                "routes_cached": len(self._routes), "hits": self.hits, "loads": self.loads,
+                "evictions": self.evictions, "mapped_bytes": self.mapped_bytes()}
+
+
+def train_profile_models(registry, profile_names=None, rows=PROFILE_TRAINING_ROWS,
+                         sensors=PROFILE_TRAINING_SENSORS, interval_seconds=PROFILE_READING_INTERVAL_SECONDS,
+                         seed=None):
+    """Trains and publishes the next version of one model per profile, keyed by the profile name, from
+    generate_normal_data.py's simulated normal readings of that profile over a whole day."""
+    from generate_normal_data import RANDOM_SEED, SENSOR_PROFILES_FOR_NORMAL, iter_lagged_rows
+    from model_training import train_isolation_forest, model_feature_schema
+    summaries = []
+    for name in profile_names or SENSOR_PROFILES_FOR_NORMAL:
+        start = time.perf_counter()
+        store = registry.store(name)
+        version = store.next_version()
+        X = np.concatenate(list(iter_lagged_rows(rows, sensors, seed=RANDOM_SEED if seed is None else seed,
+                                                 profile_names=[name], interval_seconds=interval_seconds)))
+        model = train_isolation_forest(X)
+        FlatIsolationForest.from_model(model, model_feature_schema(model), version=version).save(
+            store.version_path(version))
+        store.publish(version)
+        summaries.append({"model": name, "version": version, "training_rows": len(X),
+                          "training_seconds": round(time.perf_counter() - start, 2)})
+    return summaries
+
+
+def main():
+    from generate_normal_data import SENSOR_PROFILES_FOR_NORMAL
+    parser = argparse.ArgumentParser(description="Train one model per sensor profile into the model registry.")
+    parser.add_argument('--registry-dir', default=os.environ.get('MODEL_REGISTRY_DIR', MODEL_REGISTRY_DIR))
+    parser.add_argument('--profile', action='append', choices=list(SENSOR_PROFILES_FOR_NORMAL), dest='profiles',
+                        help="Train this profile's model (repeatable); default: all profiles")
+    parser.add_argument('--rows', type=int, default=PROFILE_TRAINING_ROWS, help="Training rows per profile")
+    parser.add_argument('--sensors', type=int, default=PROFILE_TRAINING_SENSORS,
+                        help="Simulated sensors per profile")
+    parser.add_argument('--interval-seconds', type=float, default=PROFILE_READING_INTERVAL_SECONDS,
+                        help="Simulated time between two readings of a sensor")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    registry = ModelRegistry(args.registry_dir)
+    for summary in train_profile_models(registry, args.profiles, args.rows, args.sensors, args.interval_seconds,
+                                        args.seed):
+        print(f"Trained version {summary['version']} of the '{summary['model']}' model on "
+              f"{summary['training_rows']} rows in {summary['training_seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
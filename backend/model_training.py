@@ -0,0 +1,210 @@
+# model_training.py
+# Training data I/O and Isolation Forest training for large datasets, optionally sharded across processes.
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from features import FEATURE_COLUMNS, FEATURE_SCHEMA_VERSION, TOTAL_FEATURES_FOR_MODEL, feature_schema
+from forest_scorer import FlatIsolationForest
+
+# --- CONFIGURATION ---
+TRAINING_DATA_FILE = 'normal_training_data_with_lags.npy'  # (rows, features) float64 .npy, loaded memory-mapped
+LEGACY_TRAINING_DATA_FILE = 'normal_training_data_with_lags.json'
+MODEL_PATH = 'anomaly_detection_model.joblib'
+LOAD_CHUNK_ROWS = 1_000_000  # Rows read from the memory-mapped file at a time when streaming
+N_ESTIMATORS = 100
+MAX_SAMPLES = 256  # Rows drawn per tree; sklearn's 'auto' is min(256, n_rows), so large datasets don't grow the trees
+CONTAMINATION = 0.01
+RANDOM_STATE = 42
+N_JOBS = -1  # Threads used by sklearn for the unsharded fit; -1 = all cores
+
+logger = logging.getLogger(__name__)
+
+
+# --- Training data ---
+def convert_json_to_npy(json_path, npy_path):
+    """Converts the legacy JSON list-of-rows training file into the binary .npy format."""
+    with open(json_path, 'r') as f:
+        data = np.asarray(json.load(f), dtype=np.float64)
+    np.save(npy_path, data)
+    return data.shape
+
+
+def open_training_data(path):
+    """Returns the training matrix at `path`. .npy files are memory-mapped, so rows are only read when used."""
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            data = np.asarray(json.load(f), dtype=np.float64)
+    else:
+        data = np.load(path, mmap_mode='r')
+    if data.ndim != 2:
+        raise ValueError(f"Training data in {path} must be 2D (rows, features), got shape {data.shape}")
+    return data
+
+
+def iter_training_chunks(path, chunk_rows=LOAD_CHUNK_ROWS, start=0, stop=None):
+    """Yields rows start..stop of the training data as in-memory arrays of at most `chunk_rows` rows."""
+    data = open_training_data(path)
+    stop = data.shape[0] if stop is None else min(stop, data.shape[0])
+    for chunk_start in range(start, stop, chunk_rows):
+        yield np.array(data[chunk_start:min(chunk_start + chunk_rows, stop)])
+
+
+# --- Training ---
+def train_isolation_forest(X, n_estimators=N_ESTIMATORS, max_samples=MAX_SAMPLES, contamination=CONTAMINATION,
+                           random_state=RANDOM_STATE, n_jobs=N_JOBS):
+    """Fits one IsolationForest on all of X in this process. Trees are built with `n_jobs` threads.
+
+    sklearn validates X into a float32 copy, so peak memory is at least half the size of X again.
+    X must be laid out as features.FEATURE_COLUMNS; the column names are stored on the model.
+    """
+    if X.shape[1] != TOTAL_FEATURES_FOR_MODEL:
+        raise ValueError(f"Training data has {X.shape[1]} columns, expected {TOTAL_FEATURES_FOR_MODEL} "
+                         f"({', '.join(FEATURE_COLUMNS)})")
+    from sklearn.ensemble import IsolationForest  # Only the training path pays for importing sklearn
+    model = IsolationForest(n_estimators=n_estimators, max_samples=min(max_samples, X.shape[0]),
+                            contamination=contamination, random_state=random_state, n_jobs=n_jobs)
+    model.fit(X)
+    # sklearn's own attribute for the training columns, so the schema travels inside the joblib file
+    model.feature_names_in_ = np.asarray(FEATURE_COLUMNS, dtype=object)
+    return model
+
+
+def model_feature_schema(model):
+    """The feature schema a fitted model was trained with.
+
+    Models saved before the schema existed have no feature_names_in_. They were all trained on
+    generate_normal_data.py output, which has always used the current, oldest-first layout.
+    """
+    names = getattr(model, 'feature_names_in_', None)
+    if names is None:
+        logger.info("Model has no stored feature columns; assuming the oldest-first layout of generate_normal_data.py")
+        return feature_schema()
+    return {"version": FEATURE_SCHEMA_VERSION, "columns": [str(name) for name in names]}
+
+
+def _train_shard(path, start, stop, n_estimators, max_samples, seed):
+    """Pool task: fits a sub-forest on rows start..stop. contamination='auto' skips scoring the shard,
+    because the threshold is computed once for the merged forest."""
+    X = np.array(open_training_data(path)[start:stop])
+    return train_isolation_forest(X, n_estimators=n_estimators, max_samples=max_samples, contamination='auto',
+                                  random_state=seed, n_jobs=1)
+
+
+def _score_rows(model_dir, path, start, stop):
+    """Pool task: score_samples of rows start..stop with the memory-mapped merged forest."""
+    scorer = FlatIsolationForest.load(model_dir)
+    return np.concatenate([scorer.score_samples(chunk)
+                           for chunk in iter_training_chunks(path, LOAD_CHUNK_ROWS, start, stop)])
+
+
+def merge_forests(forests):
+    """Combines fitted IsolationForests that share max_samples and features into one estimator.
+
+    The merged forest's scores are those of a single forest holding all the trees. offset_ is left to
+    the caller, because it depends on the scores of the whole training set. estimators_samples_ is
+    not meaningful afterwards, since each shard drew its sample indices from its own partition.
+    """
+    merged = forests[0]
+    for forest in forests[1:]:
+        if forest._max_samples != merged._max_samples or forest.n_features_in_ != merged.n_features_in_:
+            raise ValueError("Shards must use the same max_samples and number of features; "
+                             "make every shard at least max_samples rows")
+    merged.estimators_ = [tree for forest in forests for tree in forest.estimators_]
+    merged.estimators_features_ = [features for forest in forests for features in forest.estimators_features_]
+    merged._decision_path_lengths = tuple(p for forest in forests for p in forest._decision_path_lengths)
+    merged._average_path_length_per_tree = tuple(p for forest in forests for p in forest._average_path_length_per_tree)
+    merged.n_estimators = len(merged.estimators_)
+    return merged
+
+
+def train_sharded(path, n_shards, n_estimators=N_ESTIMATORS, max_samples=MAX_SAMPLES, contamination=CONTAMINATION,
+                  random_state=RANDOM_STATE, max_workers=None):
+    """Trains an IsolationForest on the .npy file at `path` with a process pool and returns one estimator.
+
+    The rows are split into `n_shards` contiguous partitions. Each worker reads only its own partition
+    from the memory-mapped file and builds n_estimators / n_shards trees on it, so no process ever holds
+    the whole dataset. The sub-forests are merged, and the contamination threshold (offset_) is set from
+    the merged forest's scores over every row, computed by the same pool in chunks. Every tree still
+    draws `max_samples` rows, but only from its own partition, so the partitions should each cover the
+    normal operating range. Shuffle the rows first if the file is ordered by sensor or by time.
+    """
+    n_rows = open_training_data(path).shape[0]
+    if n_shards < 1 or n_shards > n_estimators:
+        raise ValueError("n_shards must be between 1 and n_estimators")
+    bounds = np.linspace(0, n_rows, n_shards + 1, dtype=np.int64)
+    trees_per_shard = [len(t) for t in np.array_split(np.arange(n_estimators), n_shards)]
+    seeds = np.random.SeedSequence(random_state).generate_state(n_shards)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        forests = list(pool.map(_train_shard, [path] * n_shards, bounds[:-1], bounds[1:], trees_per_shard,
+                                [max_samples] * n_shards, [int(seed) for seed in seeds]))
+        model = merge_forests(forests)
+        model.contamination = contamination
+        if contamination == 'auto':
+            model.offset_ = -0.5  # Same fixed threshold sklearn uses for 'auto'
+            return model
+
+        model_dir = tempfile.mkdtemp(prefix='sharded_forest_')
+        try:
+            FlatIsolationForest.from_model(model, model_feature_schema(model)).save(model_dir)
+            score_bounds = np.arange(0, n_rows + LOAD_CHUNK_ROWS, LOAD_CHUNK_ROWS).clip(max=n_rows)
+            scores = np.concatenate(list(pool.map(_score_rows, [model_dir] * (len(score_bounds) - 1),
+                                                  [path] * (len(score_bounds) - 1),
+                                                  score_bounds[:-1], score_bounds[1:])))
+        finally:
+            shutil.rmtree(model_dir, ignore_errors=True)
+    # Same definition IsolationForest.fit uses for a numeric contamination
+    model.offset_ = np.percentile(scores, 100.0 * contamination)
+    return model
+
+
+def train_model(path, n_shards=1, n_estimators=N_ESTIMATORS, max_samples=MAX_SAMPLES, contamination=CONTAMINATION,
+                random_state=RANDOM_STATE, n_jobs=N_JOBS):
+    """Trains from a .npy (or legacy .json) training file, sharded across processes when n_shards > 1."""
+    if n_shards > 1:
+        if path.endswith('.json'):
+            raise ValueError("Sharded training needs the .npy format; convert the JSON file first")
+        return train_sharded(path, n_shards, n_estimators=n_estimators, max_samples=max_samples,
+                             contamination=contamination, random_state=random_state,
+                             max_workers=None if n_jobs == -1 else n_jobs)
+    return train_isolation_forest(open_training_data(path), n_estimators=n_estimators, max_samples=max_samples,
+                                  contamination=contamination, random_state=random_state, n_jobs=n_jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the Isolation Forest anomaly model.")
+    parser.add_argument('--data', default=TRAINING_DATA_FILE, help="Training data (.npy, or legacy .json)")
+    parser.add_argument('--output', default=MODEL_PATH, help="Where to write the joblib model")
+    parser.add_argument('--shards', type=int, default=1, help="Train sub-forests in this many processes and merge them")
+    parser.add_argument('--jobs', type=int, default=N_JOBS, help="Threads (unsharded) or processes (sharded); -1 = all cores")
+    parser.add_argument('--estimators', type=int, default=N_ESTIMATORS)
+    parser.add_argument('--max-samples', type=int, default=MAX_SAMPLES)
+    parser.add_argument('--contamination', type=float, default=CONTAMINATION)
+    parser.add_argument('--seed', type=int, default=RANDOM_STATE)
+    args = parser.parse_args()
+
+    if args.data.endswith('.json') and args.shards > 1:
+        npy_path = os.path.splitext(args.data)[0] + '.npy'
+        print(f"Converting {args.data} to {npy_path} ({convert_json_to_npy(args.data, npy_path)[0]} rows)")
+        args.data = npy_path
+
+    start = time.perf_counter()
+    model = train_model(args.data, n_shards=args.shards, n_estimators=args.estimators, max_samples=args.max_samples,
+                        contamination=args.contamination, random_state=args.seed, n_jobs=args.jobs)
+    print(f"✅ Trained {model.n_estimators} trees in {time.perf_counter() - start:.1f}s")
+
+    import joblib
+    joblib.dump(model, args.output)
+    print(f"✅ Model saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# nonce_manager.py
+# Local nonce allocation and gas price caching so transactions can be pipelined.
+import logging
+import threading
+import time
+
+# --- CONFIGURATION ---
+GAS_PRICE_TTL_SECONDS = 5.0  # How long a fetched gas price is reused before asking the node again
+
+logger = logging.getLogger(__name__)
+
+
+class NonceManager:
+    """Hands out consecutive nonces for one account without an RPC call per transaction.
+
+    The starting nonce is fetched from the node (including pending transactions) on first use.
+    Call resync() after a transaction fails to send or is dropped, so the next nonce is re-read
+    from the chain instead of leaving a gap that would block every later transaction.
+
+    Worker processes sending from the same account must share one counter: pass `shared_nonce`, a
+    multiprocessing.Value('q', -1) created before forking (-1 means "fetch from the chain"), and
+    `shared_timestamp`, a multiprocessing.Value('q', 0, lock=False) for next_ordered_nonce().
+    """
+
+    def __init__(self, w3, account, shared_nonce=None, shared_timestamp=None):
+        self.w3 = w3
+        self.account = account
+        self._shared_nonce = shared_nonce
+        self._shared_timestamp = shared_timestamp
+        self._lock = shared_nonce.get_lock() if shared_nonce is not None else threading.Lock()
+        self._next_nonce = None
+        self._last_timestamp = 0
+
+    def _get(self):
+        if self._shared_nonce is None:
+            return self._next_nonce
+        return None if self._shared_nonce.value < 0 else self._shared_nonce.value
+
+    def _set(self, nonce):
+        if self._shared_nonce is None:
+            self._next_nonce = nonce
+        else:
+            self._shared_nonce.value = -1 if nonce is None else nonce
+
+    def _allocate(self):
+        nonce = self._get()
+        if nonce is None:
+            nonce = self.w3.eth.get_transaction_count(self.account, 'pending')
+        self._set(nonce + 1)
+        return nonce
+
+    def next_nonce(self):
+        with self._lock:
+            return self._allocate()
+
+    def next_ordered_nonce(self, timestamps):
+        """Next nonce plus `timestamps` raised where needed so they never decrease, within the list or across
+        calls. Transactions from one account are mined in nonce order, so records sent with these timestamps
+        reach the contract in timestamp order whichever thread or worker process sent them. Best effort: the
+        floor starts from 0 in a new process, so after a restart or a clock step back order can still break."""
+        with self._lock:
+            nonce = self._allocate()
+            floor = self._last_timestamp if self._shared_timestamp is None else self._shared_timestamp.value
+            ordered = []
+            for timestamp in timestamps:
+                floor = max(floor, timestamp)
+                ordered.append(floor)
+            if self._shared_timestamp is None:
+                self._last_timestamp = floor
+            else:
+                self._shared_timestamp.value = floor
+            return nonce, ordered
+
+    def needs_sync(self):
+        with self._lock:
+            return self._get() is None
+
+    def seed(self, nonce):
+        """Sets the next nonce from a value fetched elsewhere (a batched request), unless one is already set."""
+        with self._lock:
+            if self._get() is None:
+                self._set(nonce)
+
+    def resync(self):
+        """Discards the local counter; the next call to next_nonce() fetches it from the chain again."""
+        with self._lock:
+            self._set(None)
+        logger.info("Nonce for %s will be resynced from the chain", self.account)
+
+
+class GasPriceCache:
+    """Caches w3.eth.gas_price for a short TTL."""
+
+    def __init__(self, w3, ttl=GAS_PRICE_TTL_SECONDS):
+        self.w3 = w3
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._gas_price = None
+        self._fetched_at = 0.0
+
+    def is_stale(self):
+        with self._lock:
+            return self._gas_price is None or time.monotonic() - self._fetched_at >= self.ttl
+
+    def seed(self, gas_price):
+        with self._lock:
+            self._gas_price = gas_price
+            self._fetched_at = time.monotonic()
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._gas_price is None or now - self._fetched_at >= self.ttl:
+                self._gas_price = self.w3.eth.gas_price
+                self._fetched_at = now
+            return self._gas_price
+
+
+def prefetch_transaction_params(w3, nonce_manager, gas_price_cache):
+    """Fetches the pending nonce and the gas price in one JSON-RPC batch when both are needed.
+
+    Sending a transaction right after startup or a nonce resync would otherwise cost two more serial
+    round trips. If only one is needed, or the node rejects the batch, nothing is done here and
+    next_nonce() / get() fetch what they need themselves.
+    """
+    if not (nonce_manager.needs_sync() and gas_price_cache.is_stale()):
+        return
+    try:
+        with w3.batch_requests() as batch:
+            batch.add(w3.eth.get_transaction_count(nonce_manager.account, 'pending'))
+            batch.add(w3.eth.gas_price)
+            nonce, gas_price = batch.execute()
+    except Exception as e:
+        logger.debug("Batched nonce and gas price request failed, fetching them separately: %s", e)
+        return
+    nonce_manager.seed(nonce)
+    gas_price_cache.seed(gas_price)
@@ -0,0 +1,179 @@
+# rpc_client.py
+# HTTP transport for web3's JSON-RPC calls: one pooled keep-alive session per process, bounded timeouts,
+# retries with jittered backoff and a circuit breaker that fails calls immediately while the node is down.
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- CONFIGURATION ---
+RPC_CONNECT_TIMEOUT_SECONDS = 2.0
+RPC_READ_TIMEOUT_SECONDS = 10.0  # web3's default is 30s for both
+RPC_MAX_RETRIES = 2  # Extra attempts after the first one
+RPC_BACKOFF_BASE_SECONDS = 0.1  # Attempt n waits a random time in [0, min(base * 2**n, max)]
+RPC_BACKOFF_MAX_SECONDS = 2.0
+BREAKER_FAILURE_THRESHOLD = 5  # Consecutive failed attempts that open the circuit
+BREAKER_RESET_SECONDS = 10.0  # How long an open circuit rejects calls before letting one trial call through
+# Calls that only read state are safe to repeat after any failure. Anything else (eth_sendTransaction) is only
+# retried when the connection could not be made, i.e. the node cannot have received it.
+READ_ONLY_METHODS = frozenset({
+    'eth_accounts', 'eth_blockNumber', 'eth_call', 'eth_chainId', 'eth_estimateGas', 'eth_gasPrice',
+    'eth_getBlockByHash', 'eth_getBlockByNumber', 'eth_getLogs', 'eth_getTransactionCount',
+    'eth_getTransactionReceipt', 'net_version', 'web3_clientVersion',
+})
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of contacting the node while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calls to a failing node so callers fail in microseconds instead of waiting for timeouts.
+
+    After `failure_threshold` consecutive failures the circuit opens and allow() returns False for
+    `reset_seconds`. Then a single trial call is let through (half-open): success closes the circuit,
+    failure opens it for another `reset_seconds`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("✅ RPC node is answering again; circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    logger.warning("❗ %d consecutive RPC failures; rejecting RPC calls for %ss",
+                                   self._failures, self.reset_seconds)
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return self.OPEN
+            return self.HALF_OPEN
+
+
+def _rpc_method(body):
+    """JSON-RPC method name of a request body; 'batch' for batch requests."""
+    try:
+        payload = json.loads(body)
+    except (TypeError, ValueError):
+        return 'unknown'
+    if isinstance(payload, list):
+        return 'batch'
+    return payload.get('method', 'unknown') if isinstance(payload, dict) else 'unknown'
+
+
+def _batch_is_read_only(body):
+    payload = json.loads(body)
+    return all(isinstance(call, dict) and call.get('method') in READ_ONLY_METHODS for call in payload)
+
+
+class ResilientRPCAdapter(HTTPAdapter):
+    """requests adapter applying the timeout, retry and circuit breaker policy to every JSON-RPC POST.
+
+    `on_request(method, seconds, outcome)` is called once per attempt, with outcome 'ok', 'error' (the
+    attempt failed or the node answered 5xx) or 'rejected' (the circuit was open).
+    """
+
+    def __init__(self, breaker, pool_size, max_retries=RPC_MAX_RETRIES, backoff_base=RPC_BACKOFF_BASE_SECONDS,
+                 backoff_max=RPC_BACKOFF_MAX_SECONDS, timeout=(RPC_CONNECT_TIMEOUT_SECONDS, RPC_READ_TIMEOUT_SECONDS),
+                 on_request=None):
+        super().__init__(pool_connections=1, pool_maxsize=pool_size)
+        self.breaker = breaker
+        self.rpc_max_retries = max_retries  # HTTPAdapter already has a max_retries (urllib3's, left at 0)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.on_request = on_request
+
+    def _observe(self, method, seconds, outcome):
+        if self.on_request is not None:
+            self.on_request(method, seconds, outcome)
+
+    def _can_retry(self, method, body, error=None):
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        if method == 'batch':
+            return _batch_is_read_only(body)
+        return method in READ_ONLY_METHODS
+
+    def send(self, request, timeout=None, **kwargs):
+        method = _rpc_method(request.body)
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._observe(method, 0.0, 'rejected')
+                raise CircuitOpenError(f"RPC circuit open; not calling {method}", request=request)
+            start = time.perf_counter()
+            try:
+                response = super().send(request, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record_failure()
+                self._observe(method, time.perf_counter() - start, 'error')
+                if attempt >= self.rpc_max_retries or not self._can_retry(method, request.body, e):
+                    raise
+                error = e
+            else:
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    self._observe(method, time.perf_counter() - start, 'ok')
+                    return response
+                self.breaker.record_failure()
+                self._observe(method, time.perf_counter() - start, 'error')
+                if attempt >= self.rpc_max_retries or not self._can_retry(method, request.body):
+                    return response  # web3 raises HTTPError for it
+                error = f"HTTP {response.status_code}"
+                response.close()
+            delay = random.uniform(0, min(self.backoff_base * 2 ** attempt, self.backoff_max))
+            logger.debug("Retrying %s in %.2fs after: %s", method, delay, error)
+            time.sleep(delay)
+            attempt += 1
+
+
+def make_rpc_session(breaker, pool_size, on_request=None, **adapter_kwargs):
+    """A keep-alive session whose connection pool holds `pool_size` connections to the node.
+
+    Pass it to Web3.HTTPProvider(session=...) together with exception_retry_configuration=None, so web3 does
+    not add its own retries on top of the adapter's.
+    """
+    session = requests.Session()
+    adapter = ResilientRPCAdapter(breaker, pool_size, on_request=on_request, **adapter_kwargs)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -0,0 +1,540 @@
+# sensor_history.py
+# Compact per-sensor lag history: one preallocated ring buffer array for every sensor.
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# --- CONFIGURATION ---
+INITIAL_SENSOR_CAPACITY = 1024  # Rows allocated up front; the buffer doubles when it runs out
+MAX_TRACKED_SENSORS = 200000  # Least recently seen sensor is evicted beyond this; None for unbounded
+SENSOR_IDLE_TTL_SECONDS = 3600  # Sensors silent for longer than this are dropped by the sweeper
+IDLE_SWEEP_INTERVAL_SECONDS = 60
+INDEX_ENTRY_OVERHEAD_BYTES = 120  # Rough per-sensor cost of the id -> row map (key, entry, boxed int)
+SNAPSHOT_PATH = 'sensor_history_snapshot.npz'
+SNAPSHOT_INTERVAL_SECONDS = 30
+MAX_SENSOR_ID_BYTES = 64  # Longest sensor ID (UTF-8) accepted; the shared store keeps whole IDs per row for snapshots
+SHARED_EVICTION_FRACTION = 0.01  # When the shared store is full, this fraction of least recently seen rows is freed
+
+logger = logging.getLogger(__name__)
+
+
+class SensorHistoryStore:
+    """Ring buffer of the last `window` readings of every sensor, held in one NumPy array.
+
+    Storage is a (capacity, window, features) array plus a per-row write cursor and reading count,
+    and a sensor_id -> row index map. Appending a reading is a single slot write, and a sensor's window
+    of readings is produced by one fancy-index gather, for one sensor or for a whole batch, without
+    building Python lists. Windows come back oldest reading first; features.py turns them into rows.
+
+    The id -> row map is kept in least-recently-seen order, so evicting the LRU sensor once
+    `max_sensors` are tracked, and dropping sensors idle for longer than a TTL, are O(1) per evicted
+    sensor. Freed rows are reused. Callers that combine several calls (look up rows, append, gather)
+    should hold `lock` for the whole sequence so the idle sweeper cannot evict a row in between.
+    """
+
+    def __init__(self, window, features, initial_capacity=INITIAL_SENSOR_CAPACITY, dtype=np.float64,
+                 max_sensors=MAX_TRACKED_SENSORS):
+        self.window = window
+        self.features = features
+        self.dtype = np.dtype(dtype)
+        self.max_sensors = max_sensors
+        if max_sensors is not None:
+            initial_capacity = min(initial_capacity, max_sensors)
+        self._buffer = np.zeros((initial_capacity, window, features), dtype=self.dtype)
+        self._cursor = np.zeros(initial_capacity, dtype=np.int64)  # Slot the next reading is written to
+        self._counts = np.zeros(initial_capacity, dtype=np.int64)  # Readings held, saturating at `window`
+        self._last_seen = np.zeros(initial_capacity, dtype=np.float64)  # time.monotonic() of the last lookup
+        self._rows = OrderedDict()  # sensor_id -> row index, least recently seen first
+        self._free_rows = []  # Rows released by eviction, reused before the arrays grow
+        self._next_row = 0
+        self._oldest_first = np.arange(window, dtype=np.int64)
+        self.lock = threading.RLock()
+        self.lru_evictions = 0
+        self.idle_evictions = 0
+        self._sweeper = None
+        self._snapshotter = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, sensor_id):
+        return str(sensor_id) in self._rows
+
+    @property
+    def capacity(self):
+        return self._buffer.shape[0]
+
+    def row_for(self, sensor_id, now=None):
+        """Returns the sensor's row and marks it most recently seen.
+
+        On first sight a row is allocated: a freed row if there is one, otherwise the next unused row
+        (growing the arrays if needed), otherwise the least recently seen sensor's row. Sensor IDs are kept
+        as strings, as snapshots store them, so 42 and '42' are the same sensor before and after a restore.
+        """
+        now = time.monotonic() if now is None else now
+        sensor_id = str(sensor_id)
+        with self.lock:
+            row = self._rows.get(sensor_id)
+            if row is not None:
+                self._rows.move_to_end(sensor_id)
+            else:
+                row = self._allocate_row()
+                self._rows[sensor_id] = row
+            self._last_seen[row] = now
+            return row
+
+    def _allocate_row(self):
+        if self.max_sensors is not None and len(self._rows) >= self.max_sensors:
+            self._release(*self._rows.popitem(last=False))
+            self.lru_evictions += 1
+        if self._free_rows:
+            return self._free_rows.pop()
+        if self._next_row >= self.capacity:
+            new_capacity = 2 * self.capacity
+            if self.max_sensors is not None:
+                new_capacity = min(new_capacity, self.max_sensors)
+            self._grow(new_capacity)
+        row = self._next_row
+        self._next_row += 1
+        return row
+
+    def _release(self, sensor_id, row):
+        self._cursor[row] = 0
+        self._counts[row] = 0
+        self._free_rows.append(row)
+
+    def evict_idle(self, ttl_seconds, now=None):
+        """Drops every sensor not seen for `ttl_seconds`. Returns how many were evicted."""
+        cutoff = (time.monotonic() if now is None else now) - ttl_seconds
+        evicted = 0
+        with self.lock:
+            # LRU order means idle sensors sit at the front; stop at the first one that is still active
+            while self._rows:
+                sensor_id, row = next(iter(self._rows.items()))
+                if self._last_seen[row] >= cutoff:
+                    break
+                del self._rows[sensor_id]
+                self._release(sensor_id, row)
+                evicted += 1
+            self.idle_evictions += evicted
+        return evicted
+
+    def start_idle_sweeper(self, ttl_seconds=SENSOR_IDLE_TTL_SECONDS, interval_seconds=IDLE_SWEEP_INTERVAL_SECONDS):
+        """Runs evict_idle() every `interval_seconds` on a daemon thread."""
+        def sweep():
+            while True:
+                time.sleep(interval_seconds)
+                evicted = self.evict_idle(ttl_seconds)
+                if evicted:
+                    logger.info("Evicted %d sensors idle for more than %ss", evicted, ttl_seconds)
+
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=sweep, name="sensor-history-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _grow(self, new_capacity):
+        old_capacity = self.capacity
+        buffer = np.zeros((new_capacity, self.window, self.features), dtype=self.dtype)
+        buffer[:old_capacity] = self._buffer
+        self._buffer = buffer
+        self._cursor = np.concatenate([self._cursor, np.zeros(new_capacity - old_capacity, dtype=np.int64)])
+        self._counts = np.concatenate([self._counts, np.zeros(new_capacity - old_capacity, dtype=np.int64)])
+        self._last_seen = np.concatenate([self._last_seen, np.zeros(new_capacity - old_capacity)])
+
+    def count(self, sensor_id):
+        row = self._rows.get(str(sensor_id))
+        return 0 if row is None else int(self._counts[row])
+
+    # --- Writes ---
+    def append(self, sensor_id, reading):
+        """Appends one reading for a sensor. Returns (row, number of readings now held)."""
+        with self.lock:
+            row = self.row_for(sensor_id)
+            cursor = self._cursor[row]
+            self._buffer[row, cursor] = reading
+            self._cursor[row] = (cursor + 1) % self.window
+            if self._counts[row] < self.window:
+                self._counts[row] += 1
+            return row, int(self._counts[row])
+
+    def append_batch(self, rows, readings):
+        """Appends readings[i] to rows[i] for every i in one scatter. `rows` must not contain duplicates.
+
+        Returns the number of readings each row now holds.
+        """
+        cursors = self._cursor[rows]
+        self._buffer[rows, cursors] = readings
+        self._cursor[rows] = (cursors + 1) % self.window
+        self._counts[rows] = np.minimum(self._counts[rows] + 1, self.window)
+        return self._counts[rows]
+
+    def append_readings(self, sensor_ids, readings, now=None, on_round=None):
+        """Appends readings from any number of sensors, each sensor's readings in input order.
+
+        Round k applies the k-th reading of every sensor at once, so rows are unique within a round.
+        Returns (counts, windows): the readings each sensor held after every reading was appended, and
+        the (len(sensor_ids), window, features) window ending at that reading, oldest first. Windows are
+        only filled where counts == window. Raises ValueError if the readings come from more sensors
+        than `max_sensors`, since rows of earlier sensors would be reused before their readings land.
+
+        `on_round(positions, rows, readings, counts)`, if given, is called after every round under `lock`
+        with the input positions applied in it, e.g. to keep per-row state in step with the history.
+        """
+        readings = np.asarray(readings, dtype=self.dtype).reshape(-1, self.features)
+        sensor_ids = [str(sensor_id) for sensor_id in sensor_ids]  # As row_for() keys them
+        occurrences = {}  # sensor_id -> readings of that sensor seen so far
+        rounds = np.empty(len(sensor_ids), dtype=np.int64)
+        for position, sensor_id in enumerate(sensor_ids):
+            rounds[position] = occurrences.get(sensor_id, 0)
+            occurrences[sensor_id] = rounds[position] + 1
+        if self.max_sensors is not None and len(occurrences) > self.max_sensors:
+            raise ValueError(f"{len(occurrences)} distinct sensors; at most {self.max_sensors} can be tracked")
+
+        counts = np.zeros(len(sensor_ids), dtype=np.int64)
+        windows = np.zeros((len(sensor_ids), self.window, self.features), dtype=self.dtype)
+        with self.lock:
+            now = time.monotonic() if now is None else now
+            rows = np.array([self.row_for(sensor_id, now) for sensor_id in sensor_ids], dtype=np.int64)
+            for round_number in range(int(rounds.max()) + 1 if len(rounds) else 0):
+                selected = np.flatnonzero(rounds == round_number)
+                counts[selected] = self.append_batch(rows[selected], readings[selected])
+                if on_round is not None:
+                    on_round(selected, rows[selected], readings[selected], counts[selected])
+                selected = selected[counts[selected] >= self.window]
+                windows[selected] = self.readings_batch(rows[selected])
+        return counts, windows
+
+    # --- Reading windows ---
+    def _slots(self, cursors):
+        # Once the ring is full, the oldest reading sits at the cursor (the next slot to be overwritten)
+        return (cursors[..., None] + self._oldest_first) % self.window
+
+    def readings(self, row):
+        """(window, features) readings of one row, oldest first (the order features.py expects)."""
+        return self._buffer[row, self._slots(self._cursor[row])]
+
+    def readings_batch(self, rows):
+        """(len(rows), window, features) readings of many rows, oldest first, in one fancy-index gather."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return self._buffer[rows[:, None], self._slots(self._cursor[rows])]
+
+    def estimated_bytes(self):
+        arrays = self._buffer.nbytes + self._cursor.nbytes + self._counts.nbytes + self._last_seen.nbytes
+        return arrays + len(self._rows) * INDEX_ENTRY_OVERHEAD_BYTES
+
+    def stats(self):
+        with self.lock:
+            return {
+                "tracked_sensors": len(self._rows),
+                "max_sensors": self.max_sensors,
+                "capacity_rows": self.capacity,
+                "free_rows": len(self._free_rows),
+                "lru_evictions": self.lru_evictions,
+                "idle_evictions": self.idle_evictions,
+                "estimated_bytes": self.estimated_bytes()
+            }
+
+    # --- Snapshots ---
+    def save_snapshot(self, path=SNAPSHOT_PATH):
+        """Atomically writes every tracked sensor's ring buffer to an uncompressed .npz file.
+
+        Only occupied rows are written, in least-recently-seen order, together with the sensor IDs
+        (stored as strings) and how long ago each sensor was last seen. The file is written to a
+        temporary name, fsynced and then renamed over `path`, so a crash mid-write never leaves a
+        truncated snapshot behind. Returns the number of sensors written.
+        """
+        with self.lock:
+            sensor_ids, rows = self._rows_by_recency()
+            buffer = self._buffer[rows]
+            cursor = self._cursor[rows]
+            counts = self._counts[rows]
+            idle_seconds = time.monotonic() - self._last_seen[rows]
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, sensor_ids=np.array(sensor_ids, dtype=str), buffer=buffer, cursor=cursor, counts=counts,
+                     idle_seconds=idle_seconds, shape=np.array([self.window, self.features]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return len(sensor_ids)
+
+    def load_snapshot(self, path=SNAPSHOT_PATH):
+        """Replaces the store's contents with a snapshot written by save_snapshot().
+
+        Returns the number of sensors restored, or 0 (leaving the store untouched) when the file is
+        missing or was written with a different window/feature layout.
+        """
+        if not os.path.exists(path):
+            return 0
+        with np.load(path) as snapshot:
+            if tuple(snapshot['shape']) != (self.window, self.features):
+                logger.error("❌ Ignoring history snapshot %s: layout %s does not match (%d, %d)",
+                             path, tuple(snapshot['shape']), self.window, self.features)
+                return 0
+            sensor_ids = snapshot['sensor_ids'].tolist()
+            buffer = snapshot['buffer'].astype(self.dtype, copy=False)
+            cursor = snapshot['cursor']
+            counts = snapshot['counts']
+            idle_seconds = snapshot['idle_seconds']
+
+        if self.max_sensors is not None and len(sensor_ids) > self.max_sensors:
+            # Keep the most recently seen sensors; the arrays are in least-recently-seen order
+            keep = len(sensor_ids) - self.max_sensors
+            sensor_ids, buffer, cursor, counts, idle_seconds = (
+                sensor_ids[keep:], buffer[keep:], cursor[keep:], counts[keep:], idle_seconds[keep:])
+
+        with self.lock:
+            self._restore(sensor_ids, buffer, cursor, counts, time.monotonic() - idle_seconds)
+        return len(sensor_ids)
+
+    def _rows_by_recency(self):
+        """(sensor_ids, rows) of every tracked sensor, least recently seen first."""
+        sensor_ids = list(self._rows.keys())
+        return sensor_ids, np.fromiter(self._rows.values(), dtype=np.int64, count=len(sensor_ids))
+
+    def _restore(self, sensor_ids, buffer, cursor, counts, last_seen):
+        restored = len(sensor_ids)
+        capacity = max(restored, INITIAL_SENSOR_CAPACITY)
+        if self.max_sensors is not None:
+            capacity = min(capacity, self.max_sensors)
+        self._buffer = np.zeros((capacity, self.window, self.features), dtype=self.dtype)
+        self._cursor = np.zeros(capacity, dtype=np.int64)
+        self._counts = np.zeros(capacity, dtype=np.int64)
+        self._last_seen = np.zeros(capacity, dtype=np.float64)
+        self._buffer[:restored] = buffer
+        self._cursor[:restored] = cursor
+        self._counts[:restored] = counts
+        self._last_seen[:restored] = last_seen
+        self._rows = OrderedDict(zip(sensor_ids, range(restored)))
+        self._free_rows = []
+        self._next_row = restored
+
+    def start_snapshotter(self, path=SNAPSHOT_PATH, interval_seconds=SNAPSHOT_INTERVAL_SECONDS):
+        """Calls save_snapshot() every `interval_seconds` on a daemon thread."""
+        def snapshot_loop():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.save_snapshot(path)
+                except Exception as e:
+                    logger.error("❌ Error writing sensor history snapshot to %s: %s", path, e)
+
+        if self._snapshotter is None:
+            self._snapshotter = threading.Thread(target=snapshot_loop, name="sensor-history-snapshotter",
+                                                 daemon=True)
+            self._snapshotter.start()
+
+
+class SharedSensorHistoryStore(SensorHistoryStore):
+    """SensorHistoryStore whose arrays and sensor index live in one anonymous shared memory mapping.
+
+    Create it before forking worker processes: every worker then reads and writes the same lag
+    windows, so consecutive readings of a sensor may be served by different workers. `lock` is a
+    process-shared lock with the same role as in SensorHistoryStore.
+
+    The id -> row map is an open-addressing hash table of 64-bit BLAKE2 sensor ID hashes, with rows
+    preallocated for `max_sensors` sensors (the mapping cannot grow once shared). Least-recently-seen
+    order is not tracked per access; when the store is full, the SHARED_EVICTION_FRACTION of rows
+    with the oldest last-seen time are evicted in one pass.
+    """
+
+    _EMPTY = -1
+    _DELETED = -2
+    # Header slots (int64)
+    _USED, _DELETED_SLOTS, _FREE_TOP, _LRU_EVICTIONS, _IDLE_EVICTIONS = range(5)
+
+    def __init__(self, window, features, dtype=np.float64, max_sensors=MAX_TRACKED_SENSORS):
+        if not max_sensors:
+            raise ValueError("SharedSensorHistoryStore needs a max_sensors bound")
+        self.window = window
+        self.features = features
+        self.dtype = np.dtype(dtype)
+        self.max_sensors = max_sensors
+        self._oldest_first = np.arange(window, dtype=np.int64)
+        self.lock = multiprocessing.RLock()
+        self._sweeper = None
+        self._snapshotter = None
+
+        table_size = 1 << (2 * max_sensors - 1).bit_length()  # Power of two, at most half full
+        layout = [
+            ('_header', np.int64, (8,)),
+            ('_buffer', self.dtype, (max_sensors, window, features)),
+            ('_cursor', np.int64, (max_sensors,)),
+            ('_counts', np.int64, (max_sensors,)),
+            ('_last_seen', np.float64, (max_sensors,)),
+            ('_row_keys', np.uint64, (max_sensors,)),  # 0 marks a free row
+            ('_row_ids', f'S{MAX_SENSOR_ID_BYTES}', (max_sensors,)),
+            ('_free_rows', np.int64, (max_sensors,)),  # Stack of free rows, top at header[_FREE_TOP]
+            ('_table', np.int64, (table_size,)),  # Row index, _EMPTY or _DELETED
+        ]
+        offsets, size = [], 0
+        for _, dtype_, shape in layout:
+            size = -(-size // 64) * 64  # Align every array to a cache line
+            offsets.append(size)
+            size += np.dtype(dtype_).itemsize * int(np.prod(shape))
+        self._mapping = mmap.mmap(-1, size)  # Anonymous and MAP_SHARED: inherited by forked children
+        for (name, dtype_, shape), offset in zip(layout, offsets):
+            setattr(self, name, np.ndarray(shape, dtype=dtype_, buffer=self._mapping, offset=offset))
+        self._table_mask = table_size - 1
+        self._reset()
+
+    def _reset(self):
+        self._header[:] = 0
+        self._cursor[:] = 0
+        self._counts[:] = 0
+        self._row_keys[:] = 0
+        self._table[:] = self._EMPTY
+        self._free_rows[:] = np.arange(self.max_sensors - 1, -1, -1)  # Hand out row 0 first
+        self._header[self._FREE_TOP] = self.max_sensors
+
+    def __len__(self):
+        return int(self._header[self._USED])
+
+    def __contains__(self, sensor_id):
+        return self._find(self._key(sensor_id))[0] is not None
+
+    @property
+    def capacity(self):
+        return self.max_sensors
+
+    @property
+    def lru_evictions(self):
+        return int(self._header[self._LRU_EVICTIONS])
+
+    @property
+    def idle_evictions(self):
+        return int(self._header[self._IDLE_EVICTIONS])
+
+    @staticmethod
+    def _key(sensor_id):
+        digest = hashlib.blake2b(str(sensor_id).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1  # 0 is reserved for free rows
+
+    def _find(self, key):
+        """(row, table position) of `key`, or (None, position where it would be inserted)."""
+        position, insert_at = key & self._table_mask, None
+        while True:
+            row = int(self._table[position])
+            if row == self._EMPTY:
+                return None, position if insert_at is None else insert_at
+            if row == self._DELETED:
+                if insert_at is None:
+                    insert_at = position
+            elif int(self._row_keys[row]) == key:
+                return row, position
+            position = (position + 1) & self._table_mask
+
+    def row_for(self, sensor_id, now=None):
+        """Returns the sensor's row and marks it seen, allocating a row on first sight."""
+        now = time.monotonic() if now is None else now
+        key = self._key(sensor_id)
+        with self.lock:
+            row, position = self._find(key)
+            if row is None:
+                # A truncated ID would be restored from a snapshot under another key, or collide with another
+                encoded_id = str(sensor_id).encode()
+                if len(encoded_id) > MAX_SENSOR_ID_BYTES:
+                    raise ValueError(f"Sensor ID longer than {MAX_SENSOR_ID_BYTES} bytes: {sensor_id!r}")
+                if self._header[self._USED] >= self.max_sensors:
+                    self._evict_least_recent()
+                    position = self._find(key)[1]  # Eviction may have freed an earlier slot
+                top = self._header[self._FREE_TOP] - 1
+                row = int(self._free_rows[top])
+                self._header[self._FREE_TOP] = top
+                if self._table[position] == self._DELETED:
+                    self._header[self._DELETED_SLOTS] -= 1
+                self._table[position] = row
+                self._row_keys[row] = key
+                self._row_ids[row] = encoded_id
+                self._header[self._USED] += 1
+            self._last_seen[row] = now
+            return row
+
+    def _release_rows(self, rows):
+        for row in rows:
+            row = int(row)
+            position = self._find(int(self._row_keys[row]))[1]
+            self._table[position] = self._DELETED
+            self._row_keys[row] = 0
+            self._cursor[row] = 0
+            self._counts[row] = 0
+            top = self._header[self._FREE_TOP]
+            self._free_rows[top] = row
+            self._header[self._FREE_TOP] = top + 1
+        self._header[self._USED] -= len(rows)
+        self._header[self._DELETED_SLOTS] += len(rows)
+        if self._header[self._DELETED_SLOTS] > len(self._table) // 4:
+            self._rebuild_table()
+
+    def _rebuild_table(self):
+        """Re-inserts every occupied row so probe sequences stop running over deleted slots."""
+        self._table[:] = self._EMPTY
+        self._header[self._DELETED_SLOTS] = 0
+        for row in np.flatnonzero(self._row_keys):
+            position = int(self._row_keys[row]) & self._table_mask
+            while self._table[position] != self._EMPTY:
+                position = (position + 1) & self._table_mask
+            self._table[position] = row
+
+    def _occupied_rows(self):
+        return np.flatnonzero(self._row_keys)
+
+    def _evict_least_recent(self):
+        occupied = self._occupied_rows()
+        evict = max(1, int(len(occupied) * SHARED_EVICTION_FRACTION))
+        victims = occupied[np.argpartition(self._last_seen[occupied], evict - 1)[:evict]]
+        self._release_rows(victims)
+        self._header[self._LRU_EVICTIONS] += len(victims)
+
+    def evict_idle(self, ttl_seconds, now=None):
+        """Drops every sensor not seen for `ttl_seconds`. Returns how many were evicted."""
+        cutoff = (time.monotonic() if now is None else now) - ttl_seconds
+        with self.lock:
+            occupied = self._occupied_rows()
+            victims = occupied[self._last_seen[occupied] < cutoff]
+            self._release_rows(victims)
+            self._header[self._IDLE_EVICTIONS] += len(victims)
+        return len(victims)
+
+    def count(self, sensor_id):
+        row = self._find(self._key(sensor_id))[0]
+        return 0 if row is None else int(self._counts[row])
+
+    def estimated_bytes(self):
+        return len(self._mapping)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "tracked_sensors": len(self),
+                "max_sensors": self.max_sensors,
+                "capacity_rows": self.capacity,
+                "free_rows": int(self._header[self._FREE_TOP]),
+                "lru_evictions": self.lru_evictions,
+                "idle_evictions": self.idle_evictions,
+                "estimated_bytes": self.estimated_bytes(),
+                "shared": True
+            }
+
+    # --- Snapshots (same file format as SensorHistoryStore) ---
+    def _rows_by_recency(self):
+        occupied = self._occupied_rows()
+        rows = occupied[np.argsort(self._last_seen[occupied], kind='stable')]
+        return [sensor_id.decode(errors='replace') for sensor_id in self._row_ids[rows]], rows
+
+    def _restore(self, sensor_ids, buffer, cursor, counts, last_seen):
+        self._reset()
+        rows = np.array([self.row_for(sensor_id) for sensor_id in sensor_ids], dtype=np.int64)
+        if len(rows):
+            self._buffer[rows] = buffer
+            self._cursor[rows] = cursor
+            self._counts[rows] = counts
+            self._last_seen[rows] = last_seen
@@ -0,0 +1,421 @@
+# sharded_detector.py
+# Pipeline mode: one ingestion front end hands readings to detection worker processes, each owning the lag
+# history of the sensors that hash to it.
+import bisect
+import hashlib
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from features import build_feature_batch, check_feature_schema
+from forest_scorer import FlatIsolationForest
+from model_lifecycle import ModelWatcher
+from model_registry import DEFAULT_MODEL_KEY
+from sensor_history import (SensorHistoryStore, MAX_TRACKED_SENSORS, SENSOR_IDLE_TTL_SECONDS,
+                            IDLE_SWEEP_INTERVAL_SECONDS, SNAPSHOT_INTERVAL_SECONDS)
+from streaming_detector import StreamingDetector
+
+# --- CONFIGURATION ---
+RING_POINTS_PER_SHARD = 64  # Virtual nodes per shard; more points spread sensors more evenly
+# A worker tracks its ring share of max_sensors plus this many standard deviations of the binomial spread of
+# sensors over shards, so a shard only fills up early when the hashing is this unlucky
+SHARD_CAPACITY_SIGMAS = 4.0
+MICRO_BATCH_MAX_READINGS = 4096  # A worker scores whatever is queued for it, up to this many readings at once
+DETECTION_TIMEOUT_SECONDS = 10.0  # detect() gives up waiting for the workers after this long
+WORKER_CHECK_INTERVAL_SECONDS = 0.5  # While waiting, detect() checks this often that its workers are alive
+WORKER_STOP_TIMEOUT_SECONDS = 10.0  # stop() waits this long for each worker to write its final snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerUnavailable(RuntimeError):
+    """A detection worker died before answering; it has been restarted, but the readings sent to it are lost."""
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent-hash partition of sensor IDs over `shards` shards.
+
+    Every shard owns RING_POINTS_PER_SHARD points on a 64-bit ring and a sensor belongs to the first
+    point at or after its hash. The hash is stable across processes and restarts (unlike hash()), and
+    changing the number of shards moves only about 1/shards of the sensors.
+    """
+
+    def __init__(self, shards, points_per_shard=RING_POINTS_PER_SHARD):
+        points = sorted((_hash64(f"shard-{shard}-{point}"), shard)
+                        for shard in range(shards) for point in range(points_per_shard))
+        self.shards = shards
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, sensor_id):
+        index = bisect.bisect_left(self._points, _hash64(sensor_id))
+        return self._owners[index % len(self._points)]
+
+    def shares(self):
+        """Fraction of the ring, and so of the sensors on average, owned by each shard."""
+        shares = [0] * self.shards
+        previous = self._points[-1] - 2 ** 64  # The first point owns the arc that wraps around
+        for point, owner in zip(self._points, self._owners):
+            shares[owner] += point - previous
+            previous = point
+        return [share / 2 ** 64 for share in shares]
+
+
+def shard_capacities(ring, max_sensors, sigmas=SHARD_CAPACITY_SIGMAS):
+    """Sensors each shard may track: its ring share of `max_sensors` plus `sigmas` standard deviations."""
+    capacities = []
+    for share in ring.shares():
+        expected = max_sensors * share
+        capacities.append(math.ceil(expected + sigmas * math.sqrt(expected * (1 - share))))
+    return capacities
+
+
+def shard_snapshot_path(path, shard, shards):
+    """Per-shard history snapshot file; the shard count is part of the name because it decides ownership."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{shard}of{shards}{ext}"
+
+
+def _split_by_capacity(batch, max_sensors):
+    """Splits a micro-batch, in order, into runs of requests with at most `max_sensors` distinct sensors
+    between them, so requests that each fit are never rejected for arriving together."""
+    if max_sensors is None:
+        return [batch]
+    groups, group, seen = [], [], set()
+    for request in batch:
+        new_sensors = set(request[1]) - seen
+        if group and len(seen) + len(new_sensors) > max_sensors:
+            groups.append(group)
+            group, seen, new_sensors = [], set(), set(request[1])
+        group.append(request)
+        seen |= new_sensors
+    groups.append(group)
+    return groups
+
+
+def _run_shard(shard, shards, inputs, results, scorer, window, features, max_sensors, snapshot_path,
+               max_batch_readings, streaming_options, model_store, model_sampler, model_registry):
+    """Worker process loop: applies queued readings to this shard's history and scores them in micro-batches."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the whole process group; stop() shuts us down
+    watcher = None
+    if model_store is not None:
+        def swap(version, path):
+            nonlocal scorer
+            new_scorer = FlatIsolationForest.load(path, mmap_mode='r')
+            check_feature_schema(new_scorer.feature_schema)
+            scorer = new_scorer
+
+        watcher = ModelWatcher(model_store, swap, loaded_version=scorer.version)
+    store = SensorHistoryStore(window, features, max_sensors=max_sensors)
+    screen = None
+    if streaming_options is not None:
+        detector = StreamingDetector(features, **streaming_options)
+
+        def screen(positions, rows, values, counts):
+            flagged[positions] = detector.update(rows, values, counts)
+    path = shard_snapshot_path(snapshot_path, shard, shards)
+    restored = store.load_snapshot(path)
+    if restored:
+        logger.info("✅ Shard %d restored history of %d sensors from %s", shard, restored, path)
+    store.start_idle_sweeper(
+        ttl_seconds=float(os.environ.get('SENSOR_IDLE_TTL_SECONDS', SENSOR_IDLE_TTL_SECONDS)),
+        interval_seconds=float(os.environ.get('IDLE_SWEEP_INTERVAL_SECONDS', IDLE_SWEEP_INTERVAL_SECONDS))
+    )
+    store.start_snapshotter(
+        path, interval_seconds=float(os.environ.get('HISTORY_SNAPSHOT_INTERVAL_SECONDS', SNAPSHOT_INTERVAL_SECONDS))
+    )
+
+    running = True
+    while running:
+        # Block for the first request, then take whatever else is already queued: batches grow with load
+        # and a lone reading is never held back waiting for company
+        batch, batch_readings = [inputs.get()], 0
+        while batch[-1] is not None:
+            batch_readings += len(batch[-1][1])
+            if batch_readings >= max_batch_readings:
+                break
+            try:
+                batch.append(inputs.get_nowait())
+            except queue.Empty:
+                break
+        if batch[-1] is None:  # Stop sentinel from stop(); everything queued before it is still processed
+            running = False
+            batch.pop()
+        if not batch:
+            continue
+        if watcher is not None:
+            watcher.poll()  # Between micro-batches, so a batch is scored by a single version
+        for group in _split_by_capacity(batch, max_sensors):
+            sensor_ids = list(itertools.chain.from_iterable(sensor_ids for _, sensor_ids, _ in group))
+            values = np.concatenate([values for _, _, values in group])
+            try:
+                start = time.perf_counter()
+                flagged = np.ones(len(sensor_ids), dtype=bool)  # Set by screen() when the streaming detector is on
+                counts, windows = store.append_readings(sensor_ids, values, on_round=screen)
+                features_done = time.perf_counter()
+                ready = counts >= store.window
+                anomaly_scores = np.full(len(counts), np.nan)
+                predictions = np.where(ready, 1, 0)  # 0: not scored
+                model_keys = [None] * len(counts)
+                model_versions = np.full(len(counts), -1, dtype=np.int64)
+                score = ready & flagged
+                if score.any():
+                    scored = np.flatnonzero(score)
+                    if model_registry is not None:
+                        anomaly_scores[score], scored_keys, model_versions[score] = model_registry.score(
+                            [sensor_ids[i] for i in scored], build_feature_batch(windows[score]), scorer)
+                    else:
+                        anomaly_scores[score] = scorer.decision_function(build_feature_batch(windows[score]))
+                        scored_keys, model_versions[score] = [DEFAULT_MODEL_KEY] * len(scored), scorer.version
+                    for i, key in zip(scored, scored_keys):
+                        model_keys[i] = key
+                    predictions[score] = np.where(anomaly_scores[score] < 0, -1, 1)
+                if model_sampler is not None and ready.any():
+                    model_sampler.observe([sensor_ids[i] for i in np.flatnonzero(ready)],
+                                          build_feature_batch(windows[ready]), predictions[ready] == -1)
+                score_done = time.perf_counter()
+            except Exception as e:
+                logger.error("❌ Shard %d failed to score %d readings: %s", shard, len(sensor_ids), e)
+                for request_id, _, _ in group:
+                    results.put(('result', request_id, shard, None, None, None, None, None, str(e)))
+                continue
+
+            offset = 0
+            for request_id, request_sensor_ids, _ in group:
+                end = offset + len(request_sensor_ids)
+                results.put(('result', request_id, shard, counts[offset:end], anomaly_scores[offset:end],
+                             predictions[offset:end], model_keys[offset:end], model_versions[offset:end], None))
+                offset = end
+            results.put(('batch', shard, store.stats(), features_done - start, score_done - features_done))
+
+    store.save_snapshot(path)
+
+
+class _PendingDetection:
+    def __init__(self, size, shards):
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.anomaly_scores = np.full(size, np.nan)
+        self.predictions = np.zeros(size, dtype=np.int64)
+        self.model_keys = [None] * size
+        self.model_versions = np.full(size, -1, dtype=np.int64)
+        self.positions = {}  # shard -> positions of this request's readings sent to it
+        self.workers = {}  # shard -> worker process the readings were sent to
+        self.waiting = set()  # Shards that have not answered yet
+        self.remaining = shards
+        self.error = None
+        self.done = threading.Event()
+
+
+class ShardedDetector:
+    """Scores readings in `workers` processes, each owning the lag history of one shard of the sensors.
+
+    detect() splits readings by HashRing shard and queues each part to its worker. Every sensor lives in
+    exactly one worker and each worker's queue is FIFO, so a sensor's readings reach its history in the
+    order detect() was called. Workers score everything queued for them in one vectorized call and send
+    results back on a single queue, which a collector thread matches to the waiting detect() calls.
+
+    Workers are forked by start(), so they inherit the memory-mapped `scorer` without copying it. Call
+    start() before the process starts other threads. Each worker snapshots its shard's history next to
+    `snapshot_path` (see shard_snapshot_path) and restores it on the next start with the same shard count.
+    A worker that dies is forked again by the next detect() that needs it and restarts from its last
+    snapshot; detect() calls that were waiting on it raise WorkerUnavailable. `max_sensors` bounds the
+    sensors tracked by all workers together: each tracks at most its ring share of them plus headroom for
+    uneven hashing (see shard_capacities), so all of them may together hold slightly more.
+    With `streaming_options` (StreamingDetector keyword arguments), each worker screens its readings with
+    its own StreamingDetector and only the flagged ones are scored. With a `model_store` (see
+    model_lifecycle.py), workers swap in newly published model versions between micro-batches, and with a
+    shared `model_sampler` they sample the readings they predict normal (scored or screened) into it. With a
+    `model_registry` (see model_registry.py), each worker scores readings with their profile models, kept in
+    its own cache, and with `scorer` for sensors without one.
+    """
+
+    def __init__(self, workers, scorer, window, features, snapshot_path, max_sensors=MAX_TRACKED_SENSORS,
+                 max_batch_readings=MICRO_BATCH_MAX_READINGS, streaming_options=None, on_batch=None,
+                 model_store=None, model_sampler=None, model_registry=None):
+        self.workers = workers
+        self.scorer = scorer
+        self.window = window
+        self.features = features
+        self.snapshot_path = snapshot_path
+        self.max_sensors = max_sensors
+        self.max_batch_readings = max_batch_readings
+        self.streaming_options = streaming_options
+        self.on_batch = on_batch  # Called as on_batch(features_seconds, score_seconds) for every micro-batch
+        self.model_store = model_store
+        self.model_sampler = model_sampler
+        self.model_registry = model_registry
+        self.ring = HashRing(workers)
+        self.shard_max_sensors = shard_capacities(self.ring, max_sensors) if max_sensors else [None] * workers
+        self._context = multiprocessing.get_context('fork')
+        self._inputs = [None] * workers
+        self._results = None
+        self._processes = [None] * workers
+        self._spawn_lock = threading.Lock()
+        self._stopping = False
+        self.restarts = 0
+        self._collector = None
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._shard_stats = [None] * workers
+
+    def start(self):
+        self._results = self._context.Queue()
+        for shard in range(self.workers):
+            self._spawn(shard)
+        self._collector = threading.Thread(target=self._collect, name="detection-collector", daemon=True)
+        self._collector.start()
+        logger.info("✅ Started %d detection workers", self.workers)
+
+    def _spawn(self, shard):
+        inputs = self._context.Queue()
+        process = self._context.Process(
+            target=_run_shard, name=f"detection-shard-{shard}", daemon=True,
+            args=(shard, self.workers, inputs, self._results, self.scorer, self.window, self.features,
+                  self.shard_max_sensors[shard], self.snapshot_path, self.max_batch_readings, self.streaming_options,
+                  self.model_store, self.model_sampler, self.model_registry))
+        process.start()
+        self._inputs[shard], self._processes[shard] = inputs, process
+
+    def _live_worker(self, shard):
+        """(process, input queue) of the shard's worker, forked again first if it has died. By then this process
+        runs other threads, but a worker only uses state it creates itself or that is shared between processes."""
+        process = self._processes[shard]
+        if not process.is_alive() and not self._stopping:
+            with self._spawn_lock:
+                if self._processes[shard] is process:
+                    logger.error("❌ Detection worker %d died (exit code %s); restarting it from its last snapshot",
+                                 shard, process.exitcode)
+                    self._inputs[shard].cancel_join_thread()  # Readings queued to the dead worker are abandoned
+                    self._spawn(shard)
+                    self.restarts += 1
+        return self._processes[shard], self._inputs[shard]
+
+    def detect(self, sensor_ids, readings, timeout=DETECTION_TIMEOUT_SECONDS):
+        """Appends readings to their sensors' histories and scores every reading with a full lag window.
+
+        Returns (counts, anomaly_scores, predictions, model_keys, model_versions) in input order: the
+        readings each sensor held after the reading was appended, and its score, prediction (-1 anomaly,
+        1 normal) and the key and version of the model that scored it, which are NaN, 0, None and -1 where
+        the window was not full yet. Readings cleared by the streaming detector have prediction 1, a NaN
+        score, no key and version -1. Raises ValueError, before applying any reading, if a worker would get
+        more sensors than it can track, and WorkerUnavailable or TimeoutError if a worker does not answer.
+        """
+        readings = np.asarray(readings, dtype=np.float64).reshape(-1, self.features)
+        by_shard = defaultdict(list)
+        for position, sensor_id in enumerate(sensor_ids):
+            by_shard[self.ring.shard_for(sensor_id)].append(position)
+        if self.max_sensors:
+            for shard, positions in by_shard.items():
+                distinct = len({sensor_ids[position] for position in positions})
+                if distinct > self.shard_max_sensors[shard]:  # Checked before any worker applies a reading
+                    raise ValueError(f"{distinct} distinct sensors for detection worker {shard}; it can track "
+                                     f"at most {self.shard_max_sensors[shard]}")
+        pending = _PendingDetection(len(sensor_ids), len(by_shard))
+        if not by_shard:
+            return (pending.counts, pending.anomaly_scores, pending.predictions, pending.model_keys,
+                    pending.model_versions)
+
+        with self._pending_lock:
+            request_id = next(self._request_ids)
+            self._pending[request_id] = pending
+            pending.waiting.update(by_shard)
+        for shard, positions in by_shard.items():
+            positions = np.array(positions, dtype=np.int64)
+            pending.positions[shard] = positions
+            pending.workers[shard], inputs = self._live_worker(shard)
+            inputs.put((request_id, [sensor_ids[position] for position in positions], readings[positions]))
+        deadline = time.monotonic() + timeout
+        while not pending.done.wait(max(0.0, min(WORKER_CHECK_INTERVAL_SECONDS, deadline - time.monotonic()))):
+            with self._pending_lock:
+                dead = [shard for shard in pending.waiting if not pending.workers[shard].is_alive()]
+                if dead or time.monotonic() >= deadline:
+                    self._pending.pop(request_id, None)
+            if dead:
+                for shard in dead:
+                    self._live_worker(shard)
+                raise WorkerUnavailable(f"Detection worker {dead[0]} died before answering; it was restarted")
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Detection workers did not answer within {timeout}s")
+        if pending.error:
+            raise RuntimeError(pending.error)
+        return (pending.counts, pending.anomaly_scores, pending.predictions, pending.model_keys,
+                pending.model_versions)
+
+    def _collect(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                return
+            if message[0] == 'batch':
+                _, shard, stats, features_seconds, score_seconds = message
+                self._shard_stats[shard] = stats
+                if self.on_batch is not None:
+                    self.on_batch(features_seconds, score_seconds)
+                continue
+            _, request_id, shard, counts, anomaly_scores, predictions, model_keys, model_versions, error = message
+            with self._pending_lock:
+                pending = self._pending.get(request_id)
+                if pending is not None:
+                    pending.waiting.discard(shard)
+            if pending is None:
+                continue  # detect() timed out or lost a worker, and stopped waiting
+            if error is not None:
+                pending.error = error
+            else:
+                positions = pending.positions[shard]
+                pending.counts[positions] = counts
+                pending.anomaly_scores[positions] = anomaly_scores
+                pending.predictions[positions] = predictions
+                pending.model_versions[positions] = model_versions
+                for position, key in zip(positions, model_keys):
+                    pending.model_keys[position] = key
+            pending.remaining -= 1
+            if pending.remaining == 0:
+                with self._pending_lock:
+                    self._pending.pop(request_id, None)
+                pending.done.set()
+
+    def tracked_sensors(self):
+        return sum(stats["tracked_sensors"] for stats in self._shard_stats if stats is not None)
+
+    def stats(self):
+        """Per-shard history stats as last reported by each worker (None until it has scored a batch)."""
+        return {
+            "workers": self.workers,
+            "worker_restarts": self.restarts,
+            "max_sensors_per_worker": self.shard_max_sensors,
+            "tracked_sensors": self.tracked_sensors(),
+            "shards": list(self._shard_stats),
+        }
+
+    def stop(self, timeout=WORKER_STOP_TIMEOUT_SECONDS):
+        """Lets every worker finish its queue and write its final snapshot, then stops the collector."""
+        self._stopping = True
+        for inputs in self._inputs:
+            if inputs is not None:
+                inputs.put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Detection worker %s did not stop within %ss; terminating it", process.name, timeout)
+                process.terminate()
+        if self._results is not None:
+            self._results.put(None)
+        if self._collector is not None:
+            self._collector.join(timeout)
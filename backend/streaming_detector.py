@@ -0,0 +1,197 @@
+# streaming_detector.py
+# Cheap first-stage screen in front of the Isolation Forest: per-sensor EWMA z-scores and CUSUM, updated in
+# O(1) per reading. Only readings it flags are scored by the forest.
+import math
+import mmap
+
+import numpy as np
+
+from sensor_history import INITIAL_SENSOR_CAPACITY
+
+# --- CONFIGURATION ---
+EWMA_ALPHA = 0.05  # Weight of each new reading in the running mean and variance
+Z_THRESHOLD = 4.0  # A reading is flagged when any channel is further than this many std devs from its mean
+CUSUM_DRIFT = 0.5  # Std devs of shift per reading that CUSUM ignores
+CUSUM_THRESHOLD = 8.0  # A channel's CUSUM above this flags the reading (sustained shifts, e.g. change points)
+WARMUP_READINGS = 10  # Readings of a sensor always flagged while its mean and variance settle
+REJECT_LIMIT = 30  # Consecutive outliers after which the baseline is relearned (the sensor really moved)
+STD_FLOOR = 0.05  # Smallest std dev used for z-scores, so a constant channel does not flag rounding noise
+
+
+class StreamingDetector:
+    """Per-sensor running baseline that decides which readings are worth scoring with the forest.
+
+    State is one (rows, 4 * features + 2) array indexed by the sensor's SensorHistoryStore row: EWMA mean
+    and variance per channel, two-sided CUSUM of the z-scores per channel, readings learned and consecutive
+    outliers. update() gathers the rows once, does a few vectorized operations and scatters them back, for
+    one reading or a whole batch.
+
+    A reading is flagged while its sensor warms up, when any channel's z-score (against the baseline before
+    the reading) exceeds `z_threshold`, or when any channel's CUSUM exceeds `cusum_threshold`. Outliers do
+    not move the baseline, also during warm-up, so a change point lasting many readings stays flagged
+    throughout; after `reject_limit` outliers in a row the baseline is relearned from scratch.
+
+    With `shared=True` the state lives in an anonymous shared mapping of `capacity` rows, for use next to a
+    SharedSensorHistoryStore by forked workers; otherwise it grows with the highest row seen.
+    """
+
+    def __init__(self, features, capacity=INITIAL_SENSOR_CAPACITY, alpha=EWMA_ALPHA, z_threshold=Z_THRESHOLD,
+                 cusum_drift=CUSUM_DRIFT, cusum_threshold=CUSUM_THRESHOLD, warmup=WARMUP_READINGS,
+                 reject_limit=REJECT_LIMIT, std_floor=STD_FLOOR, shared=False):
+        self.features = features
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.cusum_drift = cusum_drift
+        self.cusum_threshold = cusum_threshold
+        self.warmup = warmup
+        self.reject_limit = reject_limit
+        self.std_floor = std_floor
+        self.shared = shared
+        # Readings learned are counted until the averaging ramp 1 / (seen + 1) has reached alpha, so the
+        # configured alpha applies from then on, and at least through warm-up
+        self.seen_limit = max(warmup, math.ceil(1.0 / alpha) if alpha > 0 else 0)
+        # Column slices of the state array
+        self._mean, self._var, self._cusum_high, self._cusum_low = (
+            slice(i * features, (i + 1) * features) for i in range(4))
+        self._seen, self._rejected = 4 * features, 4 * features + 1
+        self._mapping = None
+        self._state = self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        shape = (capacity, 4 * self.features + 2)
+        if not self.shared:
+            return np.zeros(shape)
+        self._mapping = mmap.mmap(-1, 8 * shape[0] * shape[1])  # Anonymous and MAP_SHARED: inherited by forks
+        return np.ndarray(shape, dtype=np.float64, buffer=self._mapping)
+
+    @property
+    def capacity(self):
+        return self._state.shape[0]
+
+    def _grow(self, min_capacity):
+        if self.shared:
+            raise ValueError(f"Row {min_capacity - 1} is beyond the shared capacity of {self.capacity} rows")
+        state = self._allocate(max(min_capacity, 2 * self.capacity))
+        state[:self.capacity] = self._state
+        self._state = state
+
+    def update(self, rows, readings, counts=None):
+        """Screens readings[i] of row rows[i] and folds it into the row's baseline. `rows` must be unique.
+
+        `counts` are the readings each row's history holds after this one (SensorHistoryStore's counts);
+        a count of 1 means the row was just (re)allocated to a sensor, so its old baseline is dropped.
+        Returns a boolean mask of the readings to score with the forest.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        readings = np.asarray(readings, dtype=np.float64).reshape(-1, self.features)
+        if len(rows) and rows.max() >= self.capacity:
+            self._grow(int(rows.max()) + 1)
+        state = self._state[rows]
+        if counts is not None:
+            state[np.asarray(counts) == 1] = 0.0
+        mean, var = state[:, self._mean], state[:, self._var]
+        seen = state[:, self._seen]
+
+        deviation = readings - mean
+        z = deviation / np.sqrt(np.maximum(var, self.std_floor ** 2))
+        z *= (seen > 0)[:, None]  # No baseline yet
+        # Outliers are kept out of the baseline from its second reading on, with a threshold widened by
+        # warmup / seen while a few readings may still badly underestimate the variance
+        warming_up = seen < self.warmup
+        threshold = self.z_threshold * np.maximum(1.0, self.warmup / np.maximum(seen, 1))
+        outlier = (seen >= 2) & (np.abs(z) > threshold[:, None]).any(axis=1)
+
+        # CUSUM catches shifts too small for the z-score test, so outliers (already flagged) and readings
+        # compared with an unsettled baseline do not feed it. The upper bound limits how long an alarm lingers
+        # after a shift ends.
+        step = z * (~outlier & ~warming_up)[:, None]
+        cusum_limit = 2 * self.cusum_threshold
+        state[:, self._cusum_high] = np.clip(state[:, self._cusum_high] + step - self.cusum_drift, 0.0, cusum_limit)
+        state[:, self._cusum_low] = np.clip(state[:, self._cusum_low] - step - self.cusum_drift, 0.0, cusum_limit)
+        cusum = np.maximum(state[:, self._cusum_high], state[:, self._cusum_low])
+        drifting = (cusum > self.cusum_threshold).any(axis=1)
+        flags = warming_up | outlier | drifting
+
+        # Running mean/variance of the readings that are not outliers (alpha 0 leaves a row unchanged); the
+        # first readings are plain averages so the baseline settles quickly
+        alpha = (np.maximum(self.alpha, 1.0 / (seen + 1)) * ~outlier)[:, None]
+        state[:, self._mean] = mean + alpha * deviation
+        state[:, self._var] = (1 - alpha) * (var + alpha * deviation ** 2)
+        state[:, self._seen] = np.minimum(seen + ~outlier, self.seen_limit)
+        state[:, self._rejected] = (state[:, self._rejected] + 1) * outlier
+        state[state[:, self._rejected] >= self.reject_limit] = 0.0
+        self._state[rows] = state
+        return flags
+
+    def update_one(self, row, reading, count=None):
+        """update() for a single reading in plain Python floats, several times faster than the array version
+        for one row. Returns True if the reading should be scored with the forest."""
+        if row >= self.capacity:
+            self._grow(row + 1)
+        state = [0.0] * self._state.shape[1] if count == 1 else self._state[row].tolist()
+        features, seen = self.features, state[self._seen]
+        floor_var = self.std_floor ** 2
+        z = [(reading[i] - state[i]) / math.sqrt(max(state[features + i], floor_var)) if seen > 0 else 0.0
+             for i in range(features)]
+        warming_up = seen < self.warmup
+        threshold = self.z_threshold * max(1.0, self.warmup / max(seen, 1))
+        outlier = seen >= 2 and max(abs(value) for value in z) > threshold
+
+        cusum_limit = 2 * self.cusum_threshold
+        drifting = False
+        for i in range(features):
+            step = 0.0 if outlier or warming_up else z[i]
+            high = min(max(state[2 * features + i] + step - self.cusum_drift, 0.0), cusum_limit)
+            low = min(max(state[3 * features + i] - step - self.cusum_drift, 0.0), cusum_limit)
+            state[2 * features + i], state[3 * features + i] = high, low
+            drifting = drifting or high > self.cusum_threshold or low > self.cusum_threshold
+        flagged = warming_up or outlier or drifting
+
+        if outlier:
+            state[self._rejected] += 1
+            if state[self._rejected] >= self.reject_limit:
+                state = [0.0] * len(state)
+        else:
+            alpha = max(self.alpha, 1.0 / (seen + 1))
+            for i in range(features):
+                deviation = reading[i] - state[i]
+                state[i] += alpha * deviation
+                state[features + i] = (1 - alpha) * (state[features + i] + alpha * deviation ** 2)
+            state[self._seen] = min(seen + 1, self.seen_limit)
+            state[self._rejected] = 0.0
+        self._state[row] = state
+        return flagged
+
+    def baseline(self, row):
+        """(mean, variance, readings learned) of a row's baseline, as copies."""
+        if row >= self.capacity:
+            return np.zeros(self.features), np.zeros(self.features), 0
+        state = self._state[row]
+        return state[self._mean].copy(), state[self._var].copy(), int(state[self._seen])
+
+    def estimated_bytes(self):
+        return self._state.nbytes
+
+
+def check_steady_state_alpha(features=3, readings=500, seed=42):
+    """After warm-up, a reading that is not an outlier moves the baseline by exactly alpha of its deviation, in
+    update() and update_one() alike. Raises AssertionError otherwise."""
+    rng = np.random.default_rng(seed)
+    history = rng.normal(size=(readings, features))
+    probe = history.mean(axis=0) + 0.5
+    for update in ('update', 'update_one'):
+        detector = StreamingDetector(features)
+        for reading in np.vstack([history, probe]):
+            mean = detector.baseline(0)[0]
+            if update == 'update':
+                detector.update([0], reading[None, :])
+            else:
+                detector.update_one(0, reading)
+        weight = (detector.baseline(0)[0] - mean) / (probe - mean)
+        assert np.allclose(weight, detector.alpha), \
+            f"{update}(): steady-state weight {weight} is not alpha {detector.alpha}"
+
+
+if __name__ == "__main__":
+    check_steady_state_alpha()
+    print("✅ Steady-state EWMA weight equals alpha in update() and update_one()")
@@ -7,6 +7,7 @@ import datetime
 from web3 import Web3
 # FIXED: Updated import for newer Web3.py versions
 from web3.middleware import ExtraDataToPOAMiddleware
+from nonce_manager import NonceManager, GasPriceCache
 
 # --- CONFIGURATION ---
 # UPDATED: Use the contract address from your deployment
@@ -152,6 +153,43 @@ def get_all_anomalies():
         print(f"❌ Error fetching anomalies: {e}")
         print("Ensure the contract is deployed and you have the correct ABI/Address.")
 
+def log_pipelined_test_anomalies(count=20):
+    # Sends `count` transactions back to back with locally allocated nonces, then collects the receipts.
+    # Against Ganache or a Hardhat node every one of them should be mined with a distinct nonce.
+    my_account = w3.eth.accounts[0]
+    nonce_manager = NonceManager(w3, my_account)
+    gas_price_cache = GasPriceCache(w3)
+
+    print(f"\n--- Sending {count} Pipelined Test Anomalies ---")
+    start = time.time()
+    tx_hashes = []
+    for i in range(count):
+        tx_hash = contract.functions.logAnomaly(
+            int(time.time()),
+            f"pipeline_sensor_{i % 5}",
+            900 + i,
+            "Python Test Anomaly (Pipelined)",
+            "Pipelined nonce manager test via web3.py."
+        ).transact({
+            'from': my_account,
+            'nonce': nonce_manager.next_nonce(),
+            'gas': 3000000,
+            'gasPrice': gas_price_cache.get()
+        })
+        tx_hashes.append(tx_hash)
+    sent_in = time.time() - start
+
+    receipts = [w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120) for tx_hash in tx_hashes]
+    succeeded = sum(1 for receipt in receipts if receipt.status == 1)
+    print(f"Sent {count} transactions in {sent_in:.3f}s; {succeeded}/{count} mined successfully "
+          f"in {time.time() - start:.3f}s total.")
+    if succeeded == count:
+        print("✅ Pipelined submission works: no nonce collisions.")
+    else:
+        print("❌ Some pipelined transactions failed!")
+
+
 if __name__ == "__main__":
     log_test_anomaly()
+    log_pipelined_test_anomalies()
     get_all_anomalies()
\ No newline at end of file
@@ -0,0 +1,83 @@
+# benchmarks/bench_forest_scorer.py
+# Compares the flat-array IsolationForest scorer with sklearn's predict + decision_function.
+import json
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+from forest_scorer import FlatIsolationForest  # noqa: E402
+
+# --- Configuration ---
+MODEL_PATH = os.path.join(BACKEND_DIR, 'anomaly_detection_model.joblib')
+TRAINING_DATA_PATH = os.path.join(BACKEND_DIR, 'normal_training_data_with_lags.json')
+BATCH_SIZES = (1, 64, 4096)
+MIN_SECONDS = 0.5  # Each measurement repeats the call until at least this much time has passed
+TOLERANCE = 1e-9
+SEED = 42
+
+
+def time_per_call(fn, X, min_seconds=MIN_SECONDS):
+    """Mean seconds per call of fn(X), after one warm-up call."""
+    fn(X)
+    calls, start = 0, time.perf_counter()
+    while True:
+        fn(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def make_batch(training_data, batch_size, rng):
+    """Training rows with noise added, so that the batch contains both normal points and anomalies."""
+    rows = training_data[rng.integers(0, len(training_data), batch_size)]
+    return rows + rng.normal(scale=rows.std(axis=0) * 0.5, size=rows.shape)
+
+
+def run(batch_sizes=BATCH_SIZES):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # The shipped model may have been pickled by another sklearn version
+        model = joblib.load(MODEL_PATH)
+    with open(TRAINING_DATA_PATH, 'r') as f:
+        training_data = np.array(json.load(f))
+    scorer = FlatIsolationForest.from_model(model)
+    rng = np.random.default_rng(SEED)
+
+    def sklearn_two_calls(X):  # What /sensor_data used to do per reading
+        return model.predict(X), model.decision_function(X)
+
+    results = []
+    for batch_size in batch_sizes:
+        X = make_batch(training_data, batch_size, rng)
+        max_error = float(np.abs(scorer.decision_function(X) - model.decision_function(X)).max())
+        assert max_error <= TOLERANCE, f"Flat scorer differs from sklearn by {max_error}"
+        sklearn_s = time_per_call(sklearn_two_calls, X)
+        decision_s = time_per_call(model.decision_function, X)
+        flat_s = time_per_call(scorer.decision_function, X)
+        results.append({
+            "batch_size": batch_size,
+            "sklearn_predict_and_decision_us": round(sklearn_s * 1e6, 1),
+            "sklearn_decision_us": round(decision_s * 1e6, 1),
+            "flat_us": round(flat_s * 1e6, 1),
+            "flat_us_per_row": round(flat_s * 1e6 / batch_size, 3),
+            "speedup_vs_predict_and_decision": round(sklearn_s / flat_s, 1),
+            "max_abs_error": max_error,
+        })
+
+    print(f"Model: {scorer.n_trees} trees, max depth {scorer.max_depth}, {len(scorer.feature)} nodes")
+    print(f"{'batch':>6} {'predict+decision':>17} {'decision':>10} {'flat':>10} {'speedup':>8} {'max error':>10}")
+    for r in results:
+        print(f"{r['batch_size']:>6} {r['sklearn_predict_and_decision_us']:>15}us "
+              f"{r['sklearn_decision_us']:>8}us {r['flat_us']:>8}us {r['speedup_vs_predict_and_decision']:>7}x "
+              f"{r['max_abs_error']:>10.1e}")
+    return results
+
+
+if __name__ == "__main__":
+    run()
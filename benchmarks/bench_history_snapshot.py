@@ -0,0 +1,66 @@
+# benchmarks/bench_history_snapshot.py
+# Measures how long it takes to write and restore a sensor history snapshot for a large fleet.
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+from sensor_history import SensorHistoryStore  # noqa: E402
+
+# --- Configuration ---
+NUM_SENSORS = 1_000_000
+FEATURES_PER_READING = 3
+LAG_FEATURES_COUNT = 3
+REPEATS = 3
+SEED = 42
+
+
+def build_store(num_sensors, seed=SEED):
+    """A store with `num_sensors` sensors, each holding a full lag window of random readings."""
+    rng = np.random.default_rng(seed)
+    store = SensorHistoryStore(LAG_FEATURES_COUNT, FEATURES_PER_READING, max_sensors=None)
+    rows = np.array([store.row_for(f"sensor_{i:07d}") for i in range(num_sensors)], dtype=np.int64)
+    for _ in range(LAG_FEATURES_COUNT):
+        store.append_batch(rows, rng.normal(size=(num_sensors, FEATURES_PER_READING)))
+    return store
+
+
+def run(num_sensors=NUM_SENSORS, repeats=REPEATS):
+    print(f"Building history for {num_sensors:,} sensors...")
+    store = build_store(num_sensors)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'sensor_history_snapshot.npz')
+        write_times, restore_times = [], []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            store.save_snapshot(path)
+            write_times.append(time.perf_counter() - start)
+
+            restored = SensorHistoryStore(LAG_FEATURES_COUNT, FEATURES_PER_READING, max_sensors=None)
+            start = time.perf_counter()
+            restored.load_snapshot(path)
+            restore_times.append(time.perf_counter() - start)
+        size_mb = os.path.getsize(path) / 1e6
+
+    # Restored windows must match the originals exactly
+    sample = np.arange(0, num_sensors, max(1, num_sensors // 1000))
+    assert np.array_equal(store.readings_batch(sample), restored.readings_batch(sample))
+
+    results = {
+        "num_sensors": num_sensors,
+        "snapshot_mb": round(size_mb, 1),
+        "write_ms_best": round(min(write_times) * 1000, 1),
+        "restore_ms_best": round(min(restore_times) * 1000, 1),
+    }
+    print(f"Snapshot size:  {results['snapshot_mb']} MB")
+    print(f"Write (best of {repeats}):   {results['write_ms_best']} ms")
+    print(f"Restore (best of {repeats}): {results['restore_ms_best']} ms")
+    return results
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else NUM_SENSORS)
@@ -0,0 +1,181 @@
+# benchmarks/bench_model_refresh.py
+# Online model refresh: scoring latency while a new version trains (in a thread of the serving process vs in its
+# own process), the cost of a swap, and the base vs the refreshed model on a labelled trace.
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, '..', 'backend'))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+from bench_startup import MODEL_ARRAYS_DIR, ensure_model_arrays  # noqa: E402
+from bench_streaming_detector import labelled_trace  # noqa: E402
+from features import (FEATURES_PER_READING, LAG_FEATURES_COUNT, TOTAL_FEATURES_FOR_MODEL,  # noqa: E402
+                      build_feature_batch, check_feature_schema)
+from forest_scorer import FlatIsolationForest  # noqa: E402
+from model_lifecycle import ModelRefresher, ModelStore, ReservoirSampler, train_in_subprocess  # noqa: E402
+from model_training import train_isolation_forest  # noqa: E402
+from sensor_history import SensorHistoryStore  # noqa: E402
+from streaming_detector import StreamingDetector  # noqa: E402
+
+# --- Configuration ---
+SEED = 42
+TRAINING_ROWS = 65536  # A full sample: MAX_SAMPLE_CLASSES x RESERVOIR_SIZE rows
+SWAP_REPEATS = 50
+ANOMALY_START_PROBABILITY = 0.005  # bench_streaming_detector.py's sparse scenario
+
+
+def latency_while(scorer, train=None):
+    """Per-call latency of single-row scoring (as /sensor_data does it) in this thread while `train` runs on
+    another thread; with no `train`, for one second. Returns (stats, seconds `train` took)."""
+    row = np.random.default_rng(SEED).normal(size=(1, TOTAL_FEATURES_FOR_MODEL))
+    scorer.decision_function(row)
+    trainer = threading.Thread(target=train) if train else None
+    latencies = []
+    start = time.perf_counter()
+    if trainer:
+        trainer.start()
+    while trainer.is_alive() if trainer else time.perf_counter() - start < 1.0:
+        call_start = time.perf_counter()
+        scorer.decision_function(row)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    if trainer:
+        trainer.join()
+    latencies = np.array(latencies) * 1e6
+    return {
+        "scoring_calls_per_s": round(len(latencies) / elapsed, 1),
+        "p50_us": round(float(np.percentile(latencies, 50)), 1),
+        "p99_us": round(float(np.percentile(latencies, 99)), 1),
+        "max_ms": round(float(latencies.max()) / 1000, 2),
+    }, elapsed
+
+
+def serving_during_training(scorer, work_dir):
+    X = np.random.default_rng(SEED).normal(size=(TRAINING_ROWS, TOTAL_FEATURES_FOR_MODEL))
+    sample_path = os.path.join(work_dir, 'sample.npy')
+    np.save(sample_path, X)
+    results = []
+    scenarios = {
+        "idle": None,
+        # What a refresh would cost if it trained in the serving process
+        "training in a thread": lambda: FlatIsolationForest.from_model(train_isolation_forest(X, n_jobs=1)),
+        # What ModelRefresher does
+        "training in a subprocess": lambda: train_in_subprocess([(sample_path, os.path.join(work_dir, 'v000001'),
+                                                                  1)]),
+    }
+    for scenario, train in scenarios.items():
+        stats, elapsed = latency_while(scorer, train)
+        result = {"scenario": scenario, **stats}
+        if train:
+            result["training_seconds"] = round(elapsed, 2)
+        print(json.dumps(result), flush=True)
+        results.append(result)
+    return results
+
+
+def swap_cost(path):
+    """What a scoring process does to swap in a version: map it and check its feature schema."""
+    times = []
+    for _ in range(SWAP_REPEATS):
+        start = time.perf_counter()
+        scorer = FlatIsolationForest.load(path, mmap_mode='r')
+        check_feature_schema(scorer.feature_schema)
+        times.append(time.perf_counter() - start)
+    result = {"scenario": "swap", "load_and_check_ms": round(float(np.median(times)) * 1000, 3)}
+    print(json.dumps(result), flush=True)
+    return result
+
+
+def score_trace(scorer, sensor_ids, readings, ticks, sampler=None, screen=False):
+    """Anomaly flags of every reading in `ticks`, a tick at a time as /sensor_data/batch does it, and which
+    readings had a full lag window. With `screen`, a StreamingDetector clears readings before the forest.
+    Every reading with a full window is offered to `sampler` if given."""
+    store = SensorHistoryStore(LAG_FEATURES_COUNT, FEATURES_PER_READING, max_sensors=None)
+    detector = StreamingDetector(FEATURES_PER_READING) if screen else None
+    flags = np.zeros(readings.shape[:2], dtype=bool)
+    scored = np.zeros(readings.shape[:2], dtype=bool)
+    flagged = np.ones(len(sensor_ids), dtype=bool)
+
+    def on_round(positions, rows, values, counts):
+        flagged[positions] = detector.update(rows, values, counts)
+
+    for tick in ticks:
+        counts, windows = store.append_readings(sensor_ids, readings[tick], on_round=on_round if screen else None)
+        ready = counts >= LAG_FEATURES_COUNT
+        score = ready & flagged
+        flags[tick, score] = scorer.decision_function(build_feature_batch(windows[score])) < 0
+        scored[tick, ready] = True
+        if sampler is not None:
+            sampler.observe([sensor_id for sensor_id, r in zip(sensor_ids, ready) if r],
+                            build_feature_batch(windows[ready]), flags[tick, ready])
+    return flags, scored
+
+
+def refresh_quality(scorer, work_dir):
+    """Scores the first half of a trace with the base model while sampling it, refreshes, and compares both
+    models (forest alone) on the second half. The sample holds the readings the forest predicted normal, or,
+    with the streaming detector in front of it, also those the detector cleared."""
+    sensor_ids, readings, labels = labelled_trace(ANOMALY_START_PROBABILITY)
+    ticks = readings.shape[0]
+    second_half = range(ticks // 2, ticks)
+    base_flags, scored = score_trace(scorer, sensor_ids, readings, second_half)
+    anomalous, normal = labels & scored, ~labels & scored
+
+    def quality(name, flags, model):
+        result = {"scenario": name, "model_version": model.version,
+                  "recall": round(float((flags & anomalous).sum() / max(anomalous.sum(), 1)), 4),
+                  "false_positive_rate": round(float((flags & normal).sum() / max(normal.sum(), 1)), 4)}
+        return result
+
+    results = [quality("second half, base model", base_flags, scorer)]
+    print(json.dumps(results[0]), flush=True)
+    for screen in (False, True):
+        sampler = ReservoirSampler(TOTAL_FEATURES_FOR_MODEL, seed=SEED)
+        score_trace(scorer, sensor_ids, readings, range(ticks // 2), sampler, screen=screen)
+        store = ModelStore(os.path.join(work_dir, f"versions_{int(screen)}"))
+        summary = ModelRefresher(sampler, store).refresh('benchmark')
+        refreshed = FlatIsolationForest.load(store.version_path(summary["version"]))
+        flags, _ = score_trace(refreshed, sensor_ids, readings, second_half)
+        sample = "forest normal + screened" if screen else "forest normal"
+        result = quality(f"second half, refreshed from {sample}", flags, refreshed)
+        result.update(training_rows=summary["training_rows"],
+                      sampled_classes=sum(len(rows) > 0 for rows in sampler.samples().values()))
+        print(json.dumps(result), flush=True)
+        results.append(result)
+    return results
+
+
+def run():
+    ensure_model_arrays()
+    scorer = FlatIsolationForest.load(MODEL_ARRAYS_DIR)
+    work_dir = tempfile.mkdtemp(prefix='bench_model_refresh_')
+    try:
+        results = serving_during_training(scorer, work_dir)
+        results.append(swap_cost(os.path.join(work_dir, 'v000001')))
+        results.extend(refresh_quality(scorer, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark online model refresh.")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    results = run()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
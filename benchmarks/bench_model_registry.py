@@ -0,0 +1,189 @@
+# benchmarks/bench_model_registry.py
+# Per-profile models: the global model vs one model per SENSOR_PROFILES entry on labelled traces, and the cost
+# and memory of routing a batch over hundreds of models with different LRU cache sizes.
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, '..', 'backend'))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+from bench_startup import MODEL_ARRAYS_DIR, ensure_model_arrays  # noqa: E402
+from bench_streaming_detector import SCENARIOS, labelled_trace  # noqa: E402
+from features import (FEATURES_PER_READING, LAG_FEATURES_COUNT, TOTAL_FEATURES_FOR_MODEL,  # noqa: E402
+                      build_feature_batch)
+from forest_scorer import FlatIsolationForest  # noqa: E402
+from model_registry import DEFAULT_MODEL_KEY, ModelRegistry, train_profile_models  # noqa: E402
+from sensor_history import SensorHistoryStore  # noqa: E402
+
+# --- Configuration ---
+SEED = 42
+MANY_MODELS = 300
+SENSORS_PER_MODEL = 4
+CACHE_SIZES = (16, 64, 512)
+BATCH_READINGS = 1000
+BATCHES = 20
+SINGLE_READING_CALLS = 5000
+
+
+def replay(score, sensor_ids, readings):
+    """Anomaly flags of every reading, a tick at a time as /sensor_data/batch does it, and which readings had
+    a full lag window. `score(sensor_ids, features)` returns decision scores."""
+    store = SensorHistoryStore(LAG_FEATURES_COUNT, FEATURES_PER_READING, max_sensors=None)
+    flags = np.zeros(readings.shape[:2], dtype=bool)
+    scored = np.zeros(readings.shape[:2], dtype=bool)
+    for tick in range(readings.shape[0]):
+        counts, windows = store.append_readings(sensor_ids, readings[tick])
+        ready = counts >= LAG_FEATURES_COUNT
+        if ready.any():
+            flags[tick, ready] = score([s for s, r in zip(sensor_ids, ready) if r],
+                                       build_feature_batch(windows[ready])) < 0
+        scored[tick, ready] = True
+    return flags, scored
+
+
+def profile_quality(base, work_dir):
+    """Recall and false-positive rate per profile of the global model and of per-profile models."""
+    registry = ModelRegistry(os.path.join(work_dir, 'profiles'))
+    start = time.perf_counter()
+    train_profile_models(registry, seed=SEED)
+    training_seconds = time.perf_counter() - start
+    registry.refresh_keys(force=True)
+    models = {
+        "global": lambda sensor_ids, features: base.decision_function(features),
+        "per profile": lambda sensor_ids, features: registry.score(sensor_ids, features, base)[0],
+    }
+    results = []
+    for scenario, start_probability in SCENARIOS.items():
+        sensor_ids, readings, labels = labelled_trace(start_probability)
+        profiles = np.array([registry.model_key(sensor_id) for sensor_id in sensor_ids])
+        for name, score in models.items():
+            flags, scored = replay(score, sensor_ids, readings)
+            for profile in sorted(set(profiles)):
+                in_profile = scored & (profiles == profile)[None, :]
+                anomalous, normal = labels & in_profile, ~labels & in_profile
+                result = {"scenario": scenario, "model": name, "profile": profile,
+                          "recall": round(float((flags & anomalous).sum() / max(anomalous.sum(), 1)), 4),
+                          "false_positive_rate": round(float((flags & normal).sum() / max(normal.sum(), 1)), 4)}
+                print(json.dumps(result), flush=True)
+                results.append(result)
+    results.append({"scenario": "profile training", "profiles": len(registry.keys()),
+                    "training_seconds": round(training_seconds, 2)})
+    print(json.dumps(results[-1]), flush=True)
+    return results
+
+
+def resident_bytes():
+    """Resident set size of this process (Linux), or None."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def many_models(base, work_dir):
+    """Batches of BATCH_READINGS readings spread evenly over MANY_MODELS registered models, scored through
+    registries with different cache sizes, next to the same batches scored by the global model alone."""
+    root = os.path.join(work_dir, 'many')
+    seed_registry = ModelRegistry(root)
+    for model in range(MANY_MODELS):  # Copies of one forest: loading and scoring cost the same as distinct ones
+        store = seed_registry.store(f"class{model:03d}")
+        shutil.copytree(MODEL_ARRAYS_DIR, store.version_path(1))
+        store.publish(1)
+    sensor_ids = [f"class{model:03d}_{sensor}" for model in range(MANY_MODELS)
+                  for sensor in range(SENSORS_PER_MODEL)]
+    rng = np.random.default_rng(SEED)
+    batches = [(list(np.array(sensor_ids)[rng.choice(len(sensor_ids), BATCH_READINGS, replace=False)]),
+                rng.normal(size=(BATCH_READINGS, TOTAL_FEATURES_FOR_MODEL))) for _ in range(BATCHES)]
+
+    def timed(score):
+        """Median milliseconds per batch, after a warm-up batch."""
+        score(*batches[0])
+        times = []
+        for batch_ids, features in batches:
+            start = time.perf_counter()
+            score(batch_ids, features)
+            times.append(time.perf_counter() - start)
+        return round(float(np.median(times)) * 1000, 2)
+
+    results = [{"scenario": "global model only", "models": 1,
+                "batch_ms": timed(lambda batch_ids, features: base.decision_function(features))}]
+    print(json.dumps(results[0]), flush=True)
+    for cache_size in CACHE_SIZES:
+        rss_before = resident_bytes()
+        registry = ModelRegistry(root, cache_size=cache_size)
+        registry.score(*batches[0], base)
+        warm_loads = registry.loads
+        batch_ms = timed(lambda batch_ids, features: registry.score(batch_ids, features, base))
+        stats = registry.stats()
+        rss_after = resident_bytes()
+        result = {"scenario": "routed", "models": len(registry.keys()), "cache_size": cache_size,
+                  "batch_ms": batch_ms,
+                  "loads_per_batch": round((stats["loads"] - warm_loads) / (BATCHES + 1), 1),
+                  "cached_models": len(stats["cached"]), "mapped_mb": round(stats["mapped_bytes"] / 2 ** 20, 1),
+                  "rss_growth_mb": round((rss_after - rss_before) / 2 ** 20, 1) if rss_before else None}
+        print(json.dumps(result), flush=True)
+        results.append(result)
+        del registry
+
+    # One model per row instead of one call per model
+    registry = ModelRegistry(root, cache_size=MANY_MODELS)
+    registry.score(*batches[0], base)
+
+    def per_row(batch_ids, features):
+        for i, sensor_id in enumerate(batch_ids):
+            key = registry.model_key(sensor_id)
+            scorer = registry.model(key) if key != DEFAULT_MODEL_KEY else base
+            scorer.decision_function(features[i:i + 1])
+
+    result = {"scenario": "routed, one call per reading", "models": MANY_MODELS, "cache_size": MANY_MODELS,
+              "batch_ms": timed(per_row)}
+    print(json.dumps(result), flush=True)
+    results.append(result)
+
+    # A single reading, as /sensor_data scores it, from a cached model
+    row = batches[0][1][:1]
+    for name, score in (("single reading, global model", lambda: base.decision_function(row)),
+                        ("single reading, routed", lambda: registry.score([sensor_ids[0]], row, base))):
+        score()
+        start = time.perf_counter()
+        for _ in range(SINGLE_READING_CALLS):
+            score()
+        result = {"scenario": name, "us_per_call": round((time.perf_counter() - start) * 1e6 / SINGLE_READING_CALLS, 1)}
+        print(json.dumps(result), flush=True)
+        results.append(result)
+    return results
+
+
+def run():
+    ensure_model_arrays()
+    base = FlatIsolationForest.load(MODEL_ARRAYS_DIR)
+    work_dir = tempfile.mkdtemp(prefix='bench_model_registry_')
+    try:
+        results = profile_quality(base, work_dir)
+        results.extend(many_models(base, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-profile models and the model cache.")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    results = run()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# benchmarks/bench_pipeline.py
+# Ingestion -> detection -> logging: microbenchmarks of each stage, then /sensor_data through the Flask test
+# client with the chain replaced by an in-process stub (or, with --chain-url, a local Hardhat/Ganache node).
+import argparse
+import atexit
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, '..', 'backend'))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+from bench_forest_scorer import time_per_call  # noqa: E402
+from bench_startup import MODEL_ARRAYS_DIR, ensure_model_arrays  # noqa: E402
+from features import (FEATURES_PER_READING, LAG_FEATURES_COUNT, TOTAL_FEATURES_FOR_MODEL,  # noqa: E402
+                      build_feature_batch, build_feature_row)
+from forest_scorer import FlatIsolationForest  # noqa: E402
+from load_generator import SyntheticFleet  # noqa: E402
+from sensor_history import SensorHistoryStore  # noqa: E402
+
+# --- Configuration ---
+SEED = 42
+NUM_SENSORS = 1000
+ANOMALY_RATE = 0.02  # Fraction of readings passed through data_simulator.inject_anomaly
+# Fixed simulated clock so readings and anomaly counts repeat exactly. Mid-afternoon is where the shipped
+# model, trained on a short stretch of one day, flags the fewest normal readings.
+START_TIME = datetime(2024, 6, 1, 15, 0)
+SCORING_BATCH_SIZES = (1, 64, 1000)
+SINGLE_REQUESTS = 3000  # Readings sent one per POST /sensor_data
+BATCH_SIZE = 100
+BATCH_REQUESTS = 100  # Requests of BATCH_SIZE readings sent to POST /sensor_data/batch
+LOG_SETTLE_TIMEOUT_SECONDS = 60  # Longest to wait for every queued anomaly log to be mined (or fail)
+LOG_POLL_SECONDS = 0.005
+
+
+def fleet_payloads(num_readings, prefix, seed=SEED):
+    """`num_readings` /sensor_data payloads: every sensor of a fixed fleet once per tick, tick after tick."""
+    fleet = SyntheticFleet(NUM_SENSORS, ANOMALY_RATE, seed, START_TIME)
+    payloads = []
+    for tick_number in range(-(-num_readings // NUM_SENSORS)):
+        for sensor_id, (temperature, humidity, pressure) in zip(fleet.sensor_ids, fleet.tick(tick_number)):
+            payloads.append({"sensor_id": f"{prefix}_{sensor_id}", "temperature": round(float(temperature), 2),
+                             "humidity": round(float(humidity), 2), "pressure": round(float(pressure), 2)})
+    return payloads[:num_readings]
+
+
+def percentiles_us(seconds):
+    p50, p95, p99 = np.percentile(np.asarray(seconds) * 1e6, [50, 95, 99])
+    return {"p50_us": round(p50, 1), "p95_us": round(p95, 1), "p99_us": round(p99, 1)}
+
+
+# --- Microbenchmarks ---
+def run_microbenchmarks():
+    ensure_model_arrays()
+    scorer = FlatIsolationForest.load(MODEL_ARRAYS_DIR)
+    fleet = SyntheticFleet(NUM_SENSORS, ANOMALY_RATE, SEED, START_TIME)
+    store = SensorHistoryStore(LAG_FEATURES_COUNT, FEATURES_PER_READING, max_sensors=None)
+    rows = np.array([store.row_for(sensor_id) for sensor_id in fleet.sensor_ids], dtype=np.int64)
+    for tick_number in range(LAG_FEATURES_COUNT):
+        store.append_batch(rows, fleet.tick(tick_number))
+
+    results = {}
+    out = np.empty(TOTAL_FEATURES_FOR_MODEL)
+    results["feature_row_us"] = round(time_per_call(lambda r: build_feature_row(store.readings(r), out=out),
+                                                    rows[0]) * 1e6, 2)
+    batch_s = time_per_call(lambda r: build_feature_batch(store.readings_batch(r)), rows)
+    results["feature_batch_us_per_row"] = round(batch_s * 1e6 / len(rows), 3)
+
+    features = build_feature_batch(store.readings_batch(rows))
+    for batch_size in SCORING_BATCH_SIZES:
+        score_s = time_per_call(scorer.decision_function, features[:batch_size])
+        results[f"score_batch_{batch_size}_us"] = round(score_s * 1e6, 1)
+        results[f"score_batch_{batch_size}_us_per_row"] = round(score_s * 1e6 / batch_size, 3)
+
+    # Parsing as the endpoints do: request.json on a request carrying the raw body
+    from flask import Flask
+    parser_app = Flask(__name__)
+    payloads = fleet_payloads(BATCH_SIZE, "json")
+    for name, body in (("single", json.dumps(payloads[0]).encode()), ("batch", json.dumps(payloads).encode())):
+        def parse(data):
+            with parser_app.test_request_context('/sensor_data', method='POST', data=data,
+                                                 content_type='application/json'):
+                from flask import request
+                return request.json
+        results[f"json_loads_{name}_us"] = round(time_per_call(json.loads, body) * 1e6, 2)
+        results[f"flask_request_json_{name}_us"] = round(time_per_call(parse, body) * 1e6, 2)
+    return results
+
+
+# --- Chain stub ---
+class ChainStub:
+    """Just enough of a Web3 instance and contract for send_anomaly_transaction and the log queue.
+
+    Every transaction "mines" immediately, so the measured logging cost is the backend's own.
+    """
+
+    def __init__(self):
+        self.transactions = 0
+        self.eth = SimpleNamespace(accounts=['0x' + '11' * 20], gas_price=1,
+                                   get_transaction_count=lambda account, block='latest': 0,
+                                   get_transaction_receipt=lambda tx_hash: SimpleNamespace(status=1))
+        self.contract = SimpleNamespace(functions=SimpleNamespace(logAnomaly=self._call, logAnomalies=self._call))
+
+    def _call(self, *args):
+        return SimpleNamespace(transact=self._transact, estimate_gas=lambda tx: 100000)
+
+    def _transact(self, tx):
+        self.transactions += 1
+        return self.transactions.to_bytes(32, 'big')
+
+
+def install_chain_stub(app_module):
+    from nonce_manager import GasPriceCache, NonceManager
+    stub = ChainStub()
+    app_module.w3, app_module.SENDER_ACCOUNT = stub, stub.eth.accounts[0]
+    app_module.nonce_manager = NonceManager(stub, app_module.SENDER_ACCOUNT)
+    app_module.gas_price_cache = GasPriceCache(stub)
+    app_module.contract = stub.contract  # connect_blockchain() now returns immediately
+    return stub
+
+
+# --- Flask end-to-end ---
+def import_app(tmp_dir):
+    """Imports app.py with its snapshot and index files in tmp_dir, logging only warnings and errors."""
+    os.environ.setdefault('HISTORY_SNAPSHOT_PATH', os.path.join(tmp_dir, 'snapshot.npz'))
+    os.environ.setdefault('ANOMALY_INDEX_DB_PATH', os.path.join(tmp_dir, 'index.sqlite3'))
+    os.environ.setdefault('HISTORY_SNAPSHOT_INTERVAL_SECONDS', '86400')  # No periodic snapshot during the run
+    os.environ.setdefault('MODEL_ARRAYS_DIR', MODEL_ARRAYS_DIR)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    cwd = os.getcwd()
+    os.chdir(BACKEND_DIR)  # Model and training data paths are relative to backend/
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
+
+
+def wait_for_logs(app_module, submitted):
+    """Polls the log queue until every (log_id, submitted_at) is mined or failed. Returns latencies and counts."""
+    pending = dict(submitted)
+    latencies, failed = [], 0
+    deadline = time.perf_counter() + LOG_SETTLE_TIMEOUT_SECONDS
+    while pending and time.perf_counter() < deadline:
+        for log_id, submitted_at in list(pending.items()):
+            status = app_module.anomaly_log_queue.status(log_id)
+            if status in ('mined', 'failed', 'dropped'):
+                del pending[log_id]
+                if status == 'mined':
+                    latencies.append(time.perf_counter() - submitted_at)
+                else:
+                    failed += 1
+        time.sleep(LOG_POLL_SECONDS)
+    return latencies, failed, len(pending)
+
+
+def run_endpoint(client, app_module, path, bodies, readings_per_body):
+    latencies, submitted, anomalies, errors = [], [], 0, 0
+    start = time.perf_counter()
+    for body in bodies:
+        sent = time.perf_counter()
+        response = client.post(path, json=body)
+        done = time.perf_counter()
+        latencies.append(done - sent)
+        if response.status_code != 200:
+            errors += 1
+            continue
+        data = response.get_json()
+        for result in data.get("results", [data]):
+            if result.get("log_id") is not None:
+                submitted.append((result["log_id"], done))
+                anomalies += 1
+    elapsed = time.perf_counter() - start
+    log_latencies, failed, unsettled = wait_for_logs(app_module, submitted)
+    results = {
+        "requests": len(bodies),
+        "readings_per_request": readings_per_body,
+        "requests_per_s": round(len(bodies) / elapsed, 1),
+        "readings_per_s": round(len(bodies) * readings_per_body / elapsed, 1),
+        "errors": errors,
+        "anomalies_logged": anomalies,
+        "logs_failed": failed,
+        "logs_unsettled": unsettled,
+        **{f"request_{k}": v for k, v in percentiles_us(latencies).items()},
+    }
+    if log_latencies:
+        results.update({f"log_to_mined_{k}": v for k, v in percentiles_us(log_latencies).items()})
+    return results
+
+
+def run_flask(chain_url=None, contract_address=None):
+    """POSTs a fixed stream of readings through the app. Without chain_url the chain is an in-process stub."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app_module = import_app(tmp_dir)
+        if chain_url is None:
+            install_chain_stub(app_module)
+        else:
+            app_module.GANACHE_URL = chain_url
+            if contract_address:
+                app_module.CONTRACT_ADDRESS = contract_address
+            app_module.connect_blockchain()
+        client = app_module.app.test_client()
+        # The first LAG_FEATURES_COUNT - 1 readings of each sensor only build history; they are sent untimed
+        warmup = NUM_SENSORS * (LAG_FEATURES_COUNT - 1)
+        single = fleet_payloads(warmup + SINGLE_REQUESTS, "single")
+        batched = fleet_payloads(warmup + BATCH_SIZE * BATCH_REQUESTS, "batch")
+        for payloads in (single, batched):
+            for start in range(0, warmup, BATCH_SIZE):
+                client.post('/sensor_data/batch', json=payloads[start:start + BATCH_SIZE])
+        single_results = run_endpoint(client, app_module, '/sensor_data', single[warmup:], 1)
+        batched = batched[warmup:]
+        batch_results = run_endpoint(client, app_module, '/sensor_data/batch',
+                                     [batched[i:i + BATCH_SIZE] for i in range(0, len(batched), BATCH_SIZE)],
+                                     BATCH_SIZE)
+        app_module.anomaly_log_queue.stop()
+        atexit.unregister(app_module.save_history_snapshot_on_exit)  # tmp_dir is gone by exit
+    return {"chain": chain_url or "stub", "sensor_data": single_results, "sensor_data_batch": batch_results}
+
+
+def run(chain_url=None, contract_address=None):
+    results = {"seed": SEED, "num_sensors": NUM_SENSORS, "anomaly_rate": ANOMALY_RATE,
+               "micro": run_microbenchmarks(), "flask": run_flask(chain_url, contract_address)}
+    print("Microbenchmarks:")
+    for name, value in results["micro"].items():
+        print(f"  {name:<34} {value:>10}")
+    print(f"Flask test client (chain: {results['flask']['chain']}):")
+    for endpoint in ("sensor_data", "sensor_data_batch"):
+        r = results["flask"][endpoint]
+        print(f"  /{endpoint.replace('_batch', '/batch'):<20} {r['requests_per_s']:>8} req/s {r['readings_per_s']:>9} "
+              f"readings/s  p50 {r['request_p50_us']}us p99 {r['request_p99_us']}us  "
+              f"{r['anomalies_logged']} logs (p50 to mined {r.get('log_to_mined_p50_us')}us)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, detection and anomaly logging.")
+    parser.add_argument('--chain-url', help="Log anomalies to a local Hardhat/Ganache node instead of the stub")
+    parser.add_argument('--contract-address', help="AnomalyLogger address on that node (default: app.py's)")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    results = run(args.chain_url, args.contract_address)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
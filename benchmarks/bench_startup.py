@@ -0,0 +1,81 @@
+# benchmarks/bench_startup.py
+# Cold-start time of a backend process: joblib + sklearn + web3 at import (before) vs the memory-mapped model (after).
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+sys.path.insert(0, BACKEND_DIR)
+
+# --- Configuration ---
+REPEATS = 5
+MODEL_PATH = os.path.join(BACKEND_DIR, 'anomaly_detection_model.joblib')
+MODEL_ARRAYS_DIR = os.path.join(BACKEND_DIR, 'anomaly_detection_model_arrays')
+
+# Each scenario runs in a fresh interpreter and reports its own peak RSS. That is VmHWM, which exec resets;
+# ru_maxrss is inherited from the parent, so it would report this process's peak if that were larger.
+REPORT_RSS = ("\nimport json\nwith open('/proc/self/status') as f:\n"
+              "    peak_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))\n"
+              "print(json.dumps({'max_rss_mb': peak_kb / 1024}))")
+SCENARIOS = {
+    # What app.py did at import before: every dependency up front, then unpickle the sklearn forest
+    "before: import sklearn + web3, joblib.load": (
+        "import warnings; warnings.simplefilter('ignore')\n"
+        "import numpy, flask, joblib, web3\n"
+        "from sklearn.ensemble import IsolationForest\n"
+        f"model = joblib.load({MODEL_PATH!r})"
+    ),
+    # What app.py does now to get a scoring model
+    "after: memory-mapped flat model": (
+        "import numpy, flask\n"
+        "from forest_scorer import FlatIsolationForest\n"
+        f"scorer = FlatIsolationForest.load({MODEL_ARRAYS_DIR!r})"
+    ),
+    # The whole backend module, with no Ganache running (it is now contacted on the first request)
+    "after: import app (offline)": "import app",
+}
+
+
+def ensure_model_arrays():
+    from forest_scorer import FlatIsolationForest
+    if not os.path.exists(os.path.join(MODEL_ARRAYS_DIR, 'meta.json')):
+        import joblib
+        FlatIsolationForest.from_model(joblib.load(MODEL_PATH)).save(MODEL_ARRAYS_DIR)
+
+
+def time_scenario(code, env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code + REPORT_RSS], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, json.loads(result.stdout.strip().splitlines()[-1])['max_rss_mb']
+
+
+def run(repeats=REPEATS):
+    ensure_model_arrays()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(os.environ, PYTHONPATH=BACKEND_DIR,
+                   HISTORY_SNAPSHOT_PATH=os.path.join(tmp_dir, 'snapshot.npz'),
+                   ANOMALY_INDEX_DB_PATH=os.path.join(tmp_dir, 'index.sqlite3'))
+        for name, code in SCENARIOS.items():
+            time_scenario(code, env)  # Warm the OS file cache so every run measures the same thing
+            runs = [time_scenario(code, env) for _ in range(repeats)]
+            results.append({
+                "scenario": name,
+                "wall_ms_median": round(statistics.median(t for t, _ in runs) * 1000, 1),
+                "max_rss_mb": round(max(rss for _, rss in runs), 1),
+            })
+
+    print(f"{'scenario':<46} {'cold start':>11} {'peak RSS':>10}")
+    for r in results:
+        print(f"{r['scenario']:<46} {r['wall_ms_median']:>9}ms {r['max_rss_mb']:>8}MB")
+    return results
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,165 @@
+# benchmarks/bench_streaming_detector.py
+# Isolation Forest alone vs the streaming detector screening readings in front of it, on labelled traces with
+# data_simulator.py's anomalies: recall, readings forwarded to the forest and scoring cost per reading.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, '..', 'backend'))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+from bench_startup import MODEL_ARRAYS_DIR, ensure_model_arrays  # noqa: E402
+from data_simulator import inject_anomaly  # noqa: E402
+from features import (FEATURES_PER_READING, LAG_FEATURES_COUNT, TOTAL_FEATURES_FOR_MODEL,  # noqa: E402
+                      build_feature_batch, build_feature_row)
+from forest_scorer import FlatIsolationForest  # noqa: E402
+from load_generator import ANOMALY_TYPES, SyntheticFleet  # noqa: E402
+from sensor_history import SensorHistoryStore  # noqa: E402
+from streaming_detector import StreamingDetector  # noqa: E402
+
+# --- Configuration ---
+SEED = 42
+NUM_SENSORS = 200
+TICKS = 300
+START_TIME = datetime(2024, 6, 1, 15, 0)  # Same simulated clock as bench_pipeline.py
+# Chance per interval that a sensor starts an anomaly: data_simulator.py's 5%, and a sparser fleet
+SCENARIOS = {"simulator": 0.05, "sparse": 0.005}
+ANOMALY_DURATION = (3, 10)  # Extra intervals an anomaly lasts, as in data_simulator.py
+
+
+def labelled_trace(start_probability, num_sensors=NUM_SENSORS, ticks=TICKS, seed=SEED):
+    """(ticks, sensors, FEATURES_PER_READING) readings and a (ticks, sensors) mask of injected anomalies.
+
+    Each sensor follows data_simulator.run_simulation: an anomaly starts with `start_probability` per
+    interval, keeps its type for 3-10 further intervals and is applied with inject_anomaly.
+    """
+    fleet = SyntheticFleet(num_sensors, 0.0, seed, START_TIME)
+    rng = random.Random(seed)
+    random.seed(seed)  # inject_anomaly draws from the module-level generator
+    readings = np.empty((ticks, num_sensors, FEATURES_PER_READING))
+    labels = np.zeros((ticks, num_sensors), dtype=bool)
+    countdown = [0] * num_sensors
+    anomaly_type = [None] * num_sensors
+    for tick in range(ticks):
+        readings[tick] = fleet.tick(tick)
+        for sensor in range(num_sensors):
+            if countdown[sensor] > 0:
+                countdown[sensor] -= 1
+            elif rng.random() < start_probability:
+                anomaly_type[sensor] = rng.choice(ANOMALY_TYPES)
+                countdown[sensor] = rng.randint(*ANOMALY_DURATION)
+            else:
+                anomaly_type[sensor] = None
+            if anomaly_type[sensor]:
+                readings[tick, sensor, 0], readings[tick, sensor, 1], readings[tick, sensor, 2], _ = inject_anomaly(
+                    *readings[tick, sensor], anomaly_type[sensor])
+                labels[tick, sensor] = True
+    return fleet.sensor_ids, readings, labels
+
+
+def replay(scorer, sensor_ids, readings, screen, batch_ticks=True):
+    """Feeds the trace through a history store (and a streaming detector if `screen`), tick by tick.
+
+    With `batch_ticks` every tick is one append_readings() call scored in one batch (/sensor_data/batch);
+    otherwise every reading goes through append() and update_one() on its own (/sensor_data).
+    Returns (flags, forwarded, seconds): which readings were predicted anomalous, which were scored by the
+    forest, and the seconds spent appending, screening and scoring.
+    """
+    ticks, num_sensors = readings.shape[:2]
+    store = SensorHistoryStore(LAG_FEATURES_COUNT, FEATURES_PER_READING, max_sensors=None)
+    detector = StreamingDetector(FEATURES_PER_READING) if screen else None
+    flags = np.zeros((ticks, num_sensors), dtype=bool)
+    forwarded = np.zeros((ticks, num_sensors), dtype=bool)
+    flagged = np.ones(num_sensors, dtype=bool)
+
+    def on_round(positions, rows, values, counts):
+        flagged[positions] = detector.update(rows, values, counts)
+
+    def process(tick, positions):
+        counts, windows = store.append_readings([sensor_ids[p] for p in positions], readings[tick, positions],
+                                                on_round=on_round if screen else None)
+        score = (counts >= LAG_FEATURES_COUNT) & flagged[positions]
+        if score.any():
+            flags[tick, positions[score]] = scorer.decision_function(build_feature_batch(windows[score])) < 0
+        forwarded[tick, positions[score]] = True
+
+    def process_one(tick, sensor):  # As /sensor_data does it
+        with store.lock:
+            row, count = store.append(sensor_ids[sensor], readings[tick, sensor])
+            forward = detector.update_one(row, readings[tick, sensor].tolist(), count) if screen else True
+            forward = forward and count >= LAG_FEATURES_COUNT
+            if forward:
+                build_feature_row(store.readings(row), out=features[0])
+        if forward:
+            flags[tick, sensor] = scorer.decision_function(features)[0] < 0
+            forwarded[tick, sensor] = True
+
+    all_sensors = np.arange(num_sensors)
+    features = np.empty((1, TOTAL_FEATURES_FOR_MODEL))
+    start = time.perf_counter()
+    for tick in range(ticks):
+        if batch_ticks:
+            process(tick, all_sensors)
+        else:
+            for sensor in all_sensors:
+                process_one(tick, sensor)
+    return flags, forwarded, time.perf_counter() - start
+
+
+def run_scenario(scorer, start_probability):
+    sensor_ids, readings, labels = labelled_trace(start_probability)
+    scored = np.zeros_like(labels)
+    scored[LAG_FEATURES_COUNT - 1:] = True  # Readings with a full lag window
+    labels &= scored
+    result = {"readings": int(scored.sum()), "anomalous_readings": int(labels.sum())}
+
+    forest, _, forest_s = replay(scorer, sensor_ids, readings, screen=False)
+    cascade, forwarded, cascade_s = replay(scorer, sensor_ids, readings, screen=True)
+    for name, flags in (("forest", forest), ("cascade", cascade)):
+        true_positives = int((flags & labels).sum())
+        result[f"{name}_recall"] = round(true_positives / max(labels.sum(), 1), 4)
+        result[f"{name}_precision"] = round(true_positives / max(flags.sum(), 1), 4)
+    result["forest_flags_kept"] = round(float((cascade & forest).sum() / max(forest.sum(), 1)), 4)
+    result["forwarded_fraction"] = round(float(forwarded.sum() / scored.sum()), 4)
+    result["batch_forest_us_per_reading"] = round(forest_s * 1e6 / scored.sum(), 2)
+    result["batch_cascade_us_per_reading"] = round(cascade_s * 1e6 / scored.sum(), 2)
+
+    _, _, forest_s = replay(scorer, sensor_ids, readings, screen=False, batch_ticks=False)
+    single, _, cascade_s = replay(scorer, sensor_ids, readings, screen=True, batch_ticks=False)
+    assert np.array_equal(single, cascade), "update_one() and update() disagree"
+    result["single_forest_us_per_reading"] = round(forest_s * 1e6 / scored.sum(), 1)
+    result["single_cascade_us_per_reading"] = round(cascade_s * 1e6 / scored.sum(), 1)
+    return result
+
+
+def run(scenarios=SCENARIOS):
+    ensure_model_arrays()
+    scorer = FlatIsolationForest.load(MODEL_ARRAYS_DIR)
+    results = []
+    for scenario, start_probability in scenarios.items():
+        result = {"scenario": scenario, "anomaly_start_probability": start_probability,
+                  **run_scenario(scorer, start_probability)}
+        print(json.dumps(result), flush=True)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming detector as a first-stage filter.")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    results = run()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/bench_training.py
+# Time and peak memory of loading training data and training the model at 1e5, 1e6 and 1e7 rows.
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+# --- Configuration ---
+ROW_COUNTS = (100_000, 1_000_000, 10_000_000)
+JSON_MAX_ROWS = 1_000_000  # The JSON file is ~1.8 GB at 1e7 rows; only measured up to here
+SHARDS = 4
+SEED = 42
+GENERATE_CHUNK_ROWS = 100_000
+
+# Each task runs in a fresh interpreter. Its own peak is VmHWM, which exec resets (ru_maxrss is inherited
+# from this process). RUSAGE_CHILDREN reports the largest pool worker, not the sum of all workers, so this
+# process keeps its own footprint small to avoid masking them.
+TASKS = {
+    "load_json": "from model_training import open_training_data\n"
+                 "data = open_training_data(PATH)\n"
+                 "float(data.sum())",
+    "stream_npy": "from model_training import iter_training_chunks\n"
+                  "total = sum(float(chunk.sum()) for chunk in iter_training_chunks(PATH))",
+    "fit": "from model_training import train_model\n"
+           "model = train_model(PATH, n_shards=1, n_jobs=-1)",
+    "fit_sharded": f"from model_training import train_model\n"
+                   f"model = train_model(PATH, n_shards={SHARDS}, n_jobs=-1)",
+}
+TASK_TEMPLATE = """
+import json, resource, sys, time, warnings
+warnings.simplefilter('ignore')
+PATH = sys.argv[1]
+start = time.perf_counter()
+{task}
+elapsed = time.perf_counter() - start
+with open('/proc/self/status') as f:
+    peak_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+print(json.dumps({{"seconds": elapsed,
+                  "parent_max_rss_mb": peak_kb / 1024,
+                  "largest_worker_max_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024}}))
+"""
+
+
+def write_training_file(path, n_rows, seed=SEED):
+    """Writes `n_rows` shuffled, jittered copies of the shipped normal data as a .npy file, chunk by chunk."""
+    with open(os.path.join(BACKEND_DIR, 'normal_training_data_with_lags.json'), 'r') as f:
+        base = np.asarray(json.load(f), dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(n_rows, base.shape[1]))
+    for start in range(0, n_rows, GENERATE_CHUNK_ROWS):
+        stop = min(start + GENERATE_CHUNK_ROWS, n_rows)
+        rows = base[rng.integers(0, len(base), stop - start)]
+        out[start:stop] = rows + rng.normal(scale=0.1, size=rows.shape)
+    out.flush()
+    del out
+
+
+def write_json_copy(npy_path, json_path):
+    """Same rows in the legacy JSON list-of-rows format, written chunk by chunk."""
+    data = np.load(npy_path, mmap_mode='r')
+    with open(json_path, 'w') as f:
+        f.write('[')
+        for start in range(0, len(data), GENERATE_CHUNK_ROWS):
+            f.write((',' if start else '') + json.dumps(data[start:start + GENERATE_CHUNK_ROWS].tolist())[1:-1])
+        f.write(']')
+
+
+def run_task(name, path):
+    result = subprocess.run([sys.executable, '-c', TASK_TEMPLATE.format(task=TASKS[name]), path], cwd=BACKEND_DIR,
+                            env=dict(os.environ, PYTHONPATH=BACKEND_DIR), capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(row_counts=ROW_COUNTS):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in row_counts:
+            npy_path = os.path.join(tmp_dir, f'train_{n_rows}.npy')
+            write_training_file(npy_path, n_rows)
+            tasks = [("stream_npy", npy_path), ("fit", npy_path), ("fit_sharded", npy_path)]
+            if n_rows <= JSON_MAX_ROWS:
+                json_path = os.path.join(tmp_dir, f'train_{n_rows}.json')
+                write_json_copy(npy_path, json_path)
+                tasks.insert(0, ("load_json", json_path))
+            for name, path in tasks:
+                measured = run_task(name, path)
+                results.append({"rows": n_rows, "task": name, "file_mb": round(os.path.getsize(path) / 1e6, 1),
+                                "seconds": round(measured["seconds"], 2),
+                                "parent_max_rss_mb": round(measured["parent_max_rss_mb"], 1),
+                                "largest_worker_max_rss_mb": round(measured["largest_worker_max_rss_mb"], 1)})
+                r = results[-1]
+                print(f"{r['rows']:>10,} {r['task']:<12} file {r['file_mb']:>7}MB  {r['seconds']:>8}s  "
+                      f"peak RSS {r['parent_max_rss_mb']:>7}MB (largest worker {r['largest_worker_max_rss_mb']}MB)",
+                      flush=True)
+            os.remove(npy_path)
+    return results
+
+
+if __name__ == "__main__":
+    run(tuple(int(n) for n in sys.argv[1:]) or ROW_COUNTS)
@@ -0,0 +1,152 @@
+# benchmarks/run_benchmarks.py
+# Runs the benchmark suite offline with fixed seeds and sizes, writes the results as JSON and compares runs.
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+import bench_forest_scorer  # noqa: E402
+import bench_history_snapshot  # noqa: E402
+import bench_model_refresh  # noqa: E402
+import bench_model_registry  # noqa: E402
+import bench_pipeline  # noqa: E402
+import bench_startup  # noqa: E402
+import bench_streaming_detector  # noqa: E402
+import bench_training  # noqa: E402
+
+# --- Configuration ---
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+SNAPSHOT_SENSORS = 100_000  # The standalone script defaults to 1e6; the suite keeps the run short
+TRAINING_ROWS = (100_000,)  # Only with --training; minutes per run even at this size
+CHANGE_THRESHOLD = 0.10  # --compare marks metrics that moved by more than this fraction
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARKS_DIR, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCHMARKS_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_pipeline_on_chain(chain_url, contract_address=None):
+    """The pipeline benchmark against a real node, in its own process (app.py can only be imported once)."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, 'pipeline_chain.json')
+        command = [sys.executable, os.path.join(BENCHMARKS_DIR, 'bench_pipeline.py'), '--chain-url', chain_url,
+                   '--output', output]
+        if contract_address:
+            command += ['--contract-address', contract_address]
+        subprocess.run(command, check=True)
+        with open(output) as f:
+            return json.load(f)
+
+
+def run_suite(chain_url=None, contract_address=None, training=False):
+    suite = {
+        "pipeline": lambda: bench_pipeline.run(),
+        "forest_scorer": lambda: bench_forest_scorer.run(),
+        "history_snapshot": lambda: bench_history_snapshot.run(SNAPSHOT_SENSORS),
+        "startup": lambda: bench_startup.run(),
+        "streaming_detector": lambda: bench_streaming_detector.run(),
+        "model_refresh": lambda: bench_model_refresh.run(),
+        "model_registry": lambda: bench_model_registry.run(),
+    }
+    if training:
+        suite["training"] = lambda: bench_training.run(TRAINING_ROWS)
+    if chain_url:
+        suite["pipeline_chain"] = lambda: run_pipeline_on_chain(chain_url, contract_address)
+
+    results = {}
+    for name, benchmark in suite.items():
+        print(f"\n=== {name} ===", flush=True)
+        results[name] = benchmark()
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def flatten(results, prefix=''):
+    """{"a.b[batch_size=64].c": number} for every numeric leaf. List items are labelled by their leading
+    identifying fields (e.g. batch_size, scenario, rows + task), so reordered or extra items still line up."""
+    flat = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(results, list):
+        for index, item in enumerate(results):
+            label = str(index)
+            if isinstance(item, dict):
+                keys = []
+                for key, value in item.items():
+                    if isinstance(value, float) or not isinstance(value, (str, int)):
+                        break
+                    keys.append(f"{key}={value}")
+                label = ','.join(keys) or label
+            flat.update(flatten(item, f"{prefix}[{label}]"))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        flat[prefix] = results
+    return flat
+
+
+def compare(baseline, current, threshold=CHANGE_THRESHOLD):
+    """Prints every metric present in both runs with its relative change; '!' marks changes beyond threshold."""
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    print(f"\nComparing {baseline['meta'].get('commit')} -> {current['meta'].get('commit')}")
+    print(f"{'metric':<80} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        change = (new[key] - old[key]) / old[key] if old[key] else 0.0
+        marker = '!' if abs(change) > threshold else ' '
+        print(f"{key:<80} {old[key]:>12} {new[key]:>12} {change:>+7.1%}{marker}")
+    only = sorted(old.keys() ^ new.keys())
+    if only:
+        print(f"({len(only)} metrics only in one of the runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and write the results as JSON.")
+    parser.add_argument('--output', help="Results file (default: results/<commit>.json)")
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help="Compare against an earlier results file")
+    parser.add_argument('--chain-url', help="Also run the pipeline against a local Hardhat/Ganache node")
+    parser.add_argument('--contract-address', help="AnomalyLogger address on that node (default: app.py's)")
+    parser.add_argument('--threshold', type=float, default=CHANGE_THRESHOLD,
+                        help="Relative change that --compare marks with '!'")
+    parser.add_argument('--training', action='store_true', help="Include the (slow) training benchmark")
+    args = parser.parse_args()
+
+    report = run_suite(args.chain_url, args.contract_address, args.training)
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = report['meta']['commit'] or 'unknown'
+        output = os.path.join(RESULTS_DIR, f"{commit[:12]}{'-dirty' if commit.endswith('-dirty') else ''}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
 # frontend/streamlit_app.py
 
+import logging
+
 import streamlit as st
 import requests
 import pandas as pd
 import time
 import datetime
 
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 FLASK_BACKEND_URL = "http://127.0.0.1:5000"
+ANOMALY_PAGE_SIZE = 1000  # Matches the backend's MAX_ANOMALY_PAGE_SIZE
 
 st.set_page_config(layout="wide") # Use wide layout for better display
 
@@ -16,18 +21,70 @@ st.markdown("Monitor real-time sensor data and blockchain-logged anomalies.")
 
 # --- Function to fetch anomalies from Flask backend ---
 def get_anomalies():
+    """Returns all logged anomalies as a DataFrame, downloading only the rows added since the last rerun.
+
+    The DataFrame, the backend's ETag, its reorg rewind count and the newest anomaly_index seen are kept in
+    st.session_state. Each rerun asks for ?since_index=<newest seen> with If-None-Match, so an unchanged
+    history costs one 304 response and new rows are parsed and timestamp-converted once, then appended.
+    Cached rows are dropped and everything is fetched again when the index was rewound by a reorg, which
+    may replace rows at positions already cached.
+    """
+    state = st.session_state
+    if "anomalies_df" not in state:
+        state.anomalies_df = pd.DataFrame()
+        state.anomalies_etag = None
+        state.anomalies_rewinds = None
+        state.anomalies_last_index = -1
+
     try:
-        response = requests.get(f"{FLASK_BACKEND_URL}/anomalies")
-        response.raise_for_status() # Raise an exception for HTTP errors
-        anomalies_data = response.json()
-        print(f"DEBUG: Fetched anomalies from backend: {anomalies_data}") # Add this for debugging
-        return anomalies_data
+        new_rows = []
+        etag = state.anomalies_etag
+        rewinds = state.anomalies_rewinds
+        while True:
+            # Only the first request is conditional; later pages of the same refresh must always be sent
+            headers = {"If-None-Match": etag} if etag and not new_rows else {}
+            since_index = new_rows[-1]["anomaly_index"] if new_rows else state.anomalies_last_index
+            response = requests.get(f"{FLASK_BACKEND_URL}/anomalies",
+                                    params={"since_index": since_index, "limit": ANOMALY_PAGE_SIZE},
+                                    headers=headers)
+            if response.status_code == 304:
+                break
+            response.raise_for_status() # Raise an exception for HTTP errors
+            etag = response.headers.get("ETag")
+
+            # The backend index went backwards or was rewound (reorg or a rebuilt index): start over from scratch
+            last_index = response.headers.get("X-Last-Index")
+            rewinds = response.headers.get("X-Index-Rewinds")
+            if ((last_index is not None and int(last_index) < state.anomalies_last_index)
+                    or (state.anomalies_rewinds is not None and rewinds != state.anomalies_rewinds)):
+                del state["anomalies_df"]
+                return get_anomalies()
+
+            page = response.json()
+            new_rows.extend(page)
+            if len(page) < ANOMALY_PAGE_SIZE:
+                break
+
+        if not new_rows and state.anomalies_etag is not None and etag != state.anomalies_etag:
+            # The index changed without adding rows after ours, so rows we hold were replaced: start over
+            del state["anomalies_df"]
+            return get_anomalies()
+        state.anomalies_etag = etag
+        state.anomalies_rewinds = rewinds
+        if new_rows:
+            logger.debug("Fetched %d new anomalies from backend", len(new_rows))
+            df_new = pd.DataFrame(new_rows)
+            # Convert Unix timestamp to readable datetime, for the new rows only
+            df_new['Time (UTC)'] = pd.to_datetime(df_new['timestamp'], unit='s')
+            state.anomalies_df = pd.concat([state.anomalies_df, df_new], ignore_index=True)
+            state.anomalies_last_index = int(df_new['anomaly_index'].max())
+        return state.anomalies_df
     except requests.exceptions.ConnectionError:
         st.error(f"Cannot connect to Flask backend at {FLASK_BACKEND_URL}. Please ensure it's running.")
-        return []
+        return state.anomalies_df
     except Exception as e:
         st.error(f"Error fetching anomalies: {e}")
-        return []
+        return state.anomalies_df
 
 # --- Function to send simulated sensor data to Flask backend ---
 # (This remains the same as your previous working version)
@@ -57,7 +114,8 @@ def send_sensor_data(sensor_id, temperature, humidity, pressure):
 st.sidebar.header("Simulate Sensor Data")
 with st.sidebar.form("sensor_form"):
     st.markdown("Enter sensor readings to test anomaly detection.")
-    sim_sensor_id = st.text_input("Sensor ID", value=f"sensor_{int(time.time()) % 1000}")
+    # A stable default lets repeated submissions build up lag history instead of creating a new sensor each rerun
+    sim_sensor_id = st.text_input("Sensor ID", value="manual_sensor_01")
     sim_temperature = st.number_input("Temperature (°C)", value=20.5, format="%.1f")
     sim_humidity = st.number_input("Humidity (%)", value=50.0, format="%.1f")
     sim_pressure = st.number_input("Pressure (hPa)", value=700.0, format="%.1f")
@@ -66,8 +124,8 @@ with st.sidebar.form("sensor_form"):
     if submitted:
         st.sidebar.write("Sending data...")
         response = send_sensor_data(sim_sensor_id, sim_temperature, sim_humidity, sim_pressure)
-        if response.get("status") == "Anomaly Detected and Logged":
-            st.sidebar.success(f"Anomaly detected and logged for {sim_sensor_id}! Tx initiated.")
+        if response.get("status", "").startswith("Anomaly Detected"):
+            st.sidebar.success(f"Anomaly detected for {sim_sensor_id}! Blockchain log ID: {response.get('log_id')}")
         elif response.get("status") == "Data Processed: No Anomaly":
             st.sidebar.info(f"Data processed for {sim_sensor_id}. No anomaly detected.")
         else:
@@ -85,26 +143,14 @@ placeholder = st.empty()
 def refresh_anomalies_dashboard():
     with placeholder.container():
         st.subheader("Latest Anomalies")
-        anomalies = get_anomalies() # Fetches data from Flask backend
-
-        if anomalies:
-            # Create DataFrame directly from the list of dictionaries
-            df = pd.DataFrame(anomalies)
+        df = get_anomalies() # Cached DataFrame, topped up with any new rows from the Flask backend
 
+        if not df.empty:
             # Ensure expected columns are present and rename for display
-            expected_columns = ['timestamp', 'sensor_id', 'data_value', 'anomaly_type', 'explanation']
+            expected_columns = ['Time (UTC)', 'sensor_id', 'data_value', 'anomaly_type', 'explanation']
             if all(col in df.columns for col in expected_columns):
-                # Convert Unix timestamp to readable datetime
-                df['Time (UTC)'] = pd.to_datetime(df['timestamp'], unit='s')
-
                 # Select and reorder columns for display
-                df_display = df[[
-                    'Time (UTC)',
-                    'sensor_id',
-                    'data_value',
-                    'anomaly_type',
-                    'explanation'
-                ]].copy() # .copy() to avoid SettingWithCopyWarning
+                df_display = df[expected_columns].copy() # .copy() to avoid SettingWithCopyWarning
 
                 # Rename columns for better readability in the UI
                 df_display.columns = [
@@ -117,7 +163,7 @@ def refresh_anomalies_dashboard():
                 st.dataframe(df_display, use_container_width=True, height=300)
             else:
                 st.warning("Anomaly data is missing expected columns. Showing raw data for debugging.")
-                st.json(anomalies) # Display raw JSON for debugging
+                st.json(df.to_dict(orient="records")) # Display raw rows for debugging
 
         else:
             st.info("No anomalies logged on the blockchain yet. Simulate some data!")
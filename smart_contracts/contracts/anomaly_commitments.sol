@@ -0,0 +1,85 @@
+// smart_contract/contracts/anomaly_commitments.sol
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+// Anchors batches of anomalies with one transaction each: the backend collects anomalies over a window,
+// keeps the full records in a local append-only file and commits only the Merkle root of their canonical
+// encodings and the batch size. Anyone holding a record and its inclusion proof can check it against the
+// committed root with verifyInclusion().
+//
+// Merkle tree (built by backend/anomaly_commitments.py):
+//   - leaf = keccak256(0x00 || record), where record is the ABI encoding of
+//     (uint64 sequence, uint40 timestamp, bytes32 sensorId, uint8 anomalyType, int32 dataValue, int32 score,
+//      string explanation) with the same field encodings as CompactAnomalyLogger
+//   - node = keccak256(0x01 || min(a, b) || max(a, b)), so a proof needs no left/right flags
+//   - a level with an odd number of nodes promotes its last node unchanged to the next level
+// The 0x00 / 0x01 prefixes keep a leaf from ever being passed off as an internal node.
+contract AnomalyCommitments {
+    // Packs into one storage slot
+    struct Commitment {
+        uint32 count;
+        uint40 firstTimestamp;
+        uint40 lastTimestamp;
+        uint64 blockNumber;
+    }
+
+    address public immutable committer;
+    uint256 public commitmentCount;
+
+    // Merkle root => its batch; count is 0 for roots never committed
+    mapping(bytes32 => Commitment) public commitments;
+
+    event BatchCommitted(
+        uint256 indexed batchIndex,
+        bytes32 indexed root,
+        uint32 count,
+        uint40 firstTimestamp,
+        uint40 lastTimestamp
+    );
+
+    constructor() {
+        committer = msg.sender;
+    }
+
+    function commitBatch(bytes32 _root, uint32 _count, uint40 _firstTimestamp, uint40 _lastTimestamp) external {
+        require(msg.sender == committer, "Only the committer can commit batches");
+        require(_count > 0, "Empty batch");
+        require(commitments[_root].count == 0, "Root already committed");
+        commitments[_root] = Commitment({
+            count: _count,
+            firstTimestamp: _firstTimestamp,
+            lastTimestamp: _lastTimestamp,
+            blockNumber: uint64(block.number)
+        });
+        uint256 batchIndex = commitmentCount;
+        commitmentCount = batchIndex + 1;
+        emit BatchCommitted(batchIndex, _root, _count, _firstTimestamp, _lastTimestamp);
+    }
+
+    function isCommitted(bytes32 _root) public view returns (bool) {
+        return commitments[_root].count > 0;
+    }
+
+    // True if `_record` (a canonical record encoding) is a leaf of the committed batch `_root`.
+    function verifyInclusion(
+        bytes32 _root,
+        bytes calldata _record,
+        bytes32[] calldata _proof
+    ) external view returns (bool) {
+        if (!isCommitted(_root)) {
+            return false;
+        }
+        return processProof(keccak256(abi.encodePacked(bytes1(0x00), _record)), _proof) == _root;
+    }
+
+    // Root of the tree containing `_leaf`, given the sibling hashes on its path
+    function processProof(bytes32 _leaf, bytes32[] calldata _proof) public pure returns (bytes32 node) {
+        node = _leaf;
+        for (uint256 i = 0; i < _proof.length; i++) {
+            bytes32 sibling = _proof[i];
+            node = node < sibling
+                ? keccak256(abi.encodePacked(bytes1(0x01), node, sibling))
+                : keccak256(abi.encodePacked(bytes1(0x01), sibling, node));
+        }
+    }
+}
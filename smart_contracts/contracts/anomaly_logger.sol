@@ -13,9 +13,16 @@ contract AnomalyLogger {
 
     Anomaly[] public anomalies;
 
+    // keccak256(sensorId) => positions in `anomalies` logged for that sensor, in logging order
+    mapping(bytes32 => uint256[]) private sensorAnomalyIndices;
+
+    // sensorKey is keccak256(bytes(sensorId)), the same topic value an indexed string would produce, so logs
+    // can still be filtered by sensor; sensorId itself is in the data so indexers can read it back.
     event AnomalyDetected(
+        uint256 indexed anomalyIndex,
         uint256 indexed timestamp,
-        string indexed sensorId,
+        bytes32 indexed sensorKey,
+        string sensorId,
         int256 dataValue,
         string anomalyType,
         string explanation
@@ -28,6 +35,38 @@ contract AnomalyLogger {
         string memory _anomalyType,
         string memory _explanation
     ) public {
+        _logAnomaly(_timestamp, _sensorId, _dataValue, _anomalyType, _explanation);
+    }
+
+    // Logs many anomalies in one transaction so the per-transaction overhead is paid once per batch.
+    // Entry i of every array describes the same anomaly; one AnomalyDetected event is emitted per entry.
+    function logAnomalies(
+        uint256[] memory _timestamps,
+        string[] memory _sensorIds,
+        int256[] memory _dataValues,
+        string[] memory _anomalyTypes,
+        string[] memory _explanations
+    ) public {
+        uint256 count = _timestamps.length;
+        require(
+            _sensorIds.length == count &&
+            _dataValues.length == count &&
+            _anomalyTypes.length == count &&
+            _explanations.length == count,
+            "Array lengths must match"
+        );
+        for (uint256 i = 0; i < count; i++) {
+            _logAnomaly(_timestamps[i], _sensorIds[i], _dataValues[i], _anomalyTypes[i], _explanations[i]);
+        }
+    }
+
+    function _logAnomaly(
+        uint256 _timestamp,
+        string memory _sensorId,
+        int256 _dataValue,
+        string memory _anomalyType,
+        string memory _explanation
+    ) internal {
         anomalies.push(Anomaly({
             timestamp: _timestamp,
             sensorId: _sensorId,
@@ -35,10 +74,84 @@ contract AnomalyLogger {
             anomalyType: _anomalyType,
             explanation: _explanation
         }));
-        emit AnomalyDetected(_timestamp, _sensorId, _dataValue, _anomalyType, _explanation);
+        uint256 anomalyIndex = anomalies.length - 1;
+        bytes32 sensorKey = keccak256(bytes(_sensorId));
+        sensorAnomalyIndices[sensorKey].push(anomalyIndex);
+        emit AnomalyDetected(anomalyIndex, _timestamp, sensorKey, _sensorId, _dataValue, _anomalyType, _explanation);
     }
 
+    // Returns the whole history; its cost grows with every anomaly logged. Prefer getAnomalies().
     function getAllAnomalies() public view returns (Anomaly[] memory) {
         return anomalies;
     }
+
+    function anomalyCount() public view returns (uint256) {
+        return anomalies.length;
+    }
+
+    // Returns up to `_limit` anomalies starting at position `_offset`, oldest first.
+    function getAnomalies(uint256 _offset, uint256 _limit) public view returns (Anomaly[] memory page) {
+        uint256 end = _pageEnd(anomalies.length, _offset, _limit);
+        page = new Anomaly[](end - _offset);
+        for (uint256 i = _offset; i < end; i++) {
+            page[i - _offset] = anomalies[i];
+        }
+    }
+
+    function sensorAnomalyCount(string memory _sensorId) public view returns (uint256) {
+        return sensorAnomalyIndices[keccak256(bytes(_sensorId))].length;
+    }
+
+    // Same as getAnomalies() but over the anomalies of a single sensor; `_offset` counts that sensor's anomalies only.
+    function getSensorAnomalies(
+        string memory _sensorId,
+        uint256 _offset,
+        uint256 _limit
+    ) public view returns (Anomaly[] memory page) {
+        uint256[] storage indices = sensorAnomalyIndices[keccak256(bytes(_sensorId))];
+        uint256 end = _pageEnd(indices.length, _offset, _limit);
+        page = new Anomaly[](end - _offset);
+        for (uint256 i = _offset; i < end; i++) {
+            page[i - _offset] = anomalies[indices[i]];
+        }
+    }
+
+    // Binary search for the first position whose timestamp is >= `_since`. Only exact if anomalies were logged in
+    // non-decreasing timestamp order: the backend sends them that way, but the contract does not enforce it.
+    function firstAnomalySince(uint256 _since) public view returns (uint256) {
+        uint256 low = 0;
+        uint256 high = anomalies.length;
+        while (low < high) {
+            uint256 mid = (low + high) / 2;
+            if (anomalies[mid].timestamp < _since) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low;
+    }
+
+    // Per-sensor variant of firstAnomalySince(); the result is an offset for getSensorAnomalies().
+    function firstSensorAnomalySince(string memory _sensorId, uint256 _since) public view returns (uint256) {
+        uint256[] storage indices = sensorAnomalyIndices[keccak256(bytes(_sensorId))];
+        uint256 low = 0;
+        uint256 high = indices.length;
+        while (low < high) {
+            uint256 mid = (low + high) / 2;
+            if (anomalies[indices[mid]].timestamp < _since) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low;
+    }
+
+    function _pageEnd(uint256 _total, uint256 _offset, uint256 _limit) internal pure returns (uint256) {
+        if (_offset >= _total) {
+            return _offset;
+        }
+        return _limit > _total - _offset ? _total : _offset + _limit;
+    }
 }
\ No newline at end of file
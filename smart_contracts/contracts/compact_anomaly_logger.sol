@@ -0,0 +1,167 @@
+// smart_contract/contracts/compact_anomaly_logger.sol
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+// Gas-compact variant of AnomalyLogger. A record is two storage slots instead of one slot per field plus
+// one per 32 bytes of every string:
+//   - sensorId is a bytes32 (the UTF-8 ID right-padded with zeros, or its keccak256 if longer than 32 bytes)
+//   - the anomaly type is a uint8 code (see AnomalyType)
+//   - the reading and the Isolation Forest score are scaled integers (value x100, score x1e6)
+//   - the explanation is only emitted in the AnomalyDetected event, never stored
+// Deployed with storeRecords = false, the contract keeps nothing per anomaly: records live only in events,
+// and the one storage write per transaction is the running anomaly count that numbers them.
+// backend/anomaly_encoding.py builds the arguments and decodes the events.
+contract CompactAnomalyLogger {
+    enum AnomalyType {
+        Unspecified,
+        EnvironmentalTimeSeries
+    }
+
+    // timestamp, anomalyType, dataValue and score pack into one slot; sensorId takes the second
+    struct Anomaly {
+        uint40 timestamp;
+        AnomalyType anomalyType;
+        int32 dataValue;
+        int32 score;
+        bytes32 sensorId;
+    }
+
+    // One anomaly as sent by the backend; the argument of logAnomaly and the element of logAnomalies
+    struct AnomalyInput {
+        uint40 timestamp;
+        bytes32 sensorId;
+        uint8 anomalyType;
+        int32 dataValue;
+        int32 score;
+        string explanation;
+    }
+
+    bool public immutable storeRecords;
+    uint256 private nextAnomalyIndex;
+    Anomaly[] private anomalies;
+
+    // sensorId => positions in `anomalies` logged for that sensor, in logging order
+    mapping(bytes32 => uint256[]) private sensorAnomalyIndices;
+
+    event AnomalyDetected(
+        uint256 indexed anomalyIndex,
+        uint256 indexed timestamp,
+        bytes32 indexed sensorId,
+        uint8 anomalyType,
+        int32 dataValue,
+        int32 score,
+        string explanation
+    );
+
+    constructor(bool _storeRecords) {
+        storeRecords = _storeRecords;
+    }
+
+    modifier recordsStored() {
+        require(storeRecords, "Records are only kept in AnomalyDetected events");
+        _;
+    }
+
+    function logAnomaly(AnomalyInput calldata _anomaly) external {
+        uint256 anomalyIndex = nextAnomalyIndex;
+        _logAnomaly(anomalyIndex, _anomaly);
+        nextAnomalyIndex = anomalyIndex + 1;
+    }
+
+    // Logs many anomalies in one transaction; one AnomalyDetected event is emitted per entry.
+    function logAnomalies(AnomalyInput[] calldata _anomalies) external {
+        uint256 firstIndex = nextAnomalyIndex;
+        for (uint256 i = 0; i < _anomalies.length; i++) {
+            _logAnomaly(firstIndex + i, _anomalies[i]);
+        }
+        nextAnomalyIndex = firstIndex + _anomalies.length;  // Written once per batch
+    }
+
+    function _logAnomaly(uint256 _anomalyIndex, AnomalyInput calldata _anomaly) internal {
+        AnomalyType anomalyType = AnomalyType(_anomaly.anomalyType);  // Reverts on an unknown code
+        if (storeRecords) {
+            anomalies.push(Anomaly({
+                timestamp: _anomaly.timestamp,
+                anomalyType: anomalyType,
+                dataValue: _anomaly.dataValue,
+                score: _anomaly.score,
+                sensorId: _anomaly.sensorId
+            }));
+            sensorAnomalyIndices[_anomaly.sensorId].push(_anomalyIndex);
+        }
+        emit AnomalyDetected(
+            _anomalyIndex, _anomaly.timestamp, _anomaly.sensorId, _anomaly.anomalyType, _anomaly.dataValue,
+            _anomaly.score, _anomaly.explanation
+        );
+    }
+
+    function anomalyCount() public view returns (uint256) {
+        return nextAnomalyIndex;
+    }
+
+    // Returns up to `_limit` anomalies starting at position `_offset`, oldest first.
+    function getAnomalies(uint256 _offset, uint256 _limit) public view recordsStored returns (Anomaly[] memory page) {
+        uint256 end = _pageEnd(anomalies.length, _offset, _limit);
+        page = new Anomaly[](end - _offset);
+        for (uint256 i = _offset; i < end; i++) {
+            page[i - _offset] = anomalies[i];
+        }
+    }
+
+    function sensorAnomalyCount(bytes32 _sensorId) public view recordsStored returns (uint256) {
+        return sensorAnomalyIndices[_sensorId].length;
+    }
+
+    // Same as getAnomalies() but over the anomalies of a single sensor; `_offset` counts that sensor's anomalies only.
+    function getSensorAnomalies(
+        bytes32 _sensorId,
+        uint256 _offset,
+        uint256 _limit
+    ) public view recordsStored returns (Anomaly[] memory page) {
+        uint256[] storage indices = sensorAnomalyIndices[_sensorId];
+        uint256 end = _pageEnd(indices.length, _offset, _limit);
+        page = new Anomaly[](end - _offset);
+        for (uint256 i = _offset; i < end; i++) {
+            page[i - _offset] = anomalies[indices[i]];
+        }
+    }
+
+    // Binary search for the first position whose timestamp is >= `_since`. Only exact if anomalies were logged in
+    // non-decreasing timestamp order: the backend sends them that way, but the contract does not enforce it.
+    function firstAnomalySince(uint256 _since) public view recordsStored returns (uint256) {
+        uint256 low = 0;
+        uint256 high = anomalies.length;
+        while (low < high) {
+            uint256 mid = (low + high) / 2;
+            if (anomalies[mid].timestamp < _since) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low;
+    }
+
+    // Per-sensor variant of firstAnomalySince(); the result is an offset for getSensorAnomalies().
+    function firstSensorAnomalySince(bytes32 _sensorId, uint256 _since) public view recordsStored returns (uint256) {
+        uint256[] storage indices = sensorAnomalyIndices[_sensorId];
+        uint256 low = 0;
+        uint256 high = indices.length;
+        while (low < high) {
+            uint256 mid = (low + high) / 2;
+            if (anomalies[indices[mid]].timestamp < _since) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low;
+    }
+
+    function _pageEnd(uint256 _total, uint256 _offset, uint256 _limit) internal pure returns (uint256) {
+        if (_offset >= _total) {
+            return _offset;
+        }
+        return _limit > _total - _offset ? _total : _offset + _limit;
+    }
+}
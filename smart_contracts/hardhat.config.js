@@ -10,6 +10,11 @@ module.exports = {
 
   // Define the networks Hardhat can interact with.
   networks: {
+    // The in-process network used by `npx hardhat test`. The raised block gas limit leaves room
+    // for the 100-anomaly logAnomalies batches measured in test/AnomalyLogger.js.
+    hardhat: {
+      blockGasLimit: 60000000
+    },
     // This configures a network named 'ganache'
     ganache: {
       url: "http://127.0.0.1:8545", // The default RPC URL where Ganache typically runs.
@@ -30,6 +35,14 @@ module.exports = {
     // }
   },
 
+  // `npm run gas-report` runs the tests with hardhat-gas-reporter (part of hardhat-toolbox), which prints
+  // min / max / average gas per contract method. test/CompactAnomalyLogger.js also prints gas per anomaly
+  // for AnomalyLogger against CompactAnomalyLogger in both of its modes.
+  gasReporter: {
+    enabled: process.env.REPORT_GAS !== undefined,
+    currency: "USD"
+  },
+
   // Optional: Configure paths for your project if they differ from the default Hardhat structure.
   // This usually isn't necessary for basic projects.
   paths: {
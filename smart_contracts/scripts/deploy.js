@@ -1,18 +1,34 @@
 // smart_contract/scripts/deploy.js
+// CONTRACT_LAYOUT=compact deploys CompactAnomalyLogger instead of AnomalyLogger; add STORE_RECORDS=false
+// for its event-only mode. CONTRACT_LAYOUT=commitments deploys AnomalyCommitments, with the deploying
+// account as the only committer. Point the backend at it with the same CONTRACT_LAYOUT and CONTRACT_ADDRESS.
 const hre = require("hardhat");
 
+const CONTRACT_NAMES = {
+  legacy: "AnomalyLogger",
+  compact: "CompactAnomalyLogger",
+  commitments: "AnomalyCommitments",
+};
+
 async function main() {
-  const AnomalyLogger = await hre.ethers.getContractFactory("AnomalyLogger");
-  const anomalyLogger = await AnomalyLogger.deploy();
+  const layout = process.env.CONTRACT_LAYOUT || "legacy";
+  const contractName = CONTRACT_NAMES[layout];
+  if (!contractName) {
+    throw new Error(`Unknown CONTRACT_LAYOUT '${layout}'. Expected one of ${Object.keys(CONTRACT_NAMES)}`);
+  }
+  const factory = await hre.ethers.getContractFactory(contractName);
+  const anomalyLogger = layout === "compact"
+    ? await factory.deploy(process.env.STORE_RECORDS !== "false")
+    : await factory.deploy();
 
   await anomalyLogger.waitForDeployment();
 
   console.log(
-    `AnomalyLogger deployed to ${anomalyLogger.target}`
+    `${contractName} deployed to ${anomalyLogger.target}`
   );
 }
 
 main().catch((error) => {
   console.error(error);
   process.exitCode = 1;
-});
\ No newline at end of file
+});
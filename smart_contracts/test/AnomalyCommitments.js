@@ -0,0 +1,191 @@
+const { loadFixture } = require("@nomicfoundation/hardhat-toolbox/network-helpers");
+const { expect } = require("chai");
+
+// Same canonical encoding and tree as backend/anomaly_commitments.py
+const VALUE_SCALE = 100;
+const SCORE_SCALE = 1000000;
+const ENVIRONMENTAL_TIME_SERIES = 1;
+const CANONICAL_RECORD_TYPES = ["uint64", "uint40", "bytes32", "uint8", "int32", "int32", "string"];
+// Root of sampleRecords(5) as computed by the backend's merkle_root()
+const BACKEND_ROOT_OF_FIVE = "0x191f25051cd9675f7aa491e2c17382460975fe0c210d9b2a0dd7c2a4378f1a26";
+
+function sampleRecord(i) {
+  const temperature = 80.5 + i;
+  return {
+    sequence: i,
+    timestamp: 1700000000 + i,
+    sensorId: `temp_sensor_${String(i).padStart(2, "0")}`,
+    temperature,
+    score: -0.123456,
+    explanation: `Detected via Isolation Forest (Score: -0.12). Current: Temp=${temperature}`,
+  };
+}
+
+function sampleRecords(count) {
+  return Array.from({ length: count }, (_, i) => sampleRecord(i));
+}
+
+function canonicalEncoding(r) {
+  return ethers.AbiCoder.defaultAbiCoder().encode(CANONICAL_RECORD_TYPES, [
+    r.sequence,
+    r.timestamp,
+    ethers.encodeBytes32String(r.sensorId),
+    ENVIRONMENTAL_TIME_SERIES,
+    Math.round(r.temperature * VALUE_SCALE),
+    Math.round(r.score * SCORE_SCALE),
+    r.explanation,
+  ]);
+}
+
+function leafHash(encoding) {
+  return ethers.keccak256(ethers.concat(["0x00", encoding]));
+}
+
+function nodeHash(a, b) {
+  return ethers.keccak256(ethers.concat(["0x01", ...(a < b ? [a, b] : [b, a])]));
+}
+
+// Every level of the tree, leaves first; an odd node out is promoted unchanged
+function merkleLevels(leaves) {
+  const levels = [leaves];
+  while (levels[levels.length - 1].length > 1) {
+    const level = levels[levels.length - 1];
+    const parents = [];
+    for (let i = 0; i + 1 < level.length; i += 2) {
+      parents.push(nodeHash(level[i], level[i + 1]));
+    }
+    if (level.length % 2) {
+      parents.push(level[level.length - 1]);
+    }
+    levels.push(parents);
+  }
+  return levels;
+}
+
+function merkleProof(levels, index) {
+  const proof = [];
+  for (const level of levels.slice(0, -1)) {
+    const sibling = index ^ 1;
+    if (sibling < level.length) {
+      proof.push(level[sibling]);
+    }
+    index = Math.floor(index / 2);
+  }
+  return proof;
+}
+
+function buildBatch(count) {
+  const encodings = sampleRecords(count).map(canonicalEncoding);
+  const levels = merkleLevels(encodings.map(leafHash));
+  return { encodings, levels, root: levels[levels.length - 1][0] };
+}
+
+describe("AnomalyCommitments", function () {
+  async function deployFixture() {
+    const [committer, otherAccount] = await ethers.getSigners();
+    const AnomalyCommitments = await ethers.getContractFactory("AnomalyCommitments");
+    const commitments = await AnomalyCommitments.deploy();
+    return { commitments, committer, otherAccount };
+  }
+
+  describe("commitBatch", function () {
+    it("Should store the batch under its root and emit BatchCommitted", async function () {
+      const { commitments } = await loadFixture(deployFixture);
+      const { root } = buildBatch(5);
+
+      await expect(commitments.commitBatch(root, 5, 1700000000, 1700000004))
+        .to.emit(commitments, "BatchCommitted")
+        .withArgs(0, root, 5, 1700000000, 1700000004);
+      expect(await commitments.commitmentCount()).to.equal(1);
+      expect(await commitments.isCommitted(root)).to.equal(true);
+      const stored = await commitments.commitments(root);
+      expect(stored.count).to.equal(5);
+      expect(stored.blockNumber).to.equal(await ethers.provider.getBlockNumber());
+    });
+
+    it("Should only accept batches from the committer", async function () {
+      const { commitments, otherAccount } = await loadFixture(deployFixture);
+      const { root } = buildBatch(3);
+
+      await expect(commitments.connect(otherAccount).commitBatch(root, 3, 0, 0)).to.be.revertedWith(
+        "Only the committer can commit batches"
+      );
+    });
+
+    it("Should reject empty batches and roots committed before", async function () {
+      const { commitments } = await loadFixture(deployFixture);
+      const { root } = buildBatch(3);
+
+      await expect(commitments.commitBatch(root, 0, 0, 0)).to.be.revertedWith("Empty batch");
+      await commitments.commitBatch(root, 3, 0, 0);
+      await expect(commitments.commitBatch(root, 3, 0, 0)).to.be.revertedWith("Root already committed");
+    });
+  });
+
+  describe("verifyInclusion", function () {
+    it("Should build the same tree as the backend", async function () {
+      expect(buildBatch(5).root).to.equal(BACKEND_ROOT_OF_FIVE);
+    });
+
+    it("Should accept the proof of every record of a committed batch", async function () {
+      const { commitments } = await loadFixture(deployFixture);
+      for (const count of [1, 2, 5, 8, 13]) {
+        const { encodings, levels, root } = buildBatch(count);
+        await commitments.commitBatch(root, count, 0, 0);
+        for (const [i, encoding] of encodings.entries()) {
+          expect(await commitments.verifyInclusion(root, encoding, merkleProof(levels, i))).to.equal(true);
+        }
+      }
+    });
+
+    it("Should reject altered records, wrong proofs and roots never committed", async function () {
+      const { commitments } = await loadFixture(deployFixture);
+      const { encodings, levels, root } = buildBatch(5);
+      await commitments.commitBatch(root, 5, 0, 0);
+
+      const altered = canonicalEncoding({ ...sampleRecord(2), temperature: 20.5 });
+      expect(await commitments.verifyInclusion(root, altered, merkleProof(levels, 2))).to.equal(false);
+      expect(await commitments.verifyInclusion(root, encodings[2], merkleProof(levels, 3))).to.equal(false);
+      // An internal node is not a leaf: the 0x00 / 0x01 prefixes keep it from verifying as a record
+      expect(await commitments.verifyInclusion(root, ethers.concat(levels[1].slice(0, 2)), levels[2].slice(1)))
+        .to.equal(false);
+
+      const uncommitted = buildBatch(4);
+      expect(
+        await commitments.verifyInclusion(uncommitted.root, uncommitted.encodings[0], merkleProof(uncommitted.levels, 0))
+      ).to.equal(false);
+    });
+  });
+
+  describe("Gas report: per-anomaly logging vs one commitment per batch", function () {
+    it("Should cost less per anomaly than CompactAnomalyLogger in event-only mode", async function () {
+      const { commitments } = await loadFixture(deployFixture);
+      const CompactAnomalyLogger = await ethers.getContractFactory("CompactAnomalyLogger");
+      const compactLogger = await CompactAnomalyLogger.deploy(false);
+
+      const rows = [];
+      for (const batchSize of [10, 100]) {
+        const records = sampleRecords(batchSize);
+        const inputs = records.map((r) => ({
+          timestamp: r.timestamp,
+          sensorId: ethers.encodeBytes32String(r.sensorId),
+          anomalyType: ENVIRONMENTAL_TIME_SERIES,
+          dataValue: Math.round(r.temperature * VALUE_SCALE),
+          score: Math.round(r.score * SCORE_SCALE),
+          explanation: r.explanation,
+        }));
+        const logged = await (await compactLogger.logAnomalies(inputs)).wait();
+        const committed = await (await commitments.commitBatch(buildBatch(batchSize).root, batchSize, 0, 0)).wait();
+        rows.push({
+          batchSize,
+          compactEventOnlyPerAnomaly: Number(logged.gasUsed) / batchSize,
+          commitmentPerAnomaly: Number(committed.gasUsed) / batchSize,
+        });
+        expect(committed.gasUsed).to.be.lessThan(logged.gasUsed);
+      }
+
+      console.log("\n      Gas per anomaly, CompactAnomalyLogger (event-only) vs AnomalyCommitments:");
+      console.table(rows);
+    });
+  });
+});
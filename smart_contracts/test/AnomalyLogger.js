@@ -0,0 +1,142 @@
+const { loadFixture } = require("@nomicfoundation/hardhat-toolbox/network-helpers");
+const { expect } = require("chai");
+
+describe("AnomalyLogger", function () {
+  async function deployAnomalyLoggerFixture() {
+    const AnomalyLogger = await ethers.getContractFactory("AnomalyLogger");
+    const anomalyLogger = await AnomalyLogger.deploy();
+    return { anomalyLogger };
+  }
+
+  // Mirrors the record the backend builds for an Isolation Forest detection
+  function sampleAnomaly(i) {
+    return {
+      timestamp: 1700000000 + i,
+      sensorId: `temp_sensor_${String(i % 100).padStart(2, "0")}`,
+      dataValue: 80 + (i % 20),
+      anomalyType: "Environmental Anomaly (Time Series)",
+      explanation:
+        "Detected via Isolation Forest (Score: -0.12). " +
+        `Current: Temp=${80 + (i % 20)}.5, Humidity=61.2, Pressure=1010.4. ` +
+        "Contextual change based on recent readings.",
+    };
+  }
+
+  function toBatchArgs(anomalies) {
+    return [
+      anomalies.map((a) => a.timestamp),
+      anomalies.map((a) => a.sensorId),
+      anomalies.map((a) => a.dataValue),
+      anomalies.map((a) => a.anomalyType),
+      anomalies.map((a) => a.explanation),
+    ];
+  }
+
+  describe("logAnomalies", function () {
+    it("Should store every entry and emit one event per entry", async function () {
+      const { anomalyLogger } = await loadFixture(deployAnomalyLoggerFixture);
+      const anomalies = [0, 1, 2].map(sampleAnomaly);
+
+      const tx = anomalyLogger.logAnomalies(...toBatchArgs(anomalies));
+      for (const [i, a] of anomalies.entries()) {
+        await expect(tx)
+          .to.emit(anomalyLogger, "AnomalyDetected")
+          .withArgs(i, a.timestamp, ethers.id(a.sensorId), a.sensorId, a.dataValue, a.anomalyType, a.explanation);
+      }
+
+      const stored = await anomalyLogger.getAllAnomalies();
+      expect(stored.length).to.equal(3);
+      expect(stored[2].sensorId).to.equal(anomalies[2].sensorId);
+      expect(stored[2].explanation).to.equal(anomalies[2].explanation);
+    });
+
+    it("Should revert if the array lengths differ", async function () {
+      const { anomalyLogger } = await loadFixture(deployAnomalyLoggerFixture);
+      const [timestamps, sensorIds, dataValues, anomalyTypes, explanations] = toBatchArgs(
+        [0, 1].map(sampleAnomaly)
+      );
+
+      await expect(
+        anomalyLogger.logAnomalies(timestamps, sensorIds.slice(1), dataValues, anomalyTypes, explanations)
+      ).to.be.revertedWith("Array lengths must match");
+    });
+  });
+
+  describe("Paged reads", function () {
+    async function deployWithAnomaliesFixture() {
+      const { anomalyLogger } = await deployAnomalyLoggerFixture();
+      // 25 anomalies spread over 5 sensors: sensor k holds positions k, k + 5, k + 10, ...
+      const anomalies = Array.from({ length: 25 }, (_, i) => ({
+        ...sampleAnomaly(i),
+        sensorId: `sensor_${i % 5}`,
+      }));
+      await anomalyLogger.logAnomalies(...toBatchArgs(anomalies));
+      return { anomalyLogger, anomalies };
+    }
+
+    it("Should return pages of the requested size", async function () {
+      const { anomalyLogger, anomalies } = await loadFixture(deployWithAnomaliesFixture);
+
+      expect(await anomalyLogger.anomalyCount()).to.equal(25);
+      const page = await anomalyLogger.getAnomalies(10, 5);
+      expect(page.map((a) => a.timestamp)).to.deep.equal(anomalies.slice(10, 15).map((a) => BigInt(a.timestamp)));
+      expect((await anomalyLogger.getAnomalies(20, 100)).length).to.equal(5);
+      expect((await anomalyLogger.getAnomalies(25, 10)).length).to.equal(0);
+      expect((await anomalyLogger.getAnomalies(0, ethers.MaxUint256)).length).to.equal(25);
+    });
+
+    it("Should page through a single sensor's anomalies", async function () {
+      const { anomalyLogger } = await loadFixture(deployWithAnomaliesFixture);
+
+      expect(await anomalyLogger.sensorAnomalyCount("sensor_3")).to.equal(5);
+      expect(await anomalyLogger.sensorAnomalyCount("unknown_sensor")).to.equal(0);
+      const page = await anomalyLogger.getSensorAnomalies("sensor_3", 1, 2);
+      expect(page.map((a) => a.sensorId)).to.deep.equal(["sensor_3", "sensor_3"]);
+      expect(page.map((a) => a.timestamp)).to.deep.equal([BigInt(1700000008), BigInt(1700000013)]);
+    });
+
+    it("Should find the first anomaly at or after a timestamp", async function () {
+      const { anomalyLogger } = await loadFixture(deployWithAnomaliesFixture);
+
+      expect(await anomalyLogger.firstAnomalySince(0)).to.equal(0);
+      expect(await anomalyLogger.firstAnomalySince(1700000007)).to.equal(7);
+      expect(await anomalyLogger.firstAnomalySince(1800000000)).to.equal(25);
+      expect(await anomalyLogger.firstSensorAnomalySince("sensor_3", 1700000009)).to.equal(2);
+    });
+  });
+
+  describe("Gas per anomaly", function () {
+    it("Should cost less per anomaly as the batch grows", async function () {
+      const { anomalyLogger } = await loadFixture(deployAnomalyLoggerFixture);
+
+      const single = sampleAnomaly(0);
+      const singleReceipt = await (
+        await anomalyLogger.logAnomaly(
+          single.timestamp, single.sensorId, single.dataValue, single.anomalyType, single.explanation
+        )
+      ).wait();
+      const rows = [{ call: "logAnomaly", batchSize: 1, gasUsed: singleReceipt.gasUsed, perAnomaly: singleReceipt.gasUsed }];
+
+      let logged = 1;
+      for (const batchSize of [1, 10, 100]) {
+        const anomalies = Array.from({ length: batchSize }, (_, i) => sampleAnomaly(logged + i));
+        logged += batchSize;
+        const receipt = await (await anomalyLogger.logAnomalies(...toBatchArgs(anomalies))).wait();
+        rows.push({
+          call: "logAnomalies",
+          batchSize,
+          gasUsed: receipt.gasUsed,
+          perAnomaly: receipt.gasUsed / BigInt(batchSize),
+        });
+      }
+
+      console.log("\n      Gas per anomaly (first write to each storage slot):");
+      console.table(rows.map((r) => ({ ...r, gasUsed: Number(r.gasUsed), perAnomaly: Number(r.perAnomaly) })));
+
+      const perAnomaly = Object.fromEntries(rows.slice(1).map((r) => [r.batchSize, r.perAnomaly]));
+      expect(perAnomaly[10]).to.be.lessThan(perAnomaly[1]);
+      expect(perAnomaly[100]).to.be.lessThan(perAnomaly[10]);
+      expect(perAnomaly[100]).to.be.lessThan(singleReceipt.gasUsed);
+    });
+  });
+});
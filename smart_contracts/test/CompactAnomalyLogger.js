@@ -0,0 +1,163 @@
+const { loadFixture } = require("@nomicfoundation/hardhat-toolbox/network-helpers");
+const { expect } = require("chai");
+
+// Same encodings as backend/anomaly_encoding.py
+const VALUE_SCALE = 100;
+const SCORE_SCALE = 1000000;
+const ENVIRONMENTAL_TIME_SERIES = 1;
+
+describe("CompactAnomalyLogger", function () {
+  async function deployStoredFixture() {
+    const CompactAnomalyLogger = await ethers.getContractFactory("CompactAnomalyLogger");
+    const anomalyLogger = await CompactAnomalyLogger.deploy(true);
+    return { anomalyLogger };
+  }
+
+  async function deployEventOnlyFixture() {
+    const CompactAnomalyLogger = await ethers.getContractFactory("CompactAnomalyLogger");
+    const anomalyLogger = await CompactAnomalyLogger.deploy(false);
+    return { anomalyLogger };
+  }
+
+  // The record the backend builds for an Isolation Forest detection, in both layouts
+  function sampleAnomaly(i) {
+    const temperature = 80.5 + (i % 20);
+    return {
+      timestamp: 1700000000 + i,
+      sensorId: `temp_sensor_${String(i % 100).padStart(2, "0")}`,
+      temperature,
+      score: -0.123456,
+      anomalyType: "Environmental Anomaly (Time Series)",
+      explanation:
+        "Detected via Isolation Forest (Score: -0.12). " +
+        `Current: Temp=${temperature}, Humidity=61.2, Pressure=1010.4. ` +
+        "Contextual change based on recent readings.",
+    };
+  }
+
+  function toCompactInput(a) {
+    return {
+      timestamp: a.timestamp,
+      sensorId: ethers.encodeBytes32String(a.sensorId),
+      anomalyType: ENVIRONMENTAL_TIME_SERIES,
+      dataValue: Math.round(a.temperature * VALUE_SCALE),
+      score: Math.round(a.score * SCORE_SCALE),
+      explanation: a.explanation,
+    };
+  }
+
+  function toLegacyBatchArgs(anomalies) {
+    return [
+      anomalies.map((a) => a.timestamp),
+      anomalies.map((a) => a.sensorId),
+      anomalies.map((a) => Math.round(a.temperature)),
+      anomalies.map((a) => a.anomalyType),
+      anomalies.map((a) => a.explanation),
+    ];
+  }
+
+  describe("logAnomalies", function () {
+    it("Should store compact records and emit the explanation only in the event", async function () {
+      const { anomalyLogger } = await loadFixture(deployStoredFixture);
+      const inputs = [0, 1, 2].map(sampleAnomaly).map(toCompactInput);
+
+      const tx = anomalyLogger.logAnomalies(inputs);
+      for (const [i, a] of inputs.entries()) {
+        await expect(tx)
+          .to.emit(anomalyLogger, "AnomalyDetected")
+          .withArgs(i, a.timestamp, a.sensorId, a.anomalyType, a.dataValue, a.score, a.explanation);
+      }
+
+      expect(await anomalyLogger.anomalyCount()).to.equal(3);
+      const [stored] = await anomalyLogger.getAnomalies(2, 1);
+      expect(stored.timestamp).to.equal(inputs[2].timestamp);
+      expect(stored.sensorId).to.equal(inputs[2].sensorId);
+      expect(stored.dataValue).to.equal(inputs[2].dataValue);
+      expect(stored.score).to.equal(inputs[2].score);
+      expect(stored.anomalyType).to.equal(ENVIRONMENTAL_TIME_SERIES);
+    });
+
+    it("Should continue numbering across logAnomaly and logAnomalies", async function () {
+      const { anomalyLogger } = await loadFixture(deployStoredFixture);
+      const [first, second, third] = [0, 1, 2].map(sampleAnomaly).map(toCompactInput);
+
+      await anomalyLogger.logAnomaly(first);
+      await expect(anomalyLogger.logAnomalies([second, third]))
+        .to.emit(anomalyLogger, "AnomalyDetected")
+        .withArgs(2, third.timestamp, third.sensorId, third.anomalyType, third.dataValue, third.score, third.explanation);
+      expect(await anomalyLogger.sensorAnomalyCount(first.sensorId)).to.equal(1);
+    });
+
+    it("Should revert on an unknown anomaly type", async function () {
+      const { anomalyLogger } = await loadFixture(deployStoredFixture);
+      const input = { ...toCompactInput(sampleAnomaly(0)), anomalyType: 7 };
+
+      await expect(anomalyLogger.logAnomaly(input)).to.be.reverted;
+    });
+  });
+
+  describe("Event-only mode", function () {
+    it("Should emit events and count anomalies without keeping records", async function () {
+      const { anomalyLogger } = await loadFixture(deployEventOnlyFixture);
+      const inputs = [0, 1].map(sampleAnomaly).map(toCompactInput);
+
+      await expect(anomalyLogger.logAnomalies(inputs))
+        .to.emit(anomalyLogger, "AnomalyDetected")
+        .withArgs(1, inputs[1].timestamp, inputs[1].sensorId, inputs[1].anomalyType, inputs[1].dataValue,
+          inputs[1].score, inputs[1].explanation);
+      expect(await anomalyLogger.storeRecords()).to.equal(false);
+      expect(await anomalyLogger.anomalyCount()).to.equal(2);
+      await expect(anomalyLogger.getAnomalies(0, 10)).to.be.revertedWith(
+        "Records are only kept in AnomalyDetected events"
+      );
+    });
+  });
+
+  describe("Gas report: legacy vs compact layout", function () {
+    it("Should cost less per anomaly than AnomalyLogger, and least in event-only mode", async function () {
+      const AnomalyLogger = await ethers.getContractFactory("AnomalyLogger");
+      const CompactAnomalyLogger = await ethers.getContractFactory("CompactAnomalyLogger");
+      const layouts = {
+        "legacy (AnomalyLogger)": {
+          contract: await AnomalyLogger.deploy(),
+          log: (c, anomalies) => c.logAnomalies(...toLegacyBatchArgs(anomalies)),
+        },
+        "compact, stored": {
+          contract: await CompactAnomalyLogger.deploy(true),
+          log: (c, anomalies) => c.logAnomalies(anomalies.map(toCompactInput)),
+        },
+        "compact, event-only": {
+          contract: await CompactAnomalyLogger.deploy(false),
+          log: (c, anomalies) => c.logAnomalies(anomalies.map(toCompactInput)),
+        },
+      };
+
+      const rows = [];
+      const perAnomaly = {};
+      for (const [layout, { contract, log }] of Object.entries(layouts)) {
+        perAnomaly[layout] = {};
+        let logged = 0;
+        for (const batchSize of [1, 10, 100]) {
+          const anomalies = Array.from({ length: batchSize }, (_, i) => sampleAnomaly(logged + i));
+          logged += batchSize;
+          const receipt = await (await log(contract, anomalies)).wait();
+          perAnomaly[layout][batchSize] = receipt.gasUsed / BigInt(batchSize);
+          rows.push({
+            layout,
+            batchSize,
+            gasUsed: Number(receipt.gasUsed),
+            perAnomaly: Number(perAnomaly[layout][batchSize]),
+          });
+        }
+      }
+
+      console.log("\n      Gas per anomaly by record layout (logAnomalies):");
+      console.table(rows);
+
+      for (const batchSize of [1, 10, 100]) {
+        expect(perAnomaly["compact, stored"][batchSize]).to.be.lessThan(perAnomaly["legacy (AnomalyLogger)"][batchSize]);
+        expect(perAnomaly["compact, event-only"][batchSize]).to.be.lessThan(perAnomaly["compact, stored"][batchSize]);
+      }
+    });
+  });
+});